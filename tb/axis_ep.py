@@ -23,98 +23,377 @@ THE SOFTWARE.
 """
 
 from myhdl import *
+import binascii
+import zlib
+from collections import deque
+from simfifo import FifoWaiter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+lane_mask_cache = {}
+
+def get_lane_masks(M, WL):
+    # returns lane mask and tkeep value for 0 to M valid lanes
+    key = (M, WL)
+    if key not in lane_mask_cache:
+        lane_mask_cache[key] = (2**WL-1, [2**j-1 for j in range(M+1)])
+    return lane_mask_cache[key]
+
+def readonly_view(data):
+    # memoryview that can not be written through, without copying
+    m = memoryview(data)
+    if m.readonly:
+        return m
+    if hasattr(m, 'toreadonly'):
+        return m.toreadonly()
+    if type(data) is memoryview:
+        return memoryview(data.tobytes())
+    return memoryview(buffer(data))
+
+keep_slice_cache = {}
+
+def select_lanes(beat, M, keep):
+    # contiguous tkeep patterns map to a slice, sparse ones to a lane list
+    table = keep_slice_cache.setdefault(M, {})
+    if keep not in table:
+        lanes = [j for j in range(M) if keep & (1 << j)]
+        if lanes and lanes[-1]-lanes[0]+1 == len(lanes):
+            table[keep] = slice(lanes[0], lanes[-1]+1)
+        else:
+            table[keep] = lanes
+    s = table[keep]
+    if type(s) is slice:
+        return beat[s]
+    return bytearray([beat[j] for j in s])
+
+def iter_lanes(data, M):
+    # yields (lanes, last) for each beat without copying the whole payload
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        mv = memoryview(data)
+        l = len(mv)
+        for k in range(0, l, M):
+            yield bytearray(mv[k:k+M]), k+M >= l
+        return
+    buf = []
+    for item in data:
+        if isinstance(item, (bytes, bytearray, memoryview)):
+            buf.extend(bytearray(item))
+        else:
+            buf.append(item)
+        while len(buf) > M:
+            yield buf[:M], False
+            del buf[:M]
+    if buf:
+        yield buf, True
+
+class AXIStreamSummary(object):
+    # frame and byte counts and the CRC32 of the whole stream, the lengths
+    # and CRC32s of the last history frames are kept as well, or of every
+    # frame if history is None
+    def __init__(self, history=0):
+        self.frame_count = 0
+        self.byte_count = 0
+        self.frame_lengths = deque(maxlen=history)
+        self.frame_crcs = deque(maxlen=history)
+        self.crc = 0
+        self._frame_len = 0
+        self._frame_crc = 0
+
+    def add_beat(self, data, length, last):
+        self._frame_len += length
+        self._frame_crc = zlib.crc32(data, self._frame_crc) & 0xffffffff
+        self.crc = zlib.crc32(data, self.crc) & 0xffffffff
+        if last:
+            self.frame_count += 1
+            self.byte_count += self._frame_len
+            self.frame_lengths.append(self._frame_len)
+            self.frame_crcs.append(self._frame_crc)
+            self._frame_len = 0
+            self._frame_crc = 0
+
+    def drop_frame(self):
+        self._frame_len = 0
+        self._frame_crc = 0
+
+    def __repr__(self):
+        return 'AXIStreamSummary(frame_count=%d, byte_count=%d, crc=0x%08x)' % (self.frame_count, self.byte_count, self.crc)
+
+class AXIStreamCapture(object):
+    # tdata, tkeep and tuser are stored as 64 bit words, least significant
+    # word first, so that buses of any width can be captured
+    def __init__(self, data_width=64, size=4096, keep_width=None, user_width=1):
+        if np is None:
+            raise Exception("AXIStreamCapture requires numpy")
+        if keep_width is None:
+            keep_width = max(data_width//8, 1)
+        self.data_width = data_width
+        self.keep_width = keep_width
+        self.user_width = user_width
+        self.words = max((data_width+63)//64, 1)
+        self.keep_words = max((keep_width+63)//64, 1)
+        self.user_words = max((user_width+63)//64, 1)
+        self.count = 0
+        self.frame_count = 0
+        self._alloc(size)
+
+    def _alloc(self, size):
+        self.cycle = np.zeros(size, dtype=np.int64)
+        self.tdata = np.zeros((size, self.words), dtype=np.uint64)
+        self.tkeep = np.zeros((size, self.keep_words), dtype=np.uint64)
+        self.tlast = np.zeros(size, dtype=np.bool_)
+        self.tuser = np.zeros((size, self.user_words), dtype=np.uint64)
+
+    def _grow(self):
+        old = (self.cycle, self.tdata, self.tkeep, self.tlast, self.tuser)
+        self._alloc(2*len(self.cycle))
+        for a, b in zip((self.cycle, self.tdata, self.tkeep, self.tlast, self.tuser), old):
+            a[:len(b)] = b
+
+    def append(self, cycle, tdata, tkeep, tlast, tuser):
+        i = self.count
+        if i >= len(self.cycle):
+            self._grow()
+        self.cycle[i] = cycle
+        for col, v in ((self.tdata, tdata), (self.tkeep, tkeep), (self.tuser, tuser)):
+            if col.shape[1] == 1:
+                col[i, 0] = v
+            else:
+                for w in range(col.shape[1]):
+                    col[i, w] = (v >> (64*w)) & 0xffffffffffffffff
+        self.tlast[i] = tlast
+        self.count = i+1
+        if tlast:
+            self.frame_count += 1
+
+    def drain(self):
+        # returns columns and frame end indices for complete frames, a partial frame stays buffered
+        n = self.count
+        last = np.flatnonzero(self.tlast[:n])
+        n = last[-1]+1 if len(last) else 0
+        cols = {
+            'cycle': self.cycle[:n].copy(),
+            'tdata': self.tdata[:n].copy(),
+            'tkeep': self.tkeep[:n].copy(),
+            'tlast': self.tlast[:n].copy(),
+            'tuser': self.tuser[:n].copy(),
+            'frame_end': last+1
+        }
+        rem = self.count-n
+        for a in (self.cycle, self.tdata, self.tkeep, self.tlast, self.tuser):
+            a[:rem] = a[n:self.count]
+        self.count = rem
+        self.frame_count = 0
+        return cols
 
 class AXIStreamFrame(object):
+    __slots__ = ('N', 'M', 'WL', 'data', '_keep', '_user', '_beats', 'cycle')
+
     def __init__(self, data=b'', keep=None, user=None):
         self.N = 8
         self.M = 1
         self.WL = 8
         self.data = b''
-        self.keep = None
-        self.user = None
-
-        if type(data) is bytes or type(data) is bytearray:
+        self._keep = None
+        self._user = None
+        # beat count of a received frame, keep and user are only stored if they
+        # differ from the default pattern and are otherwise expanded on request
+        self._beats = None
+        # sink cycle count of the tlast beat of a received frame
+        self.cycle = None
+
+        if type(data) is bytes or type(data) is bytearray or type(data) is memoryview:
             self.data = bytearray(data)
         if type(data) is AXIStreamFrame:
             self.N = data.N
             self.WL = data.WL
             self.data = bytearray(data.data)
+            self.cycle = data.cycle
+            # keep and user of a received frame are expanded with its lane
+            # count as the copy does not take over M
             if data.keep is not None:
-                self.keep = list(data.keep)
+                self._keep = list(data.keep)
             if data.user is not None:
                 if type(data.user) is int or type(data.user) is bool:
-                    self.user = data.user
+                    self._user = data.user
                 else:
-                    self.user = list(data.user)
+                    self._user = list(data.user)
+
+    @property
+    def keep(self):
+        if self._keep is None and self._beats is not None:
+            mask, keep_table = get_lane_masks(self.M, self.WL)
+            l = len(self.data)
+            keep = [keep_table[self.M]]*((l+self.M-1)//self.M)
+            if l % self.M:
+                keep[-1] = keep_table[l % self.M]
+            return keep
+        return self._keep
+
+    @keep.setter
+    def keep(self, value):
+        self._keep = value
+
+    @property
+    def user(self):
+        if self._user is None and self._beats is not None:
+            return [0]*self._beats
+        return self._user
+
+    @user.setter
+    def user(self, value):
+        self._user = value
+
+    def view(self, offset=0):
+        # frame referencing the data of this frame from offset on without
+        # copying, the data is read-only so that frames sharing the buffer
+        # can not corrupt each other, assign data or copy the frame to modify
+        frame = AXIStreamFrame()
+        frame.N = self.N
+        frame.M = self.M
+        frame.WL = self.WL
+        frame.cycle = self.cycle
+        if type(self.data) is list:
+            frame.data = self.data[offset:]
+        else:
+            frame.data = readonly_view(self.data)[offset:]
+        return frame
 
     def build(self):
         if self.data is None:
             return
 
-        f = list(self.data)
-        tdata = []
-        tkeep = []
-        tuser = []
-        i = 0
+        M = self.M
+        WL = self.WL
+        mask, keep_table = get_lane_masks(M, WL)
+        l = len(self.data)
+        n = (l+M-1)//M
 
         assert_tuser = False
-        if (type(self.user) is int or type(self.user) is bool) and self.user:
+        if (type(self._user) is int or type(self._user) is bool) and self._user:
             assert_tuser = True
-            self.user = None
-
-        while len(f) > 0:
-            data = 0
-            keep = 0
-            for j in range(self.M):
-                data = data | (f.pop(0) << (j*self.WL))
-                keep = keep | (1 << j)
-                if len(f) == 0: break
-            tdata.append(data)
-            if self.keep is None:
-                tkeep.append(keep)
-            else:
-                tkeep.append(self.keep[i])
-            if self.user is None:
-                tuser.append(0)
-            else:
-                tuser.append(self.user[i])
-            i += 1
+            self._user = None
+
+        if WL == 8:
+            # reverse once so that each beat is a single little-endian hex slice
+            h = binascii.hexlify(bytes(bytearray(self.data)[::-1]))
+            tdata = [int(h[max(2*(l-k-M), 0):2*(l-k)], 16) for k in range(0, l, M)]
+        else:
+            f = self.data
+            if type(f) is memoryview:
+                f = bytearray(f)
+            tdata = []
+            for k in range(0, l, M):
+                data = 0
+                for j in range(min(M, l-k)):
+                    data = data | ((f[k+j] & mask) << (j*WL))
+                tdata.append(data)
+
+        if self._keep is None:
+            tkeep = [keep_table[M]]*n
+            if n > 0 and l % M:
+                tkeep[-1] = keep_table[l % M]
+        else:
+            tkeep = list(self._keep[:n])
+
+        if self._user is None:
+            tuser = [0]*n
+        else:
+            tuser = list(self._user[:n])
 
         if assert_tuser:
             tuser[-1] = 1
-            self.user = 1
+            self._user = 1
 
         return tdata, tkeep, tuser
 
+    def iter_beats(self):
+        if self.data is None:
+            return
+
+        M = self.M
+        WL = self.WL
+        mask, keep_table = get_lane_masks(M, WL)
+
+        assert_tuser = (type(self._user) is int or type(self._user) is bool) and self._user
+        user = None
+        if not (type(self._user) is int or type(self._user) is bool):
+            user = self._user
+
+        i = 0
+        for lanes, last in iter_lanes(self.data, M):
+            if WL == 8:
+                data = int(binascii.hexlify(bytes(bytearray(lanes)[::-1])), 16)
+            else:
+                data = 0
+                for j in range(len(lanes)):
+                    data = data | ((lanes[j] & mask) << (j*WL))
+            if self._keep is None:
+                keep = keep_table[len(lanes)]
+            else:
+                keep = self._keep[i]
+            if user is None:
+                u = 1 if assert_tuser and last else 0
+            else:
+                u = user[i]
+            yield data, keep, u, last
+            i += 1
+
     def parse(self, tdata, tkeep, tuser):
         if tdata is None or tkeep is None or tuser is None:
             return
         if len(tdata) != len(tkeep) or len(tdata) != len(tuser):
             raise Exception("Invalid data")
 
-        self.data = []
-        self.keep = []
-        self.user = []
-        mask = 2**self.WL-1
-
-        for i in range(len(tdata)):
-            for j in range(self.M):
-                if tkeep[i] & (1 << j):
-                    self.data.append((tdata[i] >> (j*self.WL)) & mask)
-            self.keep.append(tkeep[i])
-            self.user.append(tuser[i])
+        M = self.M
 
         if self.WL == 8:
-            self.data = bytearray(self.data)
+            # convert all beats in one pass, then drop disabled lanes from partial beats
+            h = ''.join(['%0*x' % (2*M, d) for d in reversed(tdata)])
+            raw = bytearray(binascii.unhexlify(h))[::-1]
+            full = get_lane_masks(M, 8)[1][M]
+            self.data = bytearray()
+            last = 0
+            for i in range(len(tkeep)):
+                if tkeep[i] != full:
+                    self.data += raw[last*M:i*M]
+                    self.data += select_lanes(raw[i*M:(i+1)*M], M, tkeep[i])
+                    last = i+1
+            self.data += raw[last*M:]
+        else:
+            self.data = []
+            mask = 2**self.WL-1
+
+            for i in range(len(tdata)):
+                for j in range(M):
+                    if tkeep[i] & (1 << j):
+                        self.data.append((tdata[i] >> (j*self.WL)) & mask)
+
+        mask, keep_table = get_lane_masks(M, self.WL)
+        l = len(self.data)
+        self._keep = None
+        self._user = None
+        self._beats = len(tdata)
+        if len(tkeep) != (l+M-1)//M or (tkeep and tkeep[-1] != keep_table[l % M or M]) or tkeep.count(keep_table[M]) < len(tkeep)-1:
+            self._keep = list(tkeep)
+        if any(tuser):
+            self._user = list(tuser)
 
     def __eq__(self, other):
         if type(other) is AXIStreamFrame:
             return self.data == other.data
 
     def __repr__(self):
-        return 'AXIStreamFrame(data=%s, keep=%s, user=%s)' % (repr(self.data), repr(self.keep), repr(self.user))
+        data = self.data
+        if type(data) is memoryview:
+            data = bytearray(data)
+        return 'AXIStreamFrame(data=%s, keep=%s, user=%s)' % (repr(data), repr(self.keep), repr(self.user))
 
     def __iter__(self):
+        if type(self.data) is memoryview:
+            return iter(self.data.tolist())
         return self.data.__iter__()
 
 def AXIStreamSource(clk, rst,
@@ -126,7 +405,10 @@ def AXIStreamSource(clk, rst,
                     tuser=Signal(bool(False)),
                     fifo=None,
                     pause=0,
-                    name=None):
+                    name=None,
+                    prefetch=False,
+                    prefetch_count=None,
+                    streaming=False):
 
     tready_int = Signal(bool(False))
     tvalid_int = Signal(bool(False))
@@ -136,12 +418,14 @@ def AXIStreamSource(clk, rst,
         tready_int.next = tready and not pause
         tvalid.next = tvalid_int and not pause
 
+    waiter = FifoWaiter(fifo, clk, rst)
+
     @instance
     def logic():
         frame = AXIStreamFrame()
-        data = []
-        keep = []
-        user = []
+        beats = None
+        next_frame = None
+        next_beats = None
         N = len(tdata)
         M = 1
         b = False
@@ -151,8 +435,33 @@ def AXIStreamSource(clk, rst,
         if WL == 8:
             b = True
 
+        def list_beats(data, keep, user):
+            n = len(data)
+            for i in range(n):
+                yield data[i], keep[i], user[i], i == n-1
+
+        def build_frame(frame):
+            if streaming:
+                # reference the payload instead of copying it, beats are generated on demand
+                f = AXIStreamFrame()
+                if type(frame) is AXIStreamFrame:
+                    f.data = frame.data
+                    f._keep = frame._keep
+                    f._user = frame._user
+                else:
+                    f.data = frame
+                frame = f
+            else:
+                frame = AXIStreamFrame(frame)
+            frame.N = N
+            frame.M = M
+            frame.WL = WL
+            if streaming:
+                return frame, frame.iter_beats()
+            return frame, list_beats(*frame.build())
+
         while True:
-            yield clk.posedge, rst.posedge
+            yield waiter.next_edge()
 
             if rst:
                 tdata.next = 0
@@ -160,32 +469,47 @@ def AXIStreamSource(clk, rst,
                 tvalid_int.next = False
                 tlast.next = False
             else:
+                valid_next = bool(tvalid_int)
                 if tready_int and tvalid:
-                    if len(data) > 0:
-                        tdata.next = data.pop(0)
-                        tkeep.next = keep.pop(0)
-                        tuser.next = user.pop(0)
+                    beat = None
+                    if beats is not None:
+                        beat = next(beats, None)
+                    if beat is not None:
+                        tdata.next, tkeep.next, tuser.next, last = beat
                         tvalid_int.next = True
-                        tlast.next = len(data) == 0
+                        valid_next = True
+                        tlast.next = last
+                        if last:
+                            beats = None
                     else:
                         tvalid_int.next = False
+                        valid_next = False
                         tlast.next = False
                 if (tlast and tready_int and tvalid) or not tvalid_int:
-                    if not fifo.empty():
-                        frame = fifo.get()
-                        frame = AXIStreamFrame(frame)
-                        frame.N = N
-                        frame.M = M
-                        frame.WL = WL
-                        frame.build()
+                    beat = None
+                    while beat is None and (next_frame is not None or not fifo.empty()):
+                        if next_frame is not None:
+                            frame, beats = next_frame, next_beats
+                            next_frame = None
+                            next_beats = None
+                        else:
+                            frame, beats = build_frame(fifo.get())
+                        beat = next(beats, None)
+                    if beat is not None:
                         if name is not None:
                             print("[%s] Sending frame %s" % (name, repr(frame)))
-                        data, keep, user = frame.build()
-                        tdata.next = data.pop(0)
-                        tkeep.next = keep.pop(0)
-                        tuser.next = user.pop(0)
+                        tdata.next, tkeep.next, tuser.next, last = beat
                         tvalid_int.next = True
-                        tlast.next = len(data) == 0
+                        valid_next = True
+                        tlast.next = last
+                        if last:
+                            beats = None
+                if prefetch and next_frame is None and not fifo.empty():
+                    # build the next frame while the current one is on the bus
+                    next_frame, next_beats = build_frame(fifo.get())
+                    if prefetch_count is not None:
+                        prefetch_count.next = prefetch_count + 1
+                waiter.set_idle(not valid_next and beats is None and next_frame is None and fifo.empty())
 
     return logic, pause_logic
 
@@ -199,7 +523,10 @@ def AXIStreamSink(clk, rst,
                   tuser=Signal(bool(False)),
                   fifo=None,
                   pause=0,
-                  name=None):
+                  name=None,
+                  callback=None,
+                  summary=None,
+                  capture=None):
 
     tready_int = Signal(bool(False))
     tvalid_int = Signal(bool(False))
@@ -209,19 +536,51 @@ def AXIStreamSink(clk, rst,
         tready.next = tready_int and not pause
         tvalid_int.next = tvalid and not pause
 
+    if hasattr(callback, 'send'):
+        # consumer coroutine
+        callback = callback.send
+
+    N = len(tdata)
+    M = len(tkeep)
+    WL = (len(tdata)+M-1)/M
+    mask, keep_table = get_lane_masks(M, WL)
+    lane_bytes = (WL+7)//8
+
+    if capture is not None and (capture.words*64 < N or capture.keep_words*64 < M or
+                                capture.user_words*64 < len(tuser)):
+        raise Exception("Capture is narrower than the bus")
+
+    def put_frame(frame):
+        if callback is not None:
+            callback(frame)
+        if fifo is not None:
+            fifo.put(frame)
+
+    def summary_beat(d, k, last):
+        if WL == 8:
+            beat = bytearray(binascii.unhexlify('%0*x' % (2*M, d)))[::-1]
+            if k != keep_table[M]:
+                beat = select_lanes(beat, M, k)
+        else:
+            beat = bytearray()
+            for j in range(M):
+                if k & (1 << j):
+                    beat += bytearray(binascii.unhexlify('%0*x' % (2*lane_bytes, (d >> (j*WL)) & mask)))[::-1]
+        summary.add_beat(bytes(beat), len(beat)//lane_bytes, last)
+
+    def summary_reset():
+        summary.drop_frame()
+
+    def capture_beat(cycle, d, k, last, u):
+        capture.append(cycle, d, k, last, u)
+
     @instance
     def logic():
         frame = AXIStreamFrame()
         data = []
         keep = []
         user = []
-        N = len(tdata)
-        M = 1
-        b = False
-        M = len(tkeep)
-        WL = (len(tdata)+M-1)/M
-        if WL == 8:
-            b = True
+        cycle = 0
 
         while True:
             yield clk.posedge, rst.posedge
@@ -232,10 +591,21 @@ def AXIStreamSink(clk, rst,
                 data = []
                 keep = []
                 user = []
+                if summary is not None:
+                    summary_reset()
             else:
                 tready_int.next = True
+                cycle += 1
+
+                if tvalid_int and capture is not None:
+                    capture_beat(cycle, int(tdata), int(tkeep), bool(tlast), int(tuser))
 
-                if tvalid_int:
+                if tvalid_int and summary is not None:
+                    # only track length and CRC32, payload is discarded
+                    summary_beat(int(tdata), int(tkeep), bool(tlast))
+                    if tlast and name is not None:
+                        print("[%s] Got frame" % name)
+                elif tvalid_int and capture is None:
                     data.append(int(tdata))
                     keep.append(int(tkeep))
                     user.append(int(tuser))
@@ -244,8 +614,8 @@ def AXIStreamSink(clk, rst,
                         frame.M = M
                         frame.WL = WL
                         frame.parse(data, keep, user)
-                        if fifo is not None:
-                            fifo.put(frame)
+                        frame.cycle = cycle
+                        put_frame(frame)
                         if name is not None:
                             print("[%s] Got frame %s" % (name, repr(frame)))
                         frame = AXIStreamFrame()
@@ -24,10 +24,21 @@ THE SOFTWARE.
 
 from myhdl import *
 import axis_ep
-from Queue import Queue
+from simfifo import SimFifo, FifoWaiter
 import struct
 
+# destination MAC, source MAC (each as high 16 and low 32 bits), ethertype
+eth_hdr_struct = struct.Struct('>HLHLH')
+
+def pack_eth_header(buf, offset, eth_dest_mac, eth_src_mac, eth_type):
+    eth_hdr_struct.pack_into(buf, offset,
+        eth_dest_mac >> 32, eth_dest_mac & 0xffffffff,
+        eth_src_mac >> 32, eth_src_mac & 0xffffffff,
+        eth_type)
+
 class EthFrame(object):
+    __slots__ = ('_payload', 'eth_dest_mac', 'eth_src_mac', 'eth_type')
+
     def __init__(self, payload=b'', eth_dest_mac=0, eth_src_mac=0, eth_type=0):
         self._payload = axis_ep.AXIStreamFrame()
         self.eth_dest_mac = eth_dest_mac
@@ -58,21 +69,34 @@ class EthFrame(object):
         self._payload = axis_ep.AXIStreamFrame(value)
 
     def build_axis(self):
-        data = b''
-
-        data += struct.pack('>Q', self.eth_dest_mac)[2:]
-        data += struct.pack('>Q', self.eth_src_mac)[2:]
-        data += struct.pack('>H', self.eth_type)
-
-        data += self.payload.data
-
-        return axis_ep.AXIStreamFrame(data)
-
-    def parse_axis(self, data):
+        data = bytearray(14+len(self.payload.data))
+        self.pack_header(data, 0)
+        data[14:] = self.payload.data
+
+        frame = axis_ep.AXIStreamFrame()
+        frame.data = data
+        return frame
+
+    def pack_header(self, buf, offset=0):
+        pack_eth_header(buf, offset, self.eth_dest_mac, self.eth_src_mac, self.eth_type)
+
+    def unpack_header(self, buf, offset=0):
+        dh, dl, sh, sl, self.eth_type = eth_hdr_struct.unpack_from(buf, offset)
+        self.eth_dest_mac = dh << 32 | dl
+        self.eth_src_mac = sh << 32 | sl
+
+    def parse_axis(self, data, copy=True):
+        if not copy:
+            # payload is a read-only view of the received buffer
+            if type(data) is not axis_ep.AXIStreamFrame:
+                frame = axis_ep.AXIStreamFrame()
+                frame.data = data
+                data = frame
+            self.unpack_header(data.data)
+            self._payload = data.view(14)
+            return
         data = axis_ep.AXIStreamFrame(data).data
-        self.eth_dest_mac = struct.unpack('>Q', '\x00\x00'+data[0:6])[0]
-        self.eth_src_mac = struct.unpack('>Q', '\x00\x00'+data[6:12])[0]
-        self.eth_type = struct.unpack('>H', data[12:14])[0]
+        self.unpack_header(data)
         data = data[14:]
         self.payload = axis_ep.AXIStreamFrame(data)
 
@@ -106,7 +130,7 @@ def EthFrameSource(clk, rst,
     eth_hdr_valid_int = Signal(bool(False))
     eth_payload_pause = Signal(bool(False))
 
-    eth_payload_fifo = Queue()
+    eth_payload_fifo = SimFifo()
 
     eth_payload_source = axis_ep.AXIStreamSource(clk,
                                                 rst,
@@ -125,18 +149,22 @@ def EthFrameSource(clk, rst,
         eth_hdr_valid.next = eth_hdr_valid_int and not pause
         eth_payload_pause.next = pause # or eth_hdr_valid_int
 
+    waiter = FifoWaiter(fifo, clk, rst)
+
     @instance
     def logic():
         frame = dict()
 
         while True:
-            yield clk.posedge, rst.posedge
+            yield waiter.next_edge()
 
             if rst:
                 eth_hdr_valid_int.next = False
             else:
+                valid_next = bool(eth_hdr_valid_int)
                 if eth_hdr_ready_int:
                     eth_hdr_valid_int.next = False
+                    valid_next = False
                 if (eth_payload_tlast and eth_hdr_ready_int and eth_hdr_valid) or not eth_hdr_valid_int:
                     if not fifo.empty():
                         frame = fifo.get()
@@ -150,6 +178,9 @@ def EthFrameSource(clk, rst,
                             print("[%s] Sending frame %s" % (name, repr(frame)))
 
                         eth_hdr_valid_int.next = True
+                        valid_next = True
+
+                waiter.set_idle(not valid_next and fifo.empty())
 
     return logic, pause_logic, eth_payload_source
 
@@ -168,14 +199,16 @@ def EthFrameSink(clk, rst,
                  eth_payload_tuser=Signal(bool(False)),
                  fifo=None,
                  pause=0,
-                 name=None):
+                 name=None,
+                 callback=None,
+                 summary=None):
 
     eth_hdr_ready_int = Signal(bool(False))
     eth_hdr_valid_int = Signal(bool(False))
     eth_payload_pause = Signal(bool(False))
 
-    eth_payload_fifo = Queue()
-    eth_header_fifo = Queue()
+    eth_payload_fifo = SimFifo()
+    eth_header_fifo = SimFifo()
 
     eth_payload_sink = axis_ep.AXIStreamSink(clk,
                                             rst,
@@ -186,7 +219,18 @@ def EthFrameSink(clk, rst,
                                             tlast=eth_payload_tlast,
                                             tuser=eth_payload_tuser,
                                             fifo=eth_payload_fifo,
-                                            pause=eth_payload_pause)
+                                            pause=eth_payload_pause,
+                                            summary=summary)
+
+    if hasattr(callback, 'send'):
+        # consumer coroutine
+        callback = callback.send
+
+    def put_frame(frame):
+        if callback is not None:
+            callback(frame)
+        if fifo is not None:
+            fifo.put(frame)
 
     @always_comb
     def pause_logic():
@@ -207,7 +251,7 @@ def EthFrameSink(clk, rst,
             else:
                 eth_hdr_ready_int.next = True
 
-                if eth_hdr_ready_int and eth_hdr_valid_int:
+                if eth_hdr_ready_int and eth_hdr_valid_int and summary is None:
                     frame = EthFrame()
                     frame.eth_dest_mac = int(eth_dest_mac)
                     frame.eth_src_mac = int(eth_src_mac)
@@ -216,8 +260,8 @@ def EthFrameSink(clk, rst,
 
                 if not eth_payload_fifo.empty() and not eth_header_fifo.empty():
                     frame = eth_header_fifo.get()
-                    frame.payload = eth_payload_fifo.get()
-                    fifo.put(frame)
+                    frame._payload = eth_payload_fifo.get()
+                    put_frame(frame)
 
                     if name is not None:
                         print("[%s] Got frame %s" % (name, repr(frame)))
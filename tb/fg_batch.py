@@ -0,0 +1,131 @@
+"""
+
+Copyright (c) 2015 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def dest_dtype(dest_width=8):
+    return np.uint8 if dest_width <= 8 else np.uint16 if dest_width <= 16 else np.uint32
+
+def batch_column(rng, value, count, limit):
+    # constant, inclusive (min, max) range or sequence of values to pick from
+    if value is None:
+        value = (0, limit-1)
+    if type(value) is tuple:
+        return rng.randint(value[0], value[1]+1, size=count, dtype=np.int64)
+    if np.ndim(value) == 0:
+        return np.full(count, value, dtype=np.int64)
+    return rng.choice(np.asarray(value, dtype=np.int64), size=count)
+
+class DescriptorBatch(object):
+    # descriptors stored as a numpy structured array, subclasses set the
+    # descriptor class, its fields and a dtype(dest_width) function
+    __slots__ = ('array', 'dest_width')
+
+    descriptor = None
+    fields = ()
+    dtype = None
+    item_name = 'descriptors'
+
+    def __init__(self, count=0, dest_width=8, array=None):
+        if np is None:
+            raise Exception("%s requires numpy" % type(self).__name__)
+        self.dest_width = dest_width
+        if array is None:
+            array = np.zeros(count, dtype=self.dtype(dest_width))
+        self.array = array
+
+    @classmethod
+    def from_fields(cls, count=None, dest_width=8, **kwargs):
+        # fields are scalars or arrays, broadcast to count entries
+        cols = [np.asarray(kwargs.get(k, 0), dtype=np.int64) for k in cls.fields]
+        if count is None:
+            count = np.broadcast(*cols).shape[0] if any(c.ndim for c in cols) else 1
+        batch = cls(count, dest_width)
+        for k, c in zip(cls.fields, cols):
+            w = dest_width if k == 'dest' else batch.array.dtype[k].itemsize*8
+            if c.size and (c.min() < 0 or c.max() >> w):
+                raise Exception("Field %s out of range" % k)
+            batch.array[k] = c
+        return batch
+
+    @classmethod
+    def from_descriptors(cls, descs, dest_width=8):
+        descs = list(descs)
+        batch = cls(len(descs), dest_width)
+        for i, d in enumerate(descs):
+            d = cls.descriptor(d)
+            batch.array[i] = tuple(getattr(d, k) for k in cls.fields)
+        return batch
+
+    def fields_at(self, i):
+        return self.array[i].item()
+
+    def __len__(self):
+        return self.array.shape[0]
+
+    def __getitem__(self, i):
+        if type(i) is slice:
+            return type(self)(dest_width=self.dest_width, array=self.array[i])
+        return self.descriptor(*self.array[i].item())
+
+    def __iter__(self):
+        for i in range(self.array.shape[0]):
+            yield self.descriptor(*self.array[i].item())
+
+    def __repr__(self):
+        return '%s(%d %s)' % (type(self).__name__, self.array.shape[0], self.item_name)
+
+class BatchReader(object):
+    # reads descriptors for a source from a fifo holding descriptors and
+    # descriptor batches, batches are sent entry by entry by index
+    def __init__(self, fifo, batch_type):
+        self.fifo = fifo
+        self.batch_type = batch_type
+        self.batch = None
+        self.index = 0
+
+    def pending(self):
+        return self.batch is not None or not self.fifo.empty()
+
+    def next(self):
+        # field tuple of the next descriptor or None
+        batch = self.batch
+        while batch is None:
+            d = self.fifo.get()
+            if type(d) is not self.batch_type:
+                d = self.batch_type.descriptor(d)
+                return tuple(getattr(d, k) for k in self.batch_type.fields)
+            if d.array.shape[0]:
+                batch = d
+                self.batch = batch
+                self.index = 0
+            elif self.fifo.empty():
+                return None
+        i = self.index
+        self.index = i+1
+        if i+1 >= batch.array.shape[0]:
+            self.batch = None
+        return batch.array[i].item()
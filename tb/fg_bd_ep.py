@@ -23,10 +23,18 @@ THE SOFTWARE.
 """
 
 from myhdl import *
-from Queue import Queue
+from simfifo import SimFifo, FifoWaiter
+import fg_batch
 import struct
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 class BurstDescriptor(object):
+    __slots__ = ('dest', 'burst_len')
+
     def __init__(self,
                  dest=0,
                  burst_len=0):
@@ -50,6 +58,28 @@ class BurstDescriptor(object):
         return (('BurstDescriptor(dest=0x%02x, ' % self.dest) +
                 ('burst_len=%d)' % self.burst_len))
 
+def burst_dtype(dest_width=8):
+    # field widths match the fg_bd_fifo and fg_burst_gen ports
+    return np.dtype([('dest', fg_batch.dest_dtype(dest_width)),
+                     ('burst_len', np.uint32)])
+
+class BurstDescriptorBatch(fg_batch.DescriptorBatch):
+    __slots__ = ()
+
+    descriptor = BurstDescriptor
+    fields = ('dest', 'burst_len')
+    dtype = staticmethod(burst_dtype)
+    item_name = 'bursts'
+
+    @classmethod
+    def random(cls, count, dest=0, burst_len=None, dest_width=8, seed=None):
+        # each field is constrained to a constant, an inclusive (min, max)
+        # range or a set of values
+        rng = np.random.RandomState(seed)
+        return cls.from_fields(count, dest_width,
+                               dest=fg_batch.batch_column(rng, dest, count, 2**dest_width),
+                               burst_len=fg_batch.batch_column(rng, burst_len, count, 2**32))
+
 def BurstDescriptorSource(clk, rst,
                           valid=None,
                           ready=None,
@@ -67,29 +97,37 @@ def BurstDescriptorSource(clk, rst,
         ready_int.next = ready and not pause
         valid.next = valid_int and not pause
 
+    waiter = FifoWaiter(fifo, clk, rst)
+
+    reader = fg_batch.BatchReader(fifo, BurstDescriptorBatch)
+
     @instance
     def logic():
         bd = dict()
 
         while True:
-            yield clk.posedge, rst.posedge
+            yield waiter.next_edge()
 
             if rst:
                 valid_int.next = False
             else:
+                valid_next = bool(valid_int)
                 if ready_int:
                     valid_int.next = False
+                    valid_next = False
                 if (ready_int and valid) or not valid_int:
-                    if not fifo.empty():
-                        bd = fifo.get()
-                        bd = BurstDescriptor(bd)
-                        dest.next = bd.dest
-                        burst_len.next = bd.burst_len
+                    bd = reader.next() if reader.pending() else None
+                    if bd is not None:
+                        dest.next = bd[0]
+                        burst_len.next = bd[1]
 
                         if name is not None:
-                            print("[%s] Sending burst %s" % (name, repr(bd)))
+                            print("[%s] Sending burst %s" % (name, repr(BurstDescriptor(*bd))))
 
                         valid_int.next = True
+                        valid_next = True
+
+                waiter.set_idle(not valid_next and not reader.pending())
 
     return logic, pause_logic
 
@@ -101,7 +139,8 @@ def BurstDescriptorSink(clk, rst,
                         burst_len=Signal(intbv(0)[32:]),
                         fifo=None,
                         pause=0,
-                        name=None):
+                        name=None,
+                        recorder=None):
 
     ready_int = Signal(bool(False))
     valid_int = Signal(bool(False))
@@ -111,9 +150,16 @@ def BurstDescriptorSink(clk, rst,
         ready.next = ready_int and not pause
         valid_int.next = valid and not pause
 
+    def put_bd(bd, cycle):
+        if recorder is not None:
+            recorder.write(bd, cycle)
+        if fifo is not None:
+            fifo.put(bd)
+
     @instance
     def logic():
         bd = BurstDescriptor()
+        cycle = 0
 
         while True:
             yield clk.posedge, rst.posedge
@@ -122,12 +168,13 @@ def BurstDescriptorSink(clk, rst,
                 ready_int.next = False
             else:
                 ready_int.next = True
+                cycle += 1
 
                 if ready_int and valid_int:
                     bd = BurstDescriptor()
                     bd.dest = int(dest)
                     bd.burst_len = int(burst_len)
-                    fifo.put(bd)
+                    put_bd(bd, cycle)
 
                     if name is not None:
                         print("[%s] Got burst %s" % (name, repr(bd)))
@@ -0,0 +1,457 @@
+"""
+
+Copyright (c) 2015 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+import fg_batch
+import fg_bd_ep
+import fg_fd_ep
+import heapq
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class FgBurstGenModel(object):
+    # cycle accurate model of rtl/fg_burst_gen.v
+    #
+    # step() evaluates one clock cycle from the input values seen during
+    # the cycle and then applies the register updates of the clock edge
+    def __init__(self, flow_addr_width=5, dest_width=8, rate_scale=8):
+        self.flow_addr_width = flow_addr_width
+        self.dest_width = dest_width
+        self.rate_scale = rate_scale
+        self.slots = 2**flow_addr_width
+        self.slot_mask = self.slots-1
+        self.dest_mask = 2**dest_width-1
+        # delay decrement per slot visit is rate_num times this
+        self.rate_step = rate_scale*self.slots
+
+        # slot memory, each entry is [active, dest, rate_num, rate_denom, len, burst_len, delay]
+        # entries are replaced, never modified in place
+        self.mem = [[0, 0, 0, 0, 0, 0, 0] for i in range(self.slots)]
+        # state of cur_flow_reg read in the previous cycle, not reset
+        self.cur = self.mem[0]
+        self.cycle = 0
+        self.reset()
+
+    def reset(self):
+        self.mem = [[0]+m[1:] for m in self.mem]
+        self.cur_flow = 0
+        self.input_fd_ready = False
+        self.busy = False
+        self.active_flows = 0
+        # active_flows wraps when every slot is in use, so count separately
+        self.flows = 0
+
+        self.output_bd_valid = False
+        self.output_bd_dest = 0
+        self.output_bd_burst_len = 0
+        self.temp_bd_valid = False
+        self.temp_bd_dest = 0
+        self.temp_bd_burst_len = 0
+        self.output_bd_ready_int = False
+
+        # bursts generated while the output register was not ready
+        self.dropped = 0
+
+    def step(self, input_fd_valid=False, fd=None, output_bd_ready=True):
+        # returns whether the flow descriptor was accepted on this edge
+        # and the (dest, burst_len) transferred on the output, if any
+        fd_taken = input_fd_valid and self.input_fd_ready
+        bd_out = None
+        if self.output_bd_valid and output_bd_ready:
+            bd_out = (self.output_bd_dest, self.output_bd_burst_len)
+
+        # flow scheduler
+        active, dest, rate_num, rate_denom, flen, burst_len, delay = self.cur
+        af = self.active_flows
+        upd = None
+        bd = None
+        load = False
+
+        if active:
+            step = (rate_num*self.rate_step) & 0xffffffff
+            if delay >= step:
+                # waiting - update counter
+                upd = [1, dest, rate_num, rate_denom, flen, burst_len, delay-step]
+            elif flen > burst_len:
+                # not last burst
+                bd = (dest, burst_len)
+                upd = [1, dest, rate_num, rate_denom, flen-burst_len, burst_len,
+                       (delay + burst_len*rate_denom - step) & 0xffffffff]
+            else:
+                # last burst
+                bd = (dest, flen)
+                upd = [0, dest, rate_num, rate_denom, 0, burst_len, 0]
+                af = (af-1) & self.slot_mask
+                self.flows -= 1
+        elif input_fd_valid and not self.input_fd_ready:
+            # read new flow descriptor into empty slot
+            fd = fg_fd_ep.FlowDescriptor(fd)
+            upd = [1, fd.dest & self.dest_mask, fd.rate_num & 0xffff, fd.rate_denom & 0xffff,
+                   fd.len & 0xffffffff, fd.burst_len & 0xffffffff, 0]
+            load = True
+            af = (af+1) & self.slot_mask
+            self.flows += 1
+
+        # output skid buffer
+        ready_early = (output_bd_ready or (not self.temp_bd_valid and not self.output_bd_valid) or
+                       (not self.temp_bd_valid and bd is None))
+
+        if self.output_bd_ready_int:
+            if output_bd_ready or not self.output_bd_valid:
+                self.output_bd_valid = bd is not None
+                self.output_bd_dest, self.output_bd_burst_len = bd or (0, 0)
+            else:
+                self.temp_bd_valid = bd is not None
+                self.temp_bd_dest, self.temp_bd_burst_len = bd or (0, 0)
+        else:
+            if bd is not None:
+                # the scheduler does not stall, the burst is lost
+                self.dropped += 1
+            if output_bd_ready:
+                self.output_bd_valid = self.temp_bd_valid
+                self.output_bd_dest = self.temp_bd_dest
+                self.output_bd_burst_len = self.temp_bd_burst_len
+                self.temp_bd_valid = False
+                self.temp_bd_dest = 0
+
+        self.output_bd_ready_int = ready_early
+
+        # flow state memory is read for the next slot before the write lands
+        self.cur = self.mem[(self.cur_flow+1) & self.slot_mask]
+        if upd is not None:
+            self.mem[self.cur_flow] = upd
+        self.cur_flow = (self.cur_flow+1) & self.slot_mask
+
+        self.input_fd_ready = load
+        self.busy = af != 0
+        self.active_flows = af
+        self.cycle += 1
+
+        return fd_taken, bd_out
+
+    def idle(self):
+        return not (self.flows or self.output_bd_valid or self.temp_bd_valid or self.input_fd_ready)
+
+    def run(self, fds, max_cycles=None, output_bd_ready=None):
+        # drives the model with a FlowDescriptorSource style source and a
+        # sink that is ready unless output_bd_ready(cycle) returns False,
+        # returns the (cycle, BurstDescriptor) pairs received by the sink
+        fds = iter(fds)
+        fd = next(fds, None)
+        out = []
+        stop = None if max_cycles is None else self.cycle + max_cycles
+
+        while stop is None or self.cycle < stop:
+            if fd is None and self.idle():
+                break
+            ready = True if output_bd_ready is None else output_bd_ready(self.cycle)
+            taken, bd = self.step(fd is not None, fd, ready)
+            if bd is not None:
+                out.append((self.cycle, fg_bd_ep.BurstDescriptor(*bd)))
+            if taken:
+                fd = next(fds, None)
+
+        return out
+
+
+class FlowTiming(object):
+    __slots__ = ('load', 'first', 'last', 'len', 'bursts')
+
+    def __init__(self, load=None):
+        self.load = load
+        self.first = None
+        self.last = None
+        self.len = 0
+        self.bursts = 0
+
+    def rate(self):
+        # bytes per cycle from loading the flow to its last burst
+        if self.last is None or self.last == self.load:
+            return 0.0
+        return float(self.len) / (self.last - self.load)
+
+    def __repr__(self):
+        return ('FlowTiming(load=%s, first=%s, last=%s, len=%d, bursts=%d)' %
+                (self.load, self.first, self.last, self.len, self.bursts))
+
+
+class FgBurstGenEventModel(object):
+    # event driven model of rtl/fg_burst_gen.v for a sink that is always
+    # ready; instead of stepping every cycle, the next burst of each slot
+    # is computed from its delay accumulator and the slot scan period
+    #
+    # burst cycles match FgBurstGenModel.run()
+    def __init__(self, flow_addr_width=5, dest_width=8, rate_scale=8):
+        if flow_addr_width < 1:
+            raise Exception("Invalid flow address width")
+        self.flow_addr_width = flow_addr_width
+        self.dest_width = dest_width
+        self.rate_scale = rate_scale
+        self.slots = 2**flow_addr_width
+        self.dest_mask = 2**dest_width-1
+        self.rate_step = rate_scale*self.slots
+
+        # flows with rate_num of 0 never send and hold their slot
+        self.stalled = []
+        self.timing = []
+
+    def iter_bursts(self, fds, max_cycles=None):
+        # yields (cycle, flow index, dest, burst_len) in order of arrival at the sink
+        slots = self.slots
+        # cycle from which each slot can take a new flow
+        avail = list(range(slots))
+        # (cycle of next burst, slot, flow index)
+        events = []
+        # per slot [dest, rate step, rate_denom, len, burst_len, delay]
+        state = [None]*slots
+        self.stalled = []
+        self.timing = []
+
+        fds = iter(fds)
+        fd = next(fds, None)
+        fd_time = 0
+        index = 0
+
+        # (cycle, slot) the pending descriptor is loaded, recomputed when a slot frees up
+        load = None
+        heappush = heapq.heappush
+        heappop = heapq.heappop
+        timings = self.timing
+
+        while True:
+            if fd is not None and load is None:
+                # earliest visit of an empty slot once the descriptor is valid
+                for s in range(slots):
+                    a = avail[s]
+                    if a is None:
+                        continue
+                    t = max(a, fd_time)
+                    t += (s - t) % slots
+                    if load is None or t < load[0]:
+                        load = (t, s)
+
+            if events and (load is None or events[0][0] < load[0]):
+                t, s, i = heappop(events)
+                if max_cycles is not None and t+2 > max_cycles:
+                    return
+                st = state[s]
+                dest, step, rate_denom, flen, burst_len, delay = st
+                timing = timings[i]
+                if flen > burst_len:
+                    # not last burst, wait until the accumulator drops below the step
+                    st[3] = flen - burst_len
+                    delay = (delay + burst_len*rate_denom - step) & 0xffffffff
+                    k = delay // step
+                    st[5] = delay - k*step
+                    heappush(events, (t + (k+1)*slots, s, i))
+                else:
+                    # last burst, slot is empty on its next visit
+                    burst_len = flen
+                    state[s] = None
+                    avail[s] = t + slots
+                    load = None
+                if timing.first is None:
+                    timing.first = t+2
+                timing.last = t+2
+                timing.len += burst_len
+                timing.bursts += 1
+                yield t+2, i, dest, burst_len
+            elif load is not None:
+                t, s = load
+                if max_cycles is not None and t > max_cycles:
+                    return
+                fd = fg_fd_ep.FlowDescriptor(fd)
+                step = ((fd.rate_num & 0xffff)*self.rate_step) & 0xffffffff
+                timings.append(FlowTiming(t))
+                avail[s] = None
+                load = None
+                if step == 0:
+                    # delay >= 0 always holds, the flow waits forever
+                    self.stalled.append(index)
+                else:
+                    state[s] = [fd.dest & self.dest_mask, step, fd.rate_denom & 0xffff,
+                                fd.len & 0xffffffff, fd.burst_len & 0xffffffff, 0]
+                    heappush(events, (t + slots, s, index))
+                index += 1
+                # ready is registered, the next descriptor is valid two cycles later
+                fd = next(fds, None)
+                fd_time = t+2
+            else:
+                return
+
+    def run(self, fds, max_cycles=None):
+        # returns the (cycle, BurstDescriptor) pairs received by the sink
+        return [(t, fg_bd_ep.BurstDescriptor(dest, burst_len))
+                for t, i, dest, burst_len in self.iter_bursts(fds, max_cycles)]
+
+    def flow_timing(self, fds, max_cycles=None):
+        # returns a FlowTiming per flow in descriptor order
+        for b in self.iter_bursts(fds, max_cycles):
+            pass
+        return self.timing
+
+
+class FgBurstGenBatchSim(object):
+    # vectorized model of many independent fg_burst_gen instances
+    #
+    # each row is one instance and each column one flow. The arguments broadcast
+    # to (instances, flows), and flow_addr_width and rate_scale to (instances,).
+    # Flows are queued at reset and loaded like the RTL loads them from an
+    # always valid source: flow j in cycle 2*j, or 2*j+1 once the even slots
+    # are taken. This assumes no flow finishes before all flows are loaded.
+    # Every step advances each flow by one burst, using the same delay
+    # accumulator arithmetic as FgBurstGenEventModel. Cycles are the cycles
+    # at which bursts arrive at the sink.
+    def __init__(self, rate_num, rate_denom, len, burst_len, flow_addr_width=5, rate_scale=8):
+        if np is None:
+            raise Exception("FgBurstGenBatchSim requires numpy")
+        rate_num, rate_denom, flen, burst_len = np.broadcast_arrays(
+            *[np.atleast_2d(np.asarray(a, dtype=np.int64)) for a in (rate_num, rate_denom, len, burst_len)])
+        self.rate_num = rate_num & 0xffff
+        self.rate_denom = rate_denom & 0xffff
+        self.len = flen & 0xffffffff
+        self.burst_len = burst_len & 0xffffffff
+        n, m = self.len.shape
+        self.flow_addr_width = np.broadcast_to(np.asarray(flow_addr_width, dtype=np.int64), (n,))
+        self.rate_scale = np.broadcast_to(np.asarray(rate_scale, dtype=np.int64), (n,))
+        self.slots = 1 << self.flow_addr_width
+        if (self.flow_addr_width < 1).any() or (self.slots < m).any():
+            raise Exception("More flows than slots")
+
+    @classmethod
+    def random(cls, instances, flows, rate_num=(1, 0xffff), rate_denom=(1, 0xffff), len=(1, 2**32-1),
+               burst_len=(1, 2**32-1), flow_addr_width=5, rate_scale=8, seed=None):
+        # per flow constraints as for FlowDescriptorBatch.random, flow_addr_width and
+        # rate_scale constraints are drawn per instance
+        rng = np.random.RandomState(seed)
+        n = instances*flows
+        col = lambda v, limit, k: fg_batch.batch_column(rng, v, k, limit)
+        return cls(col(rate_num, 2**16, n).reshape(instances, flows),
+                   np.maximum(col(rate_denom, 2**16, n), 1).reshape(instances, flows),
+                   col(len, 2**32, n).reshape(instances, flows),
+                   np.maximum(col(burst_len, 2**32, n), 1).reshape(instances, flows),
+                   col(flow_addr_width, 32, instances),
+                   col(rate_scale, 2**16, instances))
+
+    def run(self, max_bursts=None):
+        n, m = self.len.shape
+        slots = np.broadcast_to(self.slots[:, None], (n, m)).ravel()
+        step = ((self.rate_num * (self.rate_scale*self.slots)[:, None]) & 0xffffffff).ravel()
+
+        j = np.arange(m)[None, :]
+        load = np.broadcast_to(2*j + (2*j >= self.slots[:, None]), (n, m))
+        stalled = (step == 0).reshape(n, m)
+
+        bursts = np.zeros(n*m, dtype=np.int64)
+        first = np.full(n*m, -1, dtype=np.int64)
+        last = np.full(n*m, -1, dtype=np.int64)
+        spacing_min = np.full(n*m, -1, dtype=np.int64)
+        spacing_max = np.zeros(n*m, dtype=np.int64)
+        flen_out = self.len.ravel().copy()
+
+        # state of the flows still sending, compacted as flows finish
+        idx = np.flatnonzero(~stalled.ravel())
+        step = step[idx]
+        slots = slots[idx]
+        flen = flen_out[idx]
+        burst_len = self.burst_len.ravel()[idx]
+        rate_denom = self.rate_denom.ravel()[idx]
+        delay = np.zeros(idx.size, dtype=np.int64)
+        # the first visit after loading sends a burst as the delay starts at 0
+        t = load.ravel()[idx] + slots + 2
+        first[idx] = t
+        prev = np.full(idx.size, -1, dtype=np.int64)
+        gmin = np.full(idx.size, -1, dtype=np.int64)
+        gmax = np.zeros(idx.size, dtype=np.int64)
+        count = np.zeros(idx.size, dtype=np.int64)
+
+        k = 0
+        while idx.size and (max_bursts is None or k < max_bursts):
+            count += 1
+            more = flen > burst_len
+            d = (delay + burst_len*rate_denom - step) & 0xffffffff
+            w = d // step
+            delay = d - w*step
+            flen = np.where(more, flen - burst_len, 0)
+            prev = t
+            t = t + (w+1)*slots
+            gap = t - prev
+            gmin = np.where(more & ((gmin < 0) | (gap < gmin)), gap, gmin)
+            gmax = np.where(more & (gap > gmax), gap, gmax)
+            k += 1
+
+            stop = max_bursts is not None and k >= max_bursts
+            if stop or not more.all():
+                # write back finished flows, or every flow when stopping early
+                out = ~more | stop
+                o = idx[out]
+                bursts[o] = count[out]
+                last[o] = prev[out]
+                spacing_min[o] = gmin[out]
+                spacing_max[o] = gmax[out]
+                flen_out[o] = flen[out]
+                keep = ~out
+                idx = idx[keep]
+                step = step[keep]
+                slots = slots[keep]
+                flen = flen[keep]
+                burst_len = burst_len[keep]
+                rate_denom = rate_denom[keep]
+                delay = delay[keep]
+                t = t[keep]
+                gmin = gmin[keep]
+                gmax = gmax[keep]
+                count = count[keep]
+
+        bursts = bursts.reshape(n, m)
+        first = first.reshape(n, m)
+        last = last.reshape(n, m)
+        spacing_min = spacing_min.reshape(n, m)
+        spacing_max = spacing_max.reshape(n, m)
+        flen = flen_out.reshape(n, m)
+
+        done = ~stalled & (flen == 0)
+        span = np.where(done, last - load, 0)
+        rate = np.where(span > 0, self.len / np.maximum(span, 1).astype(np.float64), 0.0)
+        spacing_mean = np.where(bursts > 1, (last - first) / np.maximum(bursts-1, 1).astype(np.float64), 0.0)
+        completion = np.where(done, last, -1)
+        row_done = done.all(axis=1)
+        row_completion = np.where(row_done, completion.max(axis=1), -1)
+
+        return {
+            'load': load,
+            'first': first,
+            'completion': completion,
+            'bursts': bursts,
+            'stalled': stalled,
+            'rate': rate,
+            'nominal_rate': self.rate_num * self.rate_scale[:, None] / self.rate_denom.astype(np.float64),
+            'spacing_min': spacing_min,
+            'spacing_max': spacing_max,
+            'spacing_mean': spacing_mean,
+            'row_completion': row_completion,
+            'row_rate': np.where(row_completion > 0, self.len.sum(axis=1) / np.maximum(row_completion, 1).astype(np.float64), 0.0),
+        }
+
@@ -23,10 +23,18 @@ THE SOFTWARE.
 """
 
 from myhdl import *
-from Queue import Queue
+from simfifo import SimFifo, FifoWaiter
+import fg_batch
 import struct
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 class FlowDescriptor(object):
+    __slots__ = ('dest', 'rate_num', 'rate_denom', 'len', 'burst_len')
+
     def __init__(self,
                  dest=0,
                  rate_num=0,
@@ -68,6 +76,37 @@ class FlowDescriptor(object):
                 ('len=%d, ' % self.len) +
                 ('burst_len=%d)' % self.burst_len))
 
+def flow_dtype(dest_width=8):
+    # field widths match the fg_fd_fifo and fg_burst_gen ports
+    return np.dtype([('dest', fg_batch.dest_dtype(dest_width)),
+                     ('rate_num', np.uint16),
+                     ('rate_denom', np.uint16),
+                     ('len', np.uint32),
+                     ('burst_len', np.uint32)])
+
+class FlowDescriptorBatch(fg_batch.DescriptorBatch):
+    __slots__ = ()
+
+    descriptor = FlowDescriptor
+    fields = ('dest', 'rate_num', 'rate_denom', 'len', 'burst_len')
+    dtype = staticmethod(flow_dtype)
+    item_name = 'flows'
+
+    @classmethod
+    def random(cls, count, dest=0, rate_num=None, rate_denom=None, len=None, burst_len=None,
+               dest_width=8, seed=None):
+        # each field is constrained to a constant, an inclusive (min, max)
+        # range or a set of values; rate_denom is at least 1 and burst_len
+        # is between 1 and len so that every flow completes
+        rng = np.random.RandomState(seed)
+        cols = dict(dest=fg_batch.batch_column(rng, dest, count, 2**dest_width),
+                    rate_num=fg_batch.batch_column(rng, rate_num, count, 2**16),
+                    rate_denom=np.maximum(fg_batch.batch_column(rng, rate_denom, count, 2**16), 1),
+                    len=fg_batch.batch_column(rng, len, count, 2**32))
+        cols['burst_len'] = np.minimum(np.maximum(fg_batch.batch_column(rng, burst_len, count, 2**32), 1),
+                                       np.maximum(cols['len'], 1))
+        return cls.from_fields(count, dest_width, **cols)
+
 def FlowDescriptorSource(clk, rst,
                          valid=None,
                          ready=None,
@@ -88,32 +127,40 @@ def FlowDescriptorSource(clk, rst,
         ready_int.next = ready and not pause
         valid.next = valid_int and not pause
 
+    waiter = FifoWaiter(fifo, clk, rst)
+
+    reader = fg_batch.BatchReader(fifo, FlowDescriptorBatch)
+
     @instance
     def logic():
         fd = dict()
 
         while True:
-            yield clk.posedge, rst.posedge
+            yield waiter.next_edge()
 
             if rst:
                 valid_int.next = False
             else:
+                valid_next = bool(valid_int)
                 if ready_int:
                     valid_int.next = False
+                    valid_next = False
                 if (ready_int and valid) or not valid_int:
-                    if not fifo.empty():
-                        fd = fifo.get()
-                        fd = FlowDescriptor(fd)
-                        dest.next = fd.dest
-                        rate_num.next = fd.rate_num
-                        rate_denom.next = fd.rate_denom
-                        len.next = fd.len
-                        burst_len.next = fd.burst_len
+                    fd = reader.next() if reader.pending() else None
+                    if fd is not None:
+                        dest.next = fd[0]
+                        rate_num.next = fd[1]
+                        rate_denom.next = fd[2]
+                        len.next = fd[3]
+                        burst_len.next = fd[4]
 
                         if name is not None:
-                            print("[%s] Sending flow %s" % (name, repr(fd)))
+                            print("[%s] Sending flow %s" % (name, repr(FlowDescriptor(*fd))))
 
                         valid_int.next = True
+                        valid_next = True
+
+                waiter.set_idle(not valid_next and not reader.pending())
 
     return logic, pause_logic
 
@@ -128,7 +175,8 @@ def FlowDescriptorSink(clk, rst,
                        burst_len=Signal(intbv(0)[32:]),
                        fifo=None,
                        pause=0,
-                       name=None):
+                       name=None,
+                       recorder=None):
 
     ready_int = Signal(bool(False))
     valid_int = Signal(bool(False))
@@ -138,9 +186,16 @@ def FlowDescriptorSink(clk, rst,
         ready.next = ready_int and not pause
         valid_int.next = valid and not pause
 
+    def put_fd(fd, cycle):
+        if recorder is not None:
+            recorder.write(fd, cycle)
+        if fifo is not None:
+            fifo.put(fd)
+
     @instance
     def logic():
         fd = FlowDescriptor()
+        cycle = 0
 
         while True:
             yield clk.posedge, rst.posedge
@@ -149,6 +204,7 @@ def FlowDescriptorSink(clk, rst,
                 ready_int.next = False
             else:
                 ready_int.next = True
+                cycle += 1
 
                 if ready_int and valid_int:
                     fd = FlowDescriptor()
@@ -157,7 +213,7 @@ def FlowDescriptorSink(clk, rst,
                     fd.rate_denom = int(rate_denom)
                     fd.len = int(len)
                     fd.burst_len = int(burst_len)
-                    fifo.put(fd)
+                    put_fd(fd, cycle)
 
                     if name is not None:
                         print("[%s] Got flow %s" % (name, repr(fd)))
@@ -0,0 +1,349 @@
+"""
+
+Copyright (c) 2015 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+import fg_fd_ep
+import json
+import re
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+# fg_burst_gen rate arithmetic
+#
+# Each of the 2**FLOW_ADDR_WIDTH slots is visited once per scan period of
+# 2**FLOW_ADDR_WIDTH cycles. A visit subtracts step = rate_num*RATE_SCALE*2**FLOW_ADDR_WIDTH
+# from the 32 bit delay accumulator of the flow, or sends a burst once the
+# delay is below step, adding inc = burst_len*rate_denom. The long run rate
+# is therefore rate_num*RATE_SCALE/rate_denom bytes per cycle. A slot sends
+# at most one burst per visit, so the rate is only reachable while
+# inc >= step, otherwise the accumulator underflows and the flow stalls for
+# about 2**32/step visits. With delay starting at 0 the last of n bursts
+# leaves 2**FLOW_ADDR_WIDTH*(1+floor((n-1)*inc/step)) cycles after loading.
+
+FLAG_STALL = 1          # rate_num is 0, the flow never sends
+FLAG_UNDERFLOW = 2      # rate above burst_len per scan period, accumulator underflows
+FLAG_OVERFLOW = 4       # burst_len*rate_denom exceeds the 32 bit accumulator
+FLAG_STEP_OVERFLOW = 8  # rate_num*RATE_SCALE*2**FLOW_ADDR_WIDTH exceeds 32 bits
+FLAG_RANGE = 16         # field does not fit its port
+FLAG_NO_PROGRESS = 32   # burst_len is 0, the flow never finishes
+FLAG_RATE_CLAMPED = 64  # target rate outside the rate_num/rate_denom range
+
+flag_names = [
+    (FLAG_STALL, 'rate_num is 0, flow never sends'),
+    (FLAG_UNDERFLOW, 'rate exceeds burst_len per slot scan period, delay accumulator underflows'),
+    (FLAG_OVERFLOW, 'burst_len*rate_denom overflows the delay accumulator'),
+    (FLAG_STEP_OVERFLOW, 'rate_num*RATE_SCALE*2**FLOW_ADDR_WIDTH overflows 32 bits'),
+    (FLAG_RANGE, 'field out of range'),
+    (FLAG_NO_PROGRESS, 'burst_len is 0, flow never finishes'),
+    (FLAG_RATE_CLAMPED, 'target rate not representable, clamped'),
+]
+
+def flow_columns(fds):
+    # FlowDescriptorBatch, structured array or sequence of FlowDescriptor
+    if isinstance(fds, fg_fd_ep.FlowDescriptorBatch):
+        fds = fds.array
+    if isinstance(fds, np.ndarray):
+        return [fds[k].astype(np.int64) for k in fg_fd_ep.FlowDescriptorBatch.fields]
+    fds = [fg_fd_ep.FlowDescriptor(fd) for fd in fds]
+    return [np.array([getattr(fd, k) for fd in fds], dtype=np.int64) for k in fg_fd_ep.FlowDescriptorBatch.fields]
+
+def analyze_flows(fds, flow_addr_width=5, rate_scale=8, dest_width=8, link_rate=None):
+    # returns per flow arrays and a list of issues for a flow set, rates are
+    # in bytes per cycle, durations in cycles from loading to the last burst;
+    # link_rate is the byte rate the burst consumer sustains, if given the
+    # combined rate of the flows sharing the slot table is checked against it
+    if np is None:
+        raise Exception("analyze_flows requires numpy")
+    dest, rate_num, rate_denom, flen, burst_len = flow_columns(fds)
+    slots = 2**flow_addr_width
+
+    flags = np.zeros(dest.shape, dtype=np.int64)
+    flags |= np.where((dest >> dest_width) | (rate_num >> 16) | (rate_denom >> 16) |
+                      (flen >> 32) | (burst_len >> 32) |
+                      (np.minimum.reduce([dest, rate_num, rate_denom, flen, burst_len]) < 0), FLAG_RANGE, 0)
+
+    step_full = rate_num*rate_scale*slots
+    step = step_full & 0xffffffff
+    inc = burst_len*rate_denom
+    multi = flen > burst_len
+
+    flags |= np.where(step == 0, FLAG_STALL, 0)
+    flags |= np.where(step_full >> 32, FLAG_STEP_OVERFLOW, 0)
+    flags |= np.where(multi & (step > 0) & (inc < step), FLAG_UNDERFLOW, 0)
+    flags |= np.where(multi & (inc > 2**32), FLAG_OVERFLOW, 0)
+    flags |= np.where((burst_len == 0) & (flen > 0), FLAG_NO_PROGRESS, 0)
+
+    nominal_rate = rate_num*rate_scale / np.maximum(rate_denom, 1).astype(np.float64)
+    max_rate = burst_len / float(slots)
+
+    bursts = np.where(burst_len > 0, np.maximum((flen + np.maximum(burst_len, 1) - 1) // np.maximum(burst_len, 1), 1), 0)
+    safe_step = np.maximum(step, 1)
+    duration = slots*(1 + ((bursts-1)*inc) // safe_step)
+    # an underflowing flow waits about 2**32/step visits between bursts
+    duration = np.where(flags & FLAG_UNDERFLOW,
+                        slots*(1 + (bursts-1)*((2**32 + inc - step) // safe_step + 1)), duration)
+    expected_rate = np.where(flags & (FLAG_STALL | FLAG_NO_PROGRESS), 0.0,
+                             flen / np.maximum(duration, 1).astype(np.float64))
+    rate_error = np.where(nominal_rate > 0, expected_rate / np.where(nominal_rate > 0, nominal_rate, 1) - 1, 0.0)
+
+    # bursts leave on slot visits, spacing is a multiple of the scan period
+    spacing_min = slots*np.maximum(inc // safe_step, 1)
+    spacing_max = slots*np.maximum((inc + safe_step - 1) // safe_step, 1)
+    spacing_mean = slots*np.maximum(inc / safe_step.astype(np.float64), 1)
+
+    issues = []
+    for i in np.flatnonzero(flags):
+        for f, text in flag_names:
+            if flags[i] & f:
+                issues.append('flow %d: %s' % (i, text))
+
+    n = dest.shape[0]
+    if n >= slots:
+        issues.append('%d flows for %d slots: flows wait for free slots and active_flows wraps when all slots are in use' % (n, slots))
+
+    # flows loaded together share the slot table
+    concurrent_rate = float(np.sort(np.where(flags & (FLAG_STALL | FLAG_NO_PROGRESS), 0, expected_rate))[::-1][:slots].sum())
+    if link_rate is not None and concurrent_rate > link_rate:
+        issues.append('combined rate %.3f bytes per cycle exceeds link rate %.3f, the scheduler does not stall and bursts are dropped' % (concurrent_rate, link_rate))
+
+    return {
+        'flags': flags,
+        'nominal_rate': nominal_rate,
+        'max_rate': max_rate,
+        'expected_rate': expected_rate,
+        'rate_error': rate_error,
+        'bursts': bursts,
+        'duration': duration,
+        'spacing_min': spacing_min,
+        'spacing_max': spacing_max,
+        'spacing_mean': spacing_mean,
+        'concurrent_rate': concurrent_rate,
+        'issues': issues,
+        'feasible': not issues,
+    }
+
+def best_rational(x, max_num=0xffff, max_denom=0xffff):
+    # closest num/denom to each x with num <= max_num and 1 <= denom <= max_denom,
+    # continued fraction convergents, with the bounded semiconvergent checked
+    # against the last convergent once a bound is hit
+    if np is None:
+        raise Exception("best_rational requires numpy")
+    x = np.asarray(x, dtype=np.float64)
+    shape = x.shape
+    x = np.clip(x.ravel(), 0, max_num)
+    h0 = np.zeros(x.shape, dtype=np.int64)
+    h1 = np.ones(x.shape, dtype=np.int64)
+    k0 = np.ones(x.shape, dtype=np.int64)
+    k1 = np.zeros(x.shape, dtype=np.int64)
+    num = np.zeros(x.shape, dtype=np.int64)
+    denom = np.ones(x.shape, dtype=np.int64)
+    rem = x.copy()
+    active = np.ones(x.shape, dtype=bool)
+
+    while active.any():
+        i = np.flatnonzero(active)
+        a = np.floor(rem[i]).astype(np.int64)
+        h = a*h1[i] + h0[i]
+        k = a*k1[i] + k0[i]
+        over = (h > max_num) | (k > max_denom)
+
+        j = i[over]
+        if j.size:
+            # largest semiconvergent within both bounds, a bound whose
+            # convergent term is 0 does not limit the step
+            unbounded = np.iinfo(np.int64).max
+            m = np.minimum(np.where(h1[j] > 0, (max_num - h0[j]) // np.maximum(h1[j], 1), unbounded),
+                           np.where(k1[j] > 0, (max_denom - k0[j]) // np.maximum(k1[j], 1), unbounded))
+            sh = m*h1[j] + h0[j]
+            sk = m*k1[j] + k0[j]
+            err_s = np.abs(x[j] - sh / sk.astype(np.float64))
+            err_c = np.where(k1[j] > 0, np.abs(x[j] - h1[j] / np.maximum(k1[j], 1).astype(np.float64)), np.inf)
+            use_s = (err_s < err_c) & (m > 0)
+            num[j] = np.where(use_s, sh, h1[j])
+            denom[j] = np.where(use_s, sk, np.maximum(k1[j], 1))
+            active[j] = False
+
+        j = i[~over]
+        if j.size:
+            h = h[~over]
+            k = k[~over]
+            h0[j], h1[j] = h1[j], h
+            k0[j], k1[j] = k1[j], k
+            frac = rem[j] - a[~over]
+            done = frac*k < 1e-9
+            num[j[done]] = h[done]
+            denom[j[done]] = k[done]
+            active[j[done]] = False
+            j = j[~done]
+            rem[j] = 1/frac[~done]
+
+    return num.reshape(shape), denom.reshape(shape)
+
+rate_units = {'': 1, 'k': 1e3, 'm': 1e6, 'g': 1e9, 't': 1e12}
+rate_re = re.compile(r'^\s*([0-9.]+(?:e[+-]?[0-9]+)?)\s*([kmgt]?)(?:bps|b/s|bit/s)?\s*$', re.I)
+
+def parse_rate(rate):
+    # bits per second, as a number or a string such as '10G', '2.5 Gbps' or '100Mb/s'
+    if isinstance(rate, (int, long, float)):
+        return float(rate)
+    m = rate_re.match(rate)
+    if not m:
+        raise Exception("Invalid rate %r" % rate)
+    return float(m.group(1))*rate_units[m.group(2).lower()]
+
+def compile_flows(dest, rate, length=None, duration=None, burst_len=1024,
+                  clock=156.25e6, rate_scale=8, dest_width=8, max_len=0xffffffff,
+                  flow_addr_width=5):
+    # turns target rates in bits per second into a FlowDescriptorBatch; each
+    # flow sends length bytes, or rate*duration worth of bytes. Flows longer
+    # than max_len are split into pieces loaded side by side on the same
+    # dest, each with an even share of the length and rate. Returns the
+    # batch and per flow flags, FLAG_RATE_CLAMPED marks flows whose target
+    # rate is outside the range of the rate fields and was clamped, the
+    # other flags are those of analyze_flows for the compiled batch, such as
+    # FLAG_UNDERFLOW for a rate above burst_len per 2**flow_addr_width
+    # cycles or FLAG_STALL for a zero rate.
+    if np is None:
+        raise Exception("compile_flows requires numpy")
+    dest = np.asarray(dest, dtype=np.int64)
+    if np.asarray(rate).dtype.kind in 'fiu':
+        rate = np.asarray(rate, dtype=np.float64)
+    else:
+        rate = np.array([parse_rate(r) for r in np.ravel(rate)], dtype=np.float64).reshape(np.shape(rate))
+    if length is None:
+        if duration is None:
+            raise Exception("compile_flows requires length or duration")
+        length = np.rint(rate*np.asarray(duration, dtype=np.float64)/8)
+    dest, rate, length, burst_len = np.broadcast_arrays(dest, rate, np.asarray(length, dtype=np.int64),
+                                                        np.asarray(burst_len, dtype=np.int64))
+    dest, rate, length, burst_len = [np.ravel(c) for c in (dest, rate, length, burst_len)]
+
+    if (rate < 0).any() or (length < 0).any() or (burst_len < 1).any():
+        raise Exception("Rates and lengths must be positive and burst_len at least 1")
+
+    # whole bursts per piece where possible
+    chunk = np.maximum((max_len // np.minimum(burst_len, max_len)) * np.minimum(burst_len, max_len), 1)
+    pieces = np.maximum((length + chunk - 1) // chunk, 1)
+    index = np.repeat(np.arange(length.size), pieces)
+    part = np.arange(index.size) - np.repeat(np.cumsum(pieces) - pieces, pieces)
+    n = pieces[index]
+    piece_len = length[index] // n + (part < length[index] % n)
+
+    # rate_num*rate_scale/rate_denom bytes per cycle
+    target = rate[index] / 8 / clock / n / rate_scale
+    rate_num, rate_denom = best_rational(target, 0xffff, 0xffff)
+    # keep slow flows sending rather than rounding them to a stall
+    low = (rate_num == 0) & (target > 0)
+    rate_num[low] = 1
+    rate_denom[low] = 0xffff
+    flags = np.where(((target > 0) & (target < 1.0/0xffff)) | (target > 0xffff), FLAG_RATE_CLAMPED, 0)
+
+    batch = fg_fd_ep.FlowDescriptorBatch.from_fields(
+        dest_width=dest_width,
+        dest=dest[index],
+        rate_num=rate_num,
+        rate_denom=rate_denom,
+        len=piece_len,
+        burst_len=np.minimum(burst_len[index], np.maximum(piece_len, 1)))
+
+    flags |= analyze_flows(batch, flow_addr_width, rate_scale, dest_width)['flags']
+
+    return batch, flags
+
+def flow_rate(fds, clock=156.25e6, rate_scale=8):
+    # programmed rate in bits per second of each flow
+    dest, rate_num, rate_denom, flen, burst_len = flow_columns(fds)
+    return rate_num*rate_scale*8*clock / np.maximum(rate_denom, 1).astype(np.float64)
+
+def load_profile(f):
+    # JSON or YAML profile, from a file name or file object
+    if not hasattr(f, 'read'):
+        with open(f) as fp:
+            return load_profile(fp)
+    text = f.read()
+    try:
+        return json.loads(text)
+    except ValueError:
+        if yaml is None:
+            raise Exception("YAML profiles require PyYAML")
+        return yaml.safe_load(text)
+
+profile_fields = ('dest', 'rate', 'length', 'duration', 'burst_len', 'count')
+
+def compile_profile(profile, **kwargs):
+    # profile is a dict, file name or file object:
+    #
+    # clock: 156.25e6        # Hz
+    # rate_scale: 8
+    # dest_width: 8
+    # flow_addr_width: 5
+    # burst_len: 1024        # default for flows without one
+    # flows:
+    #   - {dest: 1, rate: 10G, length: 1000000}
+    #   - {dest: 2, rate: 2.5 Gbps, duration: 1e-3, burst_len: 256, count: 4}
+    #
+    # flows may also be given as a dict of equal length lists; count repeats
+    # an entry. Keyword arguments override the profile settings. Returns
+    # the batch and per flow flags as compile_flows.
+    if not isinstance(profile, dict):
+        profile = load_profile(profile)
+    settings = dict((k, profile[k]) for k in ('clock', 'rate_scale', 'dest_width', 'max_len', 'flow_addr_width') if k in profile)
+    settings.update(kwargs)
+    flows = profile['flows']
+    default_burst_len = profile.get('burst_len', 1024)
+
+    if isinstance(flows, dict):
+        count = len(flows['dest'])
+        cols = dict((k, flows[k]) for k in profile_fields if k in flows)
+    else:
+        count = len(flows)
+        cols = dict((k, [fl.get(k) for fl in flows]) for k in profile_fields if any(k in fl for fl in flows))
+
+    def column(k, default):
+        if k not in cols:
+            return np.full(count, default, dtype=np.float64)
+        return np.array([default if v is None else v for v in cols[k]], dtype=np.float64)
+
+    rate = np.array([parse_rate(r) for r in cols['rate']], dtype=np.float64)
+    length = column('length', -1)
+    duration = column('duration', np.nan)
+    missing = (length < 0) & np.isnan(duration)
+    if missing.any():
+        raise Exception("Flow %d has neither length nor duration" % np.flatnonzero(missing)[0])
+    length = np.where(length >= 0, length, np.rint(rate*np.nan_to_num(duration)/8)).astype(np.int64)
+    repeat = column('count', 1).astype(np.int64)
+
+    return compile_flows(
+        np.repeat(np.asarray(cols['dest'], dtype=np.int64), repeat),
+        np.repeat(rate, repeat),
+        length=np.repeat(length, repeat),
+        burst_len=np.repeat(column('burst_len', default_burst_len).astype(np.int64), repeat),
+        **settings)
+
@@ -0,0 +1,249 @@
+"""
+
+Copyright (c) 2015 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+import fg_fd_ep
+import fg_bd_ep
+import mmap
+import struct
+
+from Queue import Empty
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# magic, version, record kind, flags, reserved
+trace_hdr_struct = struct.Struct('<4sHHLL')
+TRACE_MAGIC = b'FGTR'
+TRACE_VERSION = 1
+
+TRACE_FLOW = 1
+TRACE_BURST = 2
+
+TRACE_FLAG_CYCLE = 1
+
+# dest, rate_num, rate_denom, len, burst_len
+flow_rec_struct = struct.Struct('<LHHLL')
+flow_rec_cycle_struct = struct.Struct('<QLHHLL')
+# dest, burst_len
+burst_rec_struct = struct.Struct('<LL')
+burst_rec_cycle_struct = struct.Struct('<QLL')
+
+def get_rec_struct(kind, cycles):
+    if kind == TRACE_FLOW:
+        return flow_rec_cycle_struct if cycles else flow_rec_struct
+    if kind == TRACE_BURST:
+        return burst_rec_cycle_struct if cycles else burst_rec_struct
+    raise Exception("Invalid trace kind")
+
+def get_rec_dtype(kind, cycles):
+    # numpy dtype of the record structs
+    fields = [('cycle', '<u8')] if cycles else []
+    if kind == TRACE_FLOW:
+        fields += [('dest', '<u4'), ('rate_num', '<u2'), ('rate_denom', '<u2'), ('len', '<u4'), ('burst_len', '<u4')]
+    elif kind == TRACE_BURST:
+        fields += [('dest', '<u4'), ('burst_len', '<u4')]
+    else:
+        raise Exception("Invalid trace kind")
+    return np.dtype(fields)
+
+class TraceWriter(object):
+    # writes flow or burst descriptors as fixed width records through a
+    # fixed size buffer, pass as recorder to FlowDescriptorSink or
+    # BurstDescriptorSink
+    def __init__(self, f, kind=TRACE_FLOW, cycles=True, buffer_size=1 << 20):
+        self.own_file = not hasattr(f, 'write')
+        if self.own_file:
+            f = open(f, 'wb')
+        self.file = f
+        self.kind = kind
+        self.cycles = cycles
+        self.rec_struct = get_rec_struct(kind, cycles)
+        self.buf = bytearray(buffer_size - buffer_size % self.rec_struct.size)
+        self.mv = memoryview(self.buf)
+        self.pos = 0
+        self.count = 0
+
+        self.file.write(trace_hdr_struct.pack(TRACE_MAGIC, TRACE_VERSION, kind,
+            TRACE_FLAG_CYCLE if cycles else 0, 0))
+
+    def write(self, desc, cycle=0):
+        if self.pos + self.rec_struct.size > len(self.buf):
+            self.flush()
+        if self.kind == TRACE_FLOW:
+            fields = (desc.dest, desc.rate_num, desc.rate_denom, desc.len, desc.burst_len)
+        else:
+            fields = (desc.dest, desc.burst_len)
+        if self.cycles:
+            self.rec_struct.pack_into(self.buf, self.pos, cycle or 0, *fields)
+        else:
+            self.rec_struct.pack_into(self.buf, self.pos, *fields)
+        self.pos += self.rec_struct.size
+        self.count += 1
+
+    def send(self, desc):
+        self.write(desc)
+
+    def flush(self):
+        if self.pos:
+            self.file.write(self.mv[:self.pos])
+            self.pos = 0
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        if self.own_file:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TraceReader(object):
+    # memory maps a descriptor trace, records are fixed width so any record
+    # range can be accessed directly
+    def __init__(self, f):
+        self.own_file = not hasattr(f, 'fileno')
+        if self.own_file:
+            f = open(f, 'rb')
+        self.file = f
+        self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.kind, flags, r = trace_hdr_struct.unpack_from(self.map, 0)
+        if magic != TRACE_MAGIC or version != TRACE_VERSION:
+            raise Exception("Not a descriptor trace")
+        self.cycles = bool(flags & TRACE_FLAG_CYCLE)
+        self.rec_struct = get_rec_struct(self.kind, self.cycles)
+        self.count = (len(self.map) - trace_hdr_struct.size) // self.rec_struct.size
+
+    def __len__(self):
+        return self.count
+
+    def record(self, i):
+        # returns capture cycle (None if not recorded) and descriptor
+        if i < 0:
+            i += self.count
+        if i < 0 or i >= self.count:
+            raise IndexError("trace index out of range")
+        fields = self.rec_struct.unpack_from(self.map, trace_hdr_struct.size + i*self.rec_struct.size)
+        cycle = None
+        if self.cycles:
+            cycle = fields[0]
+            fields = fields[1:]
+        if self.kind == TRACE_FLOW:
+            return cycle, fg_fd_ep.FlowDescriptor(*fields)
+        return cycle, fg_bd_ep.BurstDescriptor(*fields)
+
+    def __getitem__(self, i):
+        return self.record(i)[1]
+
+    def batch(self, start=0, stop=None, dest_width=8):
+        # returns capture cycles (None if not recorded) and a descriptor
+        # batch for a record range, copied from the map as arrays
+        if np is None:
+            raise Exception("TraceReader.batch requires numpy")
+        if stop is None or stop > self.count:
+            stop = self.count
+        n = max(stop - start, 0)
+        dtype = get_rec_dtype(self.kind, self.cycles)
+        if n:
+            recs = np.frombuffer(self.map, dtype=dtype, count=n,
+                                 offset=trace_hdr_struct.size + start*self.rec_struct.size)
+        else:
+            recs = np.zeros(0, dtype=dtype)
+        if self.kind == TRACE_FLOW:
+            batch_type = fg_fd_ep.FlowDescriptorBatch
+        else:
+            batch_type = fg_bd_ep.BurstDescriptorBatch
+        batch = batch_type.from_fields(n, dest_width, **dict((k, recs[k]) for k in batch_type.fields))
+        cycles = recs['cycle'].astype(np.int64) if self.cycles else None
+        return cycles, batch
+
+    def descriptors(self, start=0, stop=None):
+        if stop is None or stop > self.count:
+            stop = self.count
+        i = start
+        while i < stop:
+            yield self.record(i)[1]
+            i += 1
+
+    def __iter__(self):
+        return self.descriptors()
+
+    def replay(self, start=0, stop=None, batch_size=4096, dest_width=8):
+        return TraceReplay(self, start, stop, batch_size, dest_width)
+
+    def close(self):
+        self.map.close()
+        if self.own_file:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class TraceReplay(object):
+    # read only fifo over a record range of a trace, pass as fifo to
+    # FlowDescriptorSource or BurstDescriptorSource. Each item is a
+    # descriptor batch of up to batch_size records, which the source sends
+    # entry by entry, or a single descriptor without numpy
+    def __init__(self, reader, start=0, stop=None, batch_size=4096, dest_width=8):
+        if stop is None or stop > len(reader):
+            stop = len(reader)
+        self.reader = reader
+        self.ptr = start
+        self.stop = stop
+        self.batch_size = batch_size if np is not None else 1
+        self.dest_width = dest_width
+
+    def qsize(self):
+        return (max(self.stop - self.ptr, 0) + self.batch_size - 1) // self.batch_size
+
+    def empty(self):
+        return self.ptr >= self.stop
+
+    def get(self, block=True, timeout=None):
+        if self.ptr >= self.stop:
+            raise Empty
+        if np is None:
+            item = self.reader.record(self.ptr)[1]
+            self.ptr += 1
+            return item
+        stop = min(self.ptr + self.batch_size, self.stop)
+        item = self.reader.batch(self.ptr, stop, self.dest_width)[1]
+        self.ptr = stop
+        return item
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def __len__(self):
+        return self.qsize()
+
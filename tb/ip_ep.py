@@ -25,10 +25,57 @@ THE SOFTWARE.
 from myhdl import *
 import axis_ep
 import eth_ep
-from Queue import Queue
+from simfifo import SimFifo, FifoWaiter
+import numbers
 import struct
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# version/IHL, DSCP/ECN, length, identification, flags/fragment offset,
+# TTL, protocol, header checksum, source IP, destination IP
+ip_hdr_struct = struct.Struct('>BBHHHBBHLL')
+
+def checksum_update(cksum, old, new):
+    # RFC 1624 eqn. 3: HC' = ~(~HC + ~m + m')
+    cksum = (~cksum & 0xffff) + (~old & 0xffff) + new
+    cksum = (cksum & 0xffff) + (cksum >> 16)
+    cksum = (cksum & 0xffff) + (cksum >> 16)
+    return ~cksum & 0xffff
+
+def calc_checksum_array(headers):
+    # headers: buffer or uint8 array of packed 20 byte IP headers
+    if np is None:
+        raise Exception("calc_checksum_array requires numpy")
+    a = np.asarray(headers)
+    if a.dtype != np.uint8:
+        a = np.frombuffer(headers, dtype=np.uint8)
+    a = a.reshape(-1, 20)
+    w = a[:, 0::2].astype(np.uint32) << 8 | a[:, 1::2]
+    w[:, 5] = 0
+    cksum = w.sum(axis=1, dtype=np.uint32)
+    cksum = (cksum & 0xffff) + (cksum >> 16)
+    cksum = (cksum & 0xffff) + (cksum >> 16)
+    return (~cksum & 0xffff).astype(np.uint16)
+
+def check_checksum_array(headers):
+    if np is None:
+        raise Exception("check_checksum_array requires numpy")
+    a = np.asarray(headers)
+    if a.dtype != np.uint8:
+        a = np.frombuffer(headers, dtype=np.uint8)
+    a = a.reshape(-1, 20)
+    return calc_checksum_array(a) == (a[:, 10].astype(np.uint16) << 8 | a[:, 11])
+
 class IPFrame(object):
+    __slots__ = ('_payload', 'eth_dest_mac', 'eth_src_mac', 'eth_type',
+                 'ip_version', 'ip_ihl', 'ip_dscp', 'ip_ecn', 'ip_length',
+                 'ip_identification', 'ip_flags', 'ip_fragment_offset',
+                 'ip_ttl', 'ip_protocol', 'ip_header_checksum',
+                 'ip_source_ip', 'ip_dest_ip')
+
     def __init__(self, payload='',
                  eth_dest_mac=0,
                  eth_src_mac=0,
@@ -134,6 +181,30 @@ class IPFrame(object):
     def update_checksum(self):
         self.ip_header_checksum = self.calc_checksum()
 
+    # field setters that keep a computed checksum valid incrementally
+
+    def set_ip_length(self, ip_length):
+        if self.ip_header_checksum is not None:
+            self.ip_header_checksum = checksum_update(self.ip_header_checksum, self.ip_length, ip_length)
+        self.ip_length = ip_length
+
+    def set_ip_identification(self, ip_identification):
+        if self.ip_header_checksum is not None:
+            self.ip_header_checksum = checksum_update(self.ip_header_checksum, self.ip_identification, ip_identification)
+        self.ip_identification = ip_identification
+
+    def set_ip_ttl(self, ip_ttl):
+        if self.ip_header_checksum is not None:
+            self.ip_header_checksum = checksum_update(self.ip_header_checksum,
+                self.ip_ttl << 8 | self.ip_protocol, ip_ttl << 8 | self.ip_protocol)
+        self.ip_ttl = ip_ttl
+
+    def set_ip_dest_ip(self, ip_dest_ip):
+        if self.ip_header_checksum is not None:
+            cksum = checksum_update(self.ip_header_checksum, self.ip_dest_ip >> 16, ip_dest_ip >> 16)
+            self.ip_header_checksum = checksum_update(cksum, self.ip_dest_ip & 0xffff, ip_dest_ip & 0xffff)
+        self.ip_dest_ip = ip_dest_ip
+
     def build(self):
         if self.ip_length is None:
             self.update_length()
@@ -141,55 +212,64 @@ class IPFrame(object):
             self.update_checksum()
 
     def build_axis(self):
-        return self.build_eth().build_axis()
-
-    def build_eth(self):
         self.build()
-        data = ''
+        data = bytearray(34+len(self.payload.data))
+        eth_ep.pack_eth_header(data, 0, self.eth_dest_mac, self.eth_src_mac, self.eth_type)
+        self.pack_header(data, 14)
+        data[34:] = self.payload.data
 
-        data += struct.pack('B', self.ip_version << 4 | self.ip_ihl)
-        data += struct.pack('B', self.ip_dscp << 2 | self.ip_ecn)
-        data += struct.pack('>H', self.ip_length)
-        data += struct.pack('>H', self.ip_identification)
-        data += struct.pack('>H', self.ip_flags << 13 | self.ip_fragment_offset)
-        data += struct.pack('B', self.ip_ttl)
-        data += struct.pack('B', self.ip_protocol)
-        data += struct.pack('>H', self.ip_header_checksum)
-        data += struct.pack('>L', self.ip_source_ip)
-        data += struct.pack('>L', self.ip_dest_ip)
+        frame = axis_ep.AXIStreamFrame()
+        frame.data = data
+        return frame
 
-        data += self.payload.data
+    def build_eth(self):
+        self.build()
+        data = bytearray(20+len(self.payload.data))
+        self.pack_header(data, 0)
+        data[20:] = self.payload.data
 
         return eth_ep.EthFrame(data, self.eth_dest_mac, self.eth_src_mac, self.eth_type)
 
-    def parse_axis(self, data):
+    def pack_header(self, buf, offset=0):
+        ip_hdr_struct.pack_into(buf, offset,
+            self.ip_version << 4 | self.ip_ihl,
+            self.ip_dscp << 2 | self.ip_ecn,
+            self.ip_length,
+            self.ip_identification,
+            self.ip_flags << 13 | self.ip_fragment_offset,
+            self.ip_ttl,
+            self.ip_protocol,
+            self.ip_header_checksum,
+            self.ip_source_ip,
+            self.ip_dest_ip)
+
+    def unpack_header(self, buf, offset=0):
+        (v, d, self.ip_length, self.ip_identification, f, self.ip_ttl, self.ip_protocol,
+            self.ip_header_checksum, self.ip_source_ip, self.ip_dest_ip) = ip_hdr_struct.unpack_from(buf, offset)
+        self.ip_version = (v >> 4) & 0xF
+        self.ip_ihl = v & 0xF
+        self.ip_dscp = (d >> 2) & 0x3F
+        self.ip_ecn = d & 0x3
+        self.ip_flags = (f >> 13) & 0x7
+        self.ip_fragment_offset = f & 0x1FFF
+
+    def parse_axis(self, data, copy=True):
         frame = eth_ep.EthFrame()
-        frame.parse_axis(data)
-        self.parse_eth(frame)
+        frame.parse_axis(data, copy)
+        self.parse_eth(frame, copy)
 
-    def parse_eth(self, data):
+    def parse_eth(self, data, copy=True):
         self.eth_src_mac = data.eth_src_mac
         self.eth_dest_mac = data.eth_dest_mac
         self.eth_type = data.eth_type
 
-        v = struct.unpack('B', data.payload.data[0:1])[0]
-        self.ip_version = (v >> 4) & 0xF
-        self.ip_ihl = v & 0xF
-        v = struct.unpack('B', data.payload.data[1:2])[0]
-        self.ip_dscp = (v >> 2) & 0x3F
-        self.ip_ecn = v & 0x3
-        self.ip_length = struct.unpack('>H', data.payload.data[2:4])[0]
-        self.ip_identification = struct.unpack('>H', data.payload.data[4:6])[0]
-        v = struct.unpack('>H', data.payload.data[6:8])[0]
-        self.ip_flags = (v >> 13) & 0x7
-        self.ip_fragment_offset = v & 0x1FFF
-        self.ip_ttl = struct.unpack('B', data.payload.data[8:9])[0]
-        self.ip_protocol = struct.unpack('B', data.payload.data[9:10])[0]
-        self.ip_header_checksum = struct.unpack('>H', data.payload.data[10:12])[0]
-        self.ip_source_ip = struct.unpack('>L', data.payload.data[12:16])[0]
-        self.ip_dest_ip = struct.unpack('>L', data.payload.data[16:20])[0]
-
-        self.payload = axis_ep.AXIStreamFrame(data.payload.data[20:])
+        self.unpack_header(data.payload.data)
+
+        if copy:
+            self.payload = axis_ep.AXIStreamFrame(data.payload.data[20:])
+        else:
+            # payload is a read-only view of the received buffer
+            self._payload = data.payload.view(20)
 
     def __eq__(self, other):
         if type(other) is IPFrame:
@@ -230,6 +310,133 @@ class IPFrame(object):
                 ('ip_source_ip=0x%08x, ' % self.ip_source_ip) +
                 ('ip_dest_ip=0x%08x)' % self.ip_dest_ip))
 
+ip_hdr_fields = ('eth_dest_mac', 'eth_src_mac', 'eth_type',
+                 'ip_version', 'ip_ihl', 'ip_dscp', 'ip_ecn', 'ip_length',
+                 'ip_identification', 'ip_flags', 'ip_fragment_offset',
+                 'ip_ttl', 'ip_protocol', 'ip_header_checksum',
+                 'ip_source_ip', 'ip_dest_ip')
+
+ip_u16_struct = struct.Struct('>H')
+ip_u32_struct = struct.Struct('>L')
+
+class IPFrameTemplate(object):
+    def __init__(self, frame=None, **kwargs):
+        if frame is None:
+            frame = IPFrame(**kwargs)
+        self.frame = IPFrame(frame)
+        f = self.frame
+        if f.ip_length is None:
+            f.update_length()
+        f.ip_header_checksum = 0
+
+        # prebuilt Ethernet and IP header, varying fields are patched per frame
+        self.header = bytearray(34)
+        eth_ep.pack_eth_header(self.header, 0, f.eth_dest_mac, f.eth_src_mac, f.eth_type)
+        f.pack_header(self.header, 14)
+
+        # checksum of the fields that stay constant
+        cksum = f.ip_version << 12 | f.ip_ihl << 8 | f.ip_dscp << 2 | f.ip_ecn
+        cksum += f.ip_flags << 13 | f.ip_fragment_offset
+        cksum += f.ip_ttl << 8 | f.ip_protocol
+        cksum += f.ip_source_ip & 0xffff
+        cksum += (f.ip_source_ip >> 16) & 0xffff
+        self.base_sum = cksum
+
+        # template payload, zero padded on demand for longer frames
+        self.payload = bytes(bytearray(f.payload.data))
+
+    def _columns(self, count, ip_identification, ip_dest_ip, payload_len):
+        f = self.frame
+        cols = []
+        for v, d in ((ip_identification, f.ip_identification),
+                     (ip_dest_ip, f.ip_dest_ip),
+                     (payload_len, f.ip_length-20)):
+            if v is None:
+                v = d
+            if isinstance(v, numbers.Integral):
+                v = [int(v)]*count
+            elif len(v) != count:
+                raise Exception("Invalid field length")
+            else:
+                v = [int(x) for x in v]
+            cols.append(v)
+        return cols
+
+    def _payloads(self, count, payload, lengths):
+        # payloads are read-only views into a shared buffer, by default the
+        # template payload, which is zero padded for longer frames
+        n = max(lengths) if count else 0
+        if payload is None:
+            if len(self.payload) < n:
+                self.payload += bytes(bytearray(n-len(self.payload)))
+            payload = self.payload
+        elif len(payload) < n:
+            raise ValueError("Payload shorter than payload_len %d" % n)
+        mv = axis_ep.readonly_view(payload)
+        return [mv[:l] for l in lengths]
+
+    def checksum(self, ip_length, ip_identification, ip_dest_ip):
+        cksum = self.base_sum + ip_length + ip_identification
+        cksum += (ip_dest_ip & 0xffff) + ((ip_dest_ip >> 16) & 0xffff)
+        cksum = (cksum & 0xffff) + (cksum >> 16)
+        cksum = (cksum & 0xffff) + (cksum >> 16)
+        return ~cksum & 0xffff
+
+    def build_batch(self, count, ip_identification=None, ip_dest_ip=None, payload_len=None, payload=None):
+        ids, dests, lens = self._columns(count, ip_identification, ip_dest_ip, payload_len)
+        payloads = self._payloads(count, payload, lens)
+        base = [getattr(self.frame, k) for k in ip_hdr_fields]
+        frames = []
+
+        for i in range(count):
+            f = IPFrame.__new__(IPFrame)
+            for k, v in zip(ip_hdr_fields, base):
+                setattr(f, k, v)
+            p = axis_ep.AXIStreamFrame()
+            p.data = payloads[i]
+            f._payload = p
+            f.ip_length = lens[i]+20
+            f.ip_identification = ids[i]
+            f.ip_dest_ip = dests[i]
+            f.ip_header_checksum = self.checksum(f.ip_length, ids[i], dests[i])
+            frames.append(f)
+
+        return frames
+
+    def build_axis_batch(self, count, ip_identification=None, ip_dest_ip=None, payload_len=None, payload=None):
+        return self._build_raw_batch(0, count, ip_identification, ip_dest_ip, payload_len, payload)
+
+    def build_eth_batch(self, count, ip_identification=None, ip_dest_ip=None, payload_len=None, payload=None):
+        f = self.frame
+        frames = []
+        for p in self._build_raw_batch(14, count, ip_identification, ip_dest_ip, payload_len, payload):
+            e = eth_ep.EthFrame.__new__(eth_ep.EthFrame)
+            e.eth_dest_mac = f.eth_dest_mac
+            e.eth_src_mac = f.eth_src_mac
+            e.eth_type = f.eth_type
+            e._payload = p
+            frames.append(e)
+        return frames
+
+    def _build_raw_batch(self, start, count, ip_identification, ip_dest_ip, payload_len, payload):
+        ids, dests, lens = self._columns(count, ip_identification, ip_dest_ip, payload_len)
+        payloads = self._payloads(count, payload, lens)
+        hdr = self.header[start:]
+        o = 14-start
+        frames = []
+
+        for i in range(count):
+            data = hdr + payloads[i]
+            ip_u16_struct.pack_into(data, o+2, lens[i]+20)
+            ip_u16_struct.pack_into(data, o+4, ids[i])
+            ip_u16_struct.pack_into(data, o+10, self.checksum(lens[i]+20, ids[i], dests[i]))
+            ip_u32_struct.pack_into(data, o+16, dests[i])
+            p = axis_ep.AXIStreamFrame()
+            p.data = data
+            frames.append(p)
+
+        return frames
+
 def IPFrameSource(clk, rst,
                   ip_hdr_valid=None,
                   ip_hdr_ready=None,
@@ -263,7 +470,7 @@ def IPFrameSource(clk, rst,
     ip_hdr_valid_int = Signal(bool(False))
     ip_payload_pause = Signal(bool(False))
 
-    ip_payload_fifo = Queue()
+    ip_payload_fifo = SimFifo()
 
     ip_payload_source = axis_ep.AXIStreamSource(clk,
                                                 rst,
@@ -282,18 +489,22 @@ def IPFrameSource(clk, rst,
         ip_hdr_valid.next = ip_hdr_valid_int and not pause
         ip_payload_pause.next = pause # or ip_hdr_valid_int
 
+    waiter = FifoWaiter(fifo, clk, rst)
+
     @instance
     def logic():
         frame = dict()
 
         while True:
-            yield clk.posedge, rst.posedge
+            yield waiter.next_edge()
 
             if rst:
                 ip_hdr_valid_int.next = False
             else:
+                valid_next = bool(ip_hdr_valid_int)
                 if ip_hdr_ready_int:
                     ip_hdr_valid_int.next = False
+                    valid_next = False
                 if (ip_payload_tlast and ip_hdr_ready_int and ip_hdr_valid) or not ip_hdr_valid_int:
                     if not fifo.empty():
                         frame = fifo.get()
@@ -321,6 +532,9 @@ def IPFrameSource(clk, rst,
                             print("[%s] Sending frame %s" % (name, repr(frame)))
 
                         ip_hdr_valid_int.next = True
+                        valid_next = True
+
+                waiter.set_idle(not valid_next and fifo.empty())
 
     return logic, pause_logic, ip_payload_source
 
@@ -352,14 +566,16 @@ def IPFrameSink(clk, rst,
                 ip_payload_tuser=Signal(bool(False)),
                 fifo=None,
                 pause=0,
-                name=None):
+                name=None,
+                callback=None,
+                summary=None):
 
     ip_hdr_ready_int = Signal(bool(False))
     ip_hdr_valid_int = Signal(bool(False))
     ip_payload_pause = Signal(bool(False))
 
-    ip_payload_fifo = Queue()
-    ip_header_fifo = Queue()
+    ip_payload_fifo = SimFifo()
+    ip_header_fifo = SimFifo()
 
     ip_payload_sink = axis_ep.AXIStreamSink(clk,
                                             rst,
@@ -370,7 +586,18 @@ def IPFrameSink(clk, rst,
                                             tlast=ip_payload_tlast,
                                             tuser=ip_payload_tuser,
                                             fifo=ip_payload_fifo,
-                                            pause=ip_payload_pause)
+                                            pause=ip_payload_pause,
+                                            summary=summary)
+
+    if hasattr(callback, 'send'):
+        # consumer coroutine
+        callback = callback.send
+
+    def put_frame(frame):
+        if callback is not None:
+            callback(frame)
+        if fifo is not None:
+            fifo.put(frame)
 
     @always_comb
     def pause_logic():
@@ -391,7 +618,7 @@ def IPFrameSink(clk, rst,
             else:
                 ip_hdr_ready_int.next = True
 
-                if ip_hdr_ready_int and ip_hdr_valid_int:
+                if ip_hdr_ready_int and ip_hdr_valid_int and summary is None:
                     frame = IPFrame()
                     frame.eth_dest_mac = int(eth_dest_mac)
                     frame.eth_src_mac = int(eth_src_mac)
@@ -413,8 +640,8 @@ def IPFrameSink(clk, rst,
 
                 if not ip_payload_fifo.empty() and not ip_header_fifo.empty():
                     frame = ip_header_fifo.get()
-                    frame.payload = ip_payload_fifo.get()
-                    fifo.put(frame)
+                    frame._payload = ip_payload_fifo.get()
+                    put_frame(frame)
 
                     if name is not None:
                         print("[%s] Got frame %s" % (name, repr(frame)))
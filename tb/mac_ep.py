@@ -0,0 +1,353 @@
+"""
+
+Copyright (c) 2015 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+from myhdl import *
+import axis_ep
+import eth_ep
+from simfifo import FifoWaiter
+import binascii
+import struct
+import zlib
+
+ETH_PREAMBLE = bytearray(b'\x55\x55\x55\x55\x55\x55\x55\xd5')
+ETH_MIN_LEN = 60
+
+XGMII_IDLE = 0x07
+XGMII_START = 0xfb
+XGMII_TERM = 0xfd
+XGMII_ERROR = 0xfe
+
+fcs_struct = struct.Struct('<L')
+
+def calc_fcs(data):
+    return zlib.crc32(bytes(data)) & 0xffffffff
+
+class MACFrame(object):
+    __slots__ = ('data', 'fcs', 'error')
+
+    def __init__(self, data=b'', fcs=None, error=False):
+        self.data = bytearray()
+        self.fcs = fcs
+        self.error = error
+
+        if type(data) is MACFrame:
+            self.data = bytearray(data.data)
+            self.fcs = data.fcs
+            self.error = data.error
+        elif type(data) is eth_ep.EthFrame:
+            self.data = data.build_axis().data
+        elif type(data) is axis_ep.AXIStreamFrame:
+            self.data = bytearray(data.data)
+        else:
+            self.data = bytearray(data)
+
+    def pad(self):
+        if len(self.data) < ETH_MIN_LEN:
+            self.data += bytearray(ETH_MIN_LEN-len(self.data))
+            self.fcs = None
+
+    def calc_fcs(self):
+        return calc_fcs(self.data)
+
+    def update_fcs(self):
+        self.fcs = self.calc_fcs()
+
+    def check_fcs(self):
+        return self.fcs == self.calc_fcs()
+
+    def build(self):
+        # preamble, SFD, padded frame and FCS as sent on the wire
+        self.pad()
+        if self.fcs is None:
+            self.update_fcs()
+        data = bytearray(len(self.data)+12)
+        data[0:8] = ETH_PREAMBLE
+        data[8:-4] = self.data
+        fcs_struct.pack_into(data, len(data)-4, self.fcs)
+        return data
+
+    def parse(self, data):
+        # strip preamble up to and including the SFD, split off the FCS,
+        # error is set for a malformed frame or a bad FCS
+        data = bytearray(data)
+        k = data.find(b'\xd5')
+        if k < 0 or data[:k].strip(b'\x55') or len(data) < k+5:
+            self.data = data
+            self.fcs = None
+            self.error = True
+            return
+        self.data = data[k+1:-4]
+        self.fcs = fcs_struct.unpack_from(data, len(data)-4)[0]
+        self.error = not self.check_fcs()
+
+    def build_eth(self):
+        frame = eth_ep.EthFrame()
+        frame.parse_axis(axis_ep.AXIStreamFrame(self.data))
+        return frame
+
+    def __eq__(self, other):
+        if type(other) is MACFrame:
+            return self.data == other.data and self.fcs == other.fcs and self.error == other.error
+
+    def __repr__(self):
+        return 'MACFrame(data=%s, fcs=%s, error=%s)' % (repr(self.data),
+            'None' if self.fcs is None else '0x%08x' % self.fcs, repr(self.error))
+
+
+def xgmii_encode(data, lanes, ifg=12):
+    # start control character replaces the first preamble byte, terminate
+    # follows the FCS and idles pad to the inter-frame gap and a whole beat
+    n = len(data)
+    k = max(n+ifg, n+1)
+    k += -k % lanes
+    d = bytearray(k)
+    d[:n] = data
+    d[0] = XGMII_START
+    d[n:] = bytearray([XGMII_IDLE])*(k-n)
+    d[n] = XGMII_TERM
+
+    beats = []
+    all_ctrl = 2**lanes-1
+    for i in range(0, k, lanes):
+        c = 0
+        if i == 0:
+            c = 1
+        if i+lanes > n:
+            c |= all_ctrl & ~((1 << max(n-i, 0))-1)
+        beats.append((int(binascii.hexlify(bytes(d[i:i+lanes][::-1])), 16), c))
+    return beats
+
+
+def GMIISource(clk, rst,
+               txd=None,
+               tx_en=Signal(bool(False)),
+               tx_er=Signal(bool(False)),
+               fifo=None,
+               ifg=12,
+               name=None):
+
+    waiter = FifoWaiter(fifo, clk, rst)
+
+    @instance
+    def logic():
+        data = None
+        ptr = 0
+        gap = 0
+
+        while True:
+            yield waiter.next_edge()
+
+            if rst:
+                data = None
+                gap = 0
+                txd.next = 0
+                tx_en.next = False
+                tx_er.next = False
+            else:
+                if data is None and gap == 0 and not fifo.empty():
+                    frame = MACFrame(fifo.get())
+                    data = frame.build()
+                    ptr = 0
+                    if name is not None:
+                        print("[%s] Sending frame %s" % (name, repr(frame)))
+
+                if data is not None:
+                    txd.next = data[ptr]
+                    tx_en.next = True
+                    ptr += 1
+                    if ptr >= len(data):
+                        data = None
+                        gap = ifg
+                else:
+                    txd.next = 0
+                    tx_en.next = False
+                    if gap:
+                        gap -= 1
+
+                waiter.set_idle(data is None and gap == 0 and fifo.empty())
+
+    return logic
+
+
+def GMIISink(clk, rst,
+             rxd=None,
+             rx_dv=Signal(bool(False)),
+             rx_er=Signal(bool(False)),
+             fifo=None,
+             name=None,
+             callback=None):
+
+    if hasattr(callback, 'send'):
+        # consumer coroutine
+        callback = callback.send
+
+    def put_frame(data, error):
+        frame = MACFrame()
+        frame.parse(data)
+        frame.error = frame.error or error
+        if callback is not None:
+            callback(frame)
+        if fifo is not None:
+            fifo.put(frame)
+        if name is not None:
+            print("[%s] Got frame %s" % (name, repr(frame)))
+
+    @instance
+    def logic():
+        data = bytearray()
+        error = False
+
+        while True:
+            yield clk.posedge, rst.posedge
+
+            if rst:
+                data = bytearray()
+                error = False
+            elif rx_dv:
+                data.append(int(rxd))
+                error = error or bool(rx_er)
+            elif data:
+                put_frame(data, error)
+                data = bytearray()
+                error = False
+
+    return logic
+
+
+def XGMIISource(clk, rst,
+                txd=None,
+                txc=None,
+                fifo=None,
+                ifg=12,
+                name=None):
+
+    lanes = len(txc)
+    idle_data = int('07'*lanes, 16)
+    idle_ctrl = 2**lanes-1
+
+    waiter = FifoWaiter(fifo, clk, rst)
+
+    @instance
+    def logic():
+        beats = []
+        ptr = 0
+
+        while True:
+            yield waiter.next_edge()
+
+            if rst:
+                beats = []
+                ptr = 0
+                txd.next = idle_data
+                txc.next = idle_ctrl
+            else:
+                if ptr >= len(beats) and not fifo.empty():
+                    frame = MACFrame(fifo.get())
+                    beats = xgmii_encode(frame.build(), lanes, ifg)
+                    ptr = 0
+                    if name is not None:
+                        print("[%s] Sending frame %s" % (name, repr(frame)))
+
+                if ptr < len(beats):
+                    txd.next, txc.next = beats[ptr]
+                    ptr += 1
+                else:
+                    txd.next = idle_data
+                    txc.next = idle_ctrl
+
+                waiter.set_idle(ptr >= len(beats) and fifo.empty())
+
+    return logic
+
+
+def XGMIISink(clk, rst,
+              rxd=None,
+              rxc=None,
+              fifo=None,
+              name=None,
+              callback=None):
+
+    lanes = len(rxc)
+    fmt = '%%0%dx' % (lanes*2)
+
+    if hasattr(callback, 'send'):
+        # consumer coroutine
+        callback = callback.send
+
+    def put_frame(data, error):
+        frame = MACFrame()
+        frame.parse(data)
+        frame.error = frame.error or error
+        if callback is not None:
+            callback(frame)
+        if fifo is not None:
+            fifo.put(frame)
+        if name is not None:
+            print("[%s] Got frame %s" % (name, repr(frame)))
+
+    # returns the frame state after a beat containing control characters
+    def control_beat(beat, c, data, error):
+        for i in range(lanes):
+            b = beat[i]
+            if c & (1 << i):
+                if b == XGMII_START:
+                    data = bytearray(b'\x55')
+                    error = False
+                elif data is not None:
+                    if b == XGMII_TERM:
+                        put_frame(data, error)
+                        data = None
+                    elif b == XGMII_ERROR:
+                        error = True
+                        data.append(b)
+                    else:
+                        # unexpected control character ends the frame
+                        put_frame(data, True)
+                        data = None
+            elif data is not None:
+                data.append(b)
+        return data, error
+
+    @instance
+    def logic():
+        data = None
+        error = False
+
+        while True:
+            yield clk.posedge, rst.posedge
+
+            if rst:
+                data = None
+                error = False
+            else:
+                c = int(rxc)
+                if c == 0:
+                    # whole data beat
+                    if data is not None:
+                        data += bytearray(binascii.unhexlify(fmt % int(rxd)))[::-1]
+                else:
+                    beat = bytearray(binascii.unhexlify(fmt % int(rxd)))[::-1]
+                    data, error = control_beat(beat, c, data, error)
+
+    return logic
+
@@ -0,0 +1,300 @@
+"""
+
+Copyright (c) 2015 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+import axis_ep
+import array
+import mmap
+import struct
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+LINKTYPE_ETHERNET = 1
+
+# classic pcap with nanosecond timestamps
+pcap_hdr_struct = struct.Struct('<LHHlLLL')
+pcap_rec_struct = struct.Struct('<LLLL')
+PCAP_MAGIC_US = 0xa1b2c3d4
+PCAP_MAGIC_NS = 0xa1b23c4d
+
+# pcapng section header, interface description and enhanced packet blocks
+pcapng_shb_struct = struct.Struct('<LLLHHqL')
+pcapng_idb_struct = struct.Struct('<LLHHLHHBxxxHHL')
+pcapng_epb_struct = struct.Struct('<LLLLLLL')
+PCAPNG_SHB = 0x0a0d0d0a
+PCAPNG_IDB = 0x00000001
+PCAPNG_EPB = 0x00000006
+PCAPNG_BOM = 0x1a2b3c4d
+
+class PcapWriter(object):
+    # streams frames into a pcap or pcapng file through a fixed size buffer
+    #
+    # timestamps are the sink cycle of the tlast beat times period, in ns
+    #
+    # has a send method, so it can be passed directly as the callback of
+    # AXIStreamSink, EthFrameSink, IPFrameSink and UDPFrameSink
+    def __init__(self, f, linktype=LINKTYPE_ETHERNET, period=1, snaplen=65535,
+                 pcapng=False, buffer_size=1 << 20):
+        self.own_file = not hasattr(f, 'write')
+        if self.own_file:
+            f = open(f, 'wb')
+        self.file = f
+        self.linktype = linktype
+        self.period = period
+        self.snaplen = snaplen
+        self.pcapng = pcapng
+        self.buf = bytearray(buffer_size)
+        self.mv = memoryview(self.buf)
+        self.pos = 0
+        self.count = 0
+
+        if pcapng:
+            hdr = bytearray(pcapng_shb_struct.size + pcapng_idb_struct.size)
+            pcapng_shb_struct.pack_into(hdr, 0, PCAPNG_SHB, pcapng_shb_struct.size,
+                PCAPNG_BOM, 1, 0, -1, pcapng_shb_struct.size)
+            # if_tsresol option: 10^-9 s
+            pcapng_idb_struct.pack_into(hdr, pcapng_shb_struct.size, PCAPNG_IDB,
+                pcapng_idb_struct.size, linktype, 0, snaplen, 9, 1, 9, 0, 0,
+                pcapng_idb_struct.size)
+        else:
+            hdr = bytearray(pcap_hdr_struct.size)
+            pcap_hdr_struct.pack_into(hdr, 0, PCAP_MAGIC_NS, 2, 4, 0, 0, snaplen, linktype)
+        self.file.write(hdr)
+
+    def write(self, data, cycle=0):
+        l = len(data)
+        n = min(l, self.snaplen)
+        ts = (cycle or 0)*self.period
+
+        if self.pcapng:
+            pad = -n & 3
+            rec = pcapng_epb_struct.size + n + pad + 4
+        else:
+            rec = pcap_rec_struct.size + n
+
+        if self.pos + rec > len(self.buf):
+            self.flush()
+            if rec > len(self.buf):
+                self.buf = bytearray(rec)
+                self.mv = memoryview(self.buf)
+
+        buf = self.buf
+        p = self.pos
+        if self.pcapng:
+            pcapng_epb_struct.pack_into(buf, p, PCAPNG_EPB, rec, 0,
+                ts >> 32, ts & 0xffffffff, n, l)
+            p += pcapng_epb_struct.size
+            buf[p:p+n] = data[:n] if n < l else data
+            p += n
+            buf[p:p+pad] = b'\x00'*pad
+            p += pad
+            struct.pack_into('<L', buf, p, rec)
+            p += 4
+        else:
+            pcap_rec_struct.pack_into(buf, p, ts // 1000000000, ts % 1000000000, n, l)
+            p += pcap_rec_struct.size
+            buf[p:p+n] = data[:n] if n < l else data
+            p += n
+        self.pos = p
+        self.count += 1
+
+    def write_frame(self, frame):
+        if isinstance(frame, axis_ep.AXIStreamFrame):
+            self.write(frame.data, frame.cycle)
+        else:
+            # EthFrame, IPFrame and UDPFrame carry the tlast cycle on the payload
+            self.write(frame.build_axis().data, frame.payload.cycle)
+
+    def send(self, frame):
+        self.write_frame(frame)
+
+    def flush(self):
+        if self.pos:
+            self.file.write(self.mv[:self.pos])
+            self.pos = 0
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        if self.own_file:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class PcapReader(object):
+    # memory maps a pcap or pcapng file and indexes the record offsets in
+    # one pass
+    #
+    # record data is returned as memoryview slices of the mapping, frames
+    # built from them reference the file instead of copying it
+    def __init__(self, f):
+        self.own_file = not hasattr(f, 'fileno')
+        if self.own_file:
+            f = open(f, 'rb')
+        self.file = f
+        self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.mv = memoryview(self.map)
+        except TypeError:
+            # python 2 mmap only has the old buffer interface
+            if np is None:
+                raise Exception("PcapReader requires numpy on python 2")
+            self.mv = memoryview(np.frombuffer(self.map, dtype=np.uint8))
+
+        try:
+            self.offsets = array.array('Q')
+        except ValueError:
+            self.offsets = array.array('L')
+
+        magic = struct.unpack_from('<L', self.map, 0)[0]
+        self.pcapng = magic == PCAPNG_SHB
+        if self.pcapng:
+            self._index_pcapng()
+            return
+
+        if magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            order = '<'
+        else:
+            order = '>'
+            magic = struct.unpack_from('>L', self.map, 0)[0]
+            if magic not in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+                raise Exception("Not a pcap file")
+        self.ts_scale = 1 if magic == PCAP_MAGIC_NS else 1000
+        hdr = struct.Struct(order + 'LHHlLLL')
+        self.snaplen, self.linktype = hdr.unpack_from(self.map, 0)[5:7]
+        self.rec_struct = struct.Struct(order + 'LLLL')
+        self.len_index = 2
+
+        rec_struct = self.rec_struct
+        offsets = self.offsets
+        size = len(self.map)
+        p = hdr.size
+        while p + rec_struct.size <= size:
+            n = rec_struct.unpack_from(self.map, p)[2]
+            if p + rec_struct.size + n > size:
+                # truncated last record
+                break
+            offsets.append(p)
+            p += rec_struct.size + n
+
+    def _index_pcapng(self):
+        # indexes the enhanced packet blocks, link type, snap length and
+        # timestamp resolution come from the first interface description
+        if struct.unpack_from('<L', self.map, 8)[0] == PCAPNG_BOM:
+            order = '<'
+        elif struct.unpack_from('>L', self.map, 8)[0] == PCAPNG_BOM:
+            order = '>'
+        else:
+            raise Exception("Not a pcap file")
+        block_struct = struct.Struct(order + 'LL')
+        idb_struct = struct.Struct(order + 'HHL')
+        opt_struct = struct.Struct(order + 'HH')
+        self.rec_struct = struct.Struct(order + 'LLLLLLL')
+        self.len_index = 5
+        self.linktype = None
+        self.snaplen = 0
+        self.ts_res = 1000000
+
+        offsets = self.offsets
+        size = len(self.map)
+        p = 0
+        while p + block_struct.size <= size:
+            t, l = block_struct.unpack_from(self.map, p)
+            if l < 12 or p + l > size:
+                # truncated last block
+                break
+            if t == PCAPNG_EPB:
+                offsets.append(p)
+            elif t == PCAPNG_IDB and self.linktype is None:
+                self.linktype, r, self.snaplen = idb_struct.unpack_from(self.map, p+8)
+                q = p + 8 + idb_struct.size
+                while q + opt_struct.size <= p + l - 4:
+                    code, n = opt_struct.unpack_from(self.map, q)
+                    if code == 0:
+                        break
+                    if code == 9:
+                        # if_tsresol
+                        v = ord(self.map[q+4:q+5])
+                        self.ts_res = 2**(v & 0x7f) if v & 0x80 else 10**v
+                    q += opt_struct.size + n + (-n & 3)
+            p += l
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def record(self, i):
+        # returns timestamp in ns, captured data and original length
+        p = self.offsets[i]
+        if self.pcapng:
+            t, b, iface, hi, lo, n, l = self.rec_struct.unpack_from(self.map, p)
+            ts = ((hi << 32) | lo)*1000000000 // self.ts_res
+        else:
+            s, f, n, l = self.rec_struct.unpack_from(self.map, p)
+            ts = s*1000000000 + f*self.ts_scale
+        p += self.rec_struct.size
+        return ts, self.mv[p:p+n], l
+
+    def data(self, i):
+        p = self.offsets[i]
+        n = self.rec_struct.unpack_from(self.map, p)[self.len_index]
+        p += self.rec_struct.size
+        return self.mv[p:p+n]
+
+    def frames(self, start=0, stop=None, cls=None):
+        # frames for records start to stop, as AXIStreamFrame or parsed into
+        # cls (EthFrame, IPFrame, UDPFrame) without copying the data
+        if stop is None or stop > len(self.offsets):
+            stop = len(self.offsets)
+        i = start
+        while i < stop:
+            frame = axis_ep.AXIStreamFrame()
+            frame.data = self.data(i)
+            if cls is not None and cls is not axis_ep.AXIStreamFrame:
+                f = cls()
+                f.parse_axis(frame, copy=False)
+                frame = f
+            yield frame
+            i += 1
+
+    def __iter__(self):
+        return self.frames()
+
+    def close(self):
+        self.mv = None
+        self.map.close()
+        if self.own_file:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
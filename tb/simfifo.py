@@ -0,0 +1,105 @@
+"""
+
+Copyright (c) 2015 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+
+from collections import deque
+from Queue import Empty, Full
+
+class SimFifo(object):
+    # Queue.Queue compatible FIFO without locking for the single threaded
+    # simulator, get and put never block
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+        self.high_water = 0
+        self.queue = deque()
+
+    def qsize(self):
+        return len(self.queue)
+
+    def empty(self):
+        return not self.queue
+
+    def full(self):
+        return 0 < self.maxsize <= len(self.queue)
+
+    def put(self, item, block=True, timeout=None):
+        if 0 < self.maxsize <= len(self.queue):
+            raise Full
+        self.queue.append(item)
+        if len(self.queue) > self.high_water:
+            self.high_water = len(self.queue)
+
+    def put_nowait(self, item):
+        self.put(item, False)
+
+    def get(self, block=True, timeout=None):
+        if not self.queue:
+            raise Empty
+        return self.queue.popleft()
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def __len__(self):
+        return len(self.queue)
+
+# Endpoint generators reach optional objects such as fifos, callbacks and
+# recorders through helper functions defined beside the generator rather
+# than attribute references in its body, as myhdl resolves attribute
+# references on a generator's free variables when it is decorated and
+# fails for objects left as None.
+
+class FifoWaiter(object):
+    # lets a source skip its body on clock edges while it is idle and its
+    # fifo is empty
+    #
+    # the fifo is still checked on every clock edge from a sub-generator,
+    # which myhdl runs in place of the source, so data is picked up on the
+    # same edge as by a source polling the fifo, whatever order the
+    # generators run in
+    def __init__(self, fifo, clk, rst):
+        self.fifo = fifo
+        self.enabled = fifo is not None
+        self.clk = clk
+        self.rst = rst
+        self.idle = False
+
+    def next_edge(self):
+        # the next clock edge the source acts on
+        if self.idle:
+            self.idle = False
+            return self.wait()
+        return self.clk.posedge, self.rst.posedge
+
+    def set_idle(self, idle):
+        # idle when the source has nothing left to send
+        self.idle = self.enabled and idle
+
+    def wait(self):
+        fifo = self.fifo
+        rst = self.rst
+        edge = self.clk.posedge, rst.posedge
+        while True:
+            yield edge
+            if rst or not fifo.empty():
+                return
@@ -0,0 +1,529 @@
+#!/usr/bin/env python2
+"""
+
+Copyright (c) 2015 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+from myhdl import *
+from simfifo import SimFifo
+import random
+import struct
+import zlib
+
+import axis_ep
+
+def ref_build(data, M, WL, keep=None, user=None):
+    # one lane at a time, as AXIStreamFrame.build originally did
+    tdata = []
+    tkeep = []
+    tuser = []
+    for i, k in enumerate(range(0, len(data), M)):
+        d = 0
+        kp = 0
+        for j in range(min(M, len(data)-k)):
+            d |= data[k+j] << (j*WL)
+            kp |= 1 << j
+        tdata.append(d)
+        tkeep.append(kp if keep is None else keep[i])
+        if type(user) is int:
+            tuser.append(user if k+M >= len(data) else 0)
+        else:
+            tuser.append(0 if user is None else user[i])
+    return tdata, tkeep, tuser
+
+def ref_parse(tdata, tkeep, M, WL):
+    # one lane at a time, as AXIStreamFrame.parse originally did
+    data = []
+    for d, k in zip(tdata, tkeep):
+        for j in range(M):
+            if k & (1 << j):
+                data.append((d >> (j*WL)) & (2**WL-1))
+    return data
+
+def parse(tdata, tkeep, tuser, M, WL):
+    frame = axis_ep.AXIStreamFrame()
+    frame.M = M
+    frame.WL = WL
+    frame.parse(tdata, tkeep, tuser)
+    if WL == 8:
+        assert type(frame.data) is bytearray
+    return list(frame.data), frame.keep, frame.user
+
+def build(data, M, WL, keep=None, user=None):
+    frame = axis_ep.AXIStreamFrame(bytearray(data))
+    frame.keep = keep
+    frame.user = user
+    frame.M = M
+    frame.WL = WL
+    return frame.build()
+
+def test_frame_copy():
+    print("test 1: copy of received frame")
+
+    for l in range(1, 9):
+        data = bytearray(range(l))
+        tdata = []
+        tkeep = []
+        for k in range(0, l, 2):
+            tdata.append(data[k] | (data[k+1] << 8 if k+1 < l else 0))
+            tkeep.append(3 if k+1 < l else 1)
+        tuser = [0]*len(tdata)
+
+        rx_frame = axis_ep.AXIStreamFrame()
+        rx_frame.M = 2
+        rx_frame.WL = 8
+        rx_frame.parse(tdata, tkeep, tuser)
+
+        assert rx_frame.data == data
+        assert rx_frame.keep == tkeep
+        assert rx_frame.user == tuser
+
+        frame = axis_ep.AXIStreamFrame(rx_frame)
+
+        assert frame.data == data
+        assert frame.keep == tkeep
+        assert frame.user == tuser
+
+def test_capture_wide():
+    if axis_ep.np is None:
+        return
+
+    print("test 2: capture of wide bus")
+
+    capture = axis_ep.AXIStreamCapture(data_width=1024, size=1, user_width=72)
+
+    assert capture.words == 16
+    assert capture.keep_width == 128
+    assert capture.keep_words == 2
+    assert capture.user_words == 2
+
+    beats = [(2**1024-1, 2**128-1, 2**71+1), (2**1000+5, 2**100+3, 2**64)]
+    for k, (d, kp, u) in enumerate(beats):
+        capture.append(k, d, kp, k == len(beats)-1, u)
+
+    cols = capture.drain()
+
+    assert list(cols['frame_end']) == [2]
+    for k, (d, kp, u) in enumerate(beats):
+        assert sum(int(w) << (64*j) for j, w in enumerate(cols['tdata'][k])) == d
+        assert sum(int(w) << (64*j) for j, w in enumerate(cols['tkeep'][k])) == kp
+        assert sum(int(w) << (64*j) for j, w in enumerate(cols['tuser'][k])) == u
+
+def test_iter_beats():
+    print("test 3: lazy beats")
+
+    for WL in (4, 8, 16):
+        for M in (1, 2, 4):
+            for l in range(0, 2*M+2):
+                payload = bytearray((17*k+5) & 0xff for k in range(l))
+
+                ref = axis_ep.AXIStreamFrame(payload)
+                ref.M = M
+                ref.WL = WL
+                tdata, tkeep, tuser = ref.build()
+                beats = list(zip(tdata, tkeep, tuser, [k == len(tdata)-1 for k in range(len(tdata))]))
+
+                for data in (payload, bytes(payload), axis_ep.readonly_view(payload), list(payload)):
+                    frame = axis_ep.AXIStreamFrame()
+                    frame.data = data
+                    frame.M = M
+                    frame.WL = WL
+                    assert list(frame.iter_beats()) == beats
+
+def test_build():
+    print("test 4: build known vectors")
+
+    assert build([1, 2, 3], 2, 8) == ([0x0201, 0x03], [3, 1], [0, 0])
+    assert build([1, 2, 3, 4, 5], 4, 4) == ([0x4321, 0x5], [0xf, 0x1], [0, 0])
+    assert build([0x12, 0x34, 0x56], 2, 16) == ([0x00340012, 0x0056], [3, 1], [0, 0])
+    assert build(range(8), 8, 8) == ([0x0706050403020100], [0xff], [0])
+    assert build(range(9), 8, 8, user=1) == ([0x0706050403020100, 0x08], [0xff, 0x01], [0, 1])
+    assert build([0xaa, 0xbb, 0xcc, 0xdd], 2, 8, keep=[2, 1], user=[1, 0]) == ([0xbbaa, 0xddcc], [2, 1], [1, 0])
+    assert build([], 4, 8) == ([], [], [])
+
+    print("test 5: build against reference")
+
+    for M in (1, 2, 8, 64):
+        for WL in (4, 8, 16):
+            for l in range(0, 2*M+2):
+                data = [(7*k+3) & (2**min(WL, 8)-1) for k in range(l)]
+                n = (l+M-1)//M
+
+                assert build(data, M, WL) == ref_build(data, M, WL)
+
+                if n == 0:
+                    continue
+
+                # sparse lane enables and user bits
+                keep = [(0x5555555555555555*(k+1)) & (2**M-1) or 1 for k in range(n)]
+                user = [k % 2 for k in range(n)]
+
+                assert build(data, M, WL, keep, user) == ref_build(data, M, WL, keep, user)
+                assert build(data, M, WL, user=1) == ref_build(data, M, WL, user=1)
+
+def test_parse():
+    print("test 6: parse known vectors")
+
+    assert parse([0x0201, 0x03], [3, 1], [0, 0], 2, 8) == ([1, 2, 3], [3, 1], [0, 0])
+    assert parse([0x44332211], [0xa], [1], 4, 8) == ([0x22, 0x44], [0xa], [1])
+    assert parse([0x44332211, 0x88776655], [0x9, 0xf], [0, 0], 4, 8) == ([0x11, 0x44, 0x55, 0x66, 0x77, 0x88], [0x9, 0xf], [0, 0])
+    assert parse([0x4321, 0x5], [0xf, 0x1], [0, 0], 4, 4) == ([1, 2, 3, 4, 5], [0xf, 0x1], [0, 0])
+    assert parse([0x4321], [0x5], [0], 4, 4) == ([1, 3], [0x5], [0])
+    assert parse([0x00340012, 0x0056], [3, 1], [0, 1], 2, 16) == ([0x12, 0x34, 0x56], [3, 1], [0, 1])
+    assert parse([], [], [], 8, 8) == ([], [], [])
+
+    print("test 7: parse round trip")
+
+    for M in (1, 2, 8, 64):
+        for WL in (4, 8, 16):
+            for l in range(0, 2*M+2):
+                data = [(7*k+3) & (2**min(WL, 8)-1) for k in range(l)]
+                n = (l+M-1)//M
+
+                tdata, tkeep, tuser = build(data, M, WL)
+                assert parse(tdata, tkeep, tuser, M, WL) == (data, tkeep, tuser)
+
+                if n == 0:
+                    continue
+
+                # sparse lane enables and user bits
+                keep = [(0x5555555555555555*(k+1)) & (2**M-1) or 1 for k in range(n)]
+                user = [k % 2 for k in range(n)]
+
+                tdata, tkeep, tuser = build(data, M, WL, keep, user)
+                assert parse(tdata, tkeep, tuser, M, WL) == (ref_parse(tdata, tkeep, M, WL), keep, user)
+
+def bench():
+
+    # Inputs
+    clk = Signal(bool(0))
+    rst = Signal(bool(0))
+    current_test = Signal(intbv(0)[8:])
+
+    tready = Signal(bool(1))
+    backpressure = Signal(bool(0))
+
+    # sources, each driving its own bus from the same frames, streaming
+    # sources get the payload materialised, as a generator and in chunks
+    modes = [(dict(), bytearray),
+             (dict(prefetch=True), bytearray),
+             (dict(streaming=True), bytearray),
+             (dict(streaming=True), lambda data: (b for b in bytearray(data))),
+             (dict(streaming=True), lambda data: [bytearray(data)[k:k+5] for k in range(0, len(data), 5)])]
+    queues = []
+    buses = []
+    logs = []
+    sources = []
+
+    for mode, payload in modes:
+        queue = SimFifo()
+        bus = dict(tdata=Signal(intbv(0)[64:]),
+                   tkeep=Signal(intbv(0)[8:]),
+                   tvalid=Signal(bool(0)),
+                   tlast=Signal(bool(0)),
+                   tuser=Signal(bool(0)))
+        sources.append(axis_ep.AXIStreamSource(clk, rst, tready=tready, fifo=queue, **dict(bus, **mode)))
+        queues.append(queue)
+        buses.append(bus)
+        logs.append([])
+
+    def put(data):
+        for queue, (mode, payload) in zip(queues, modes):
+            queue.put(payload(data))
+
+    @always(delay(4))
+    def clkgen():
+        clk.next = not clk
+
+    @instance
+    def ready_logic():
+        rand = random.Random(1)
+        while True:
+            yield clk.posedge
+            tready.next = not backpressure or rand.random() < 0.5
+
+    @always(clk.posedge)
+    def monitor():
+        for bus, log in zip(buses, logs):
+            if bus['tvalid'] and tready:
+                log.append((now(), int(bus['tdata']), int(bus['tkeep']), bool(bus['tlast'])))
+
+    def compare():
+        for i in range(200):
+            yield clk.posedge
+        assert logs[0]
+        for log in logs[1:]:
+            assert log == logs[0]
+        for log in logs:
+            del log[:]
+
+    @instance
+    def check():
+        yield delay(100)
+        yield clk.posedge
+        rst.next = 1
+        yield clk.posedge
+        rst.next = 0
+        yield clk.posedge
+        yield delay(100)
+        yield clk.posedge
+
+        lengths = (1, 8, 9, 17, 64, 3, 16)
+
+        yield clk.posedge
+        print("test 8: back to back frames")
+        current_test.next = 8
+
+        for l in lengths:
+            put(range(l))
+
+        yield compare()
+
+        yield clk.posedge
+        print("test 9: frames separated by gaps")
+        current_test.next = 9
+
+        for l, gap in zip(lengths, (0, 1, 2, 5, 0, 3, 1)):
+            put(range(l))
+            for i in range(gap + l//8):
+                yield clk.posedge
+
+        yield compare()
+
+        yield clk.posedge
+        print("test 10: back to back frames with backpressure")
+        current_test.next = 10
+
+        backpressure.next = 1
+
+        for l in lengths:
+            put(range(l))
+
+        yield compare()
+
+        backpressure.next = 0
+
+        yield delay(100)
+
+        raise StopSimulation
+
+    return sources, clkgen, ready_logic, monitor, check
+
+def test_bench():
+    sim = Simulation(bench())
+    sim.run()
+
+def sink_bench(frames, keep_width=8, **kwargs):
+    # sends frames from a source to a sink created with kwargs
+
+    # Inputs
+    clk = Signal(bool(0))
+    rst = Signal(bool(0))
+
+    tdata = Signal(intbv(0)[64:])
+    tkeep = Signal(intbv(0)[keep_width:])
+    tvalid = Signal(bool(0))
+    tready = Signal(bool(0))
+    tlast = Signal(bool(0))
+    tuser = Signal(bool(0))
+
+    source_queue = SimFifo()
+
+    source = axis_ep.AXIStreamSource(clk,
+                                     rst,
+                                     tdata=tdata,
+                                     tkeep=tkeep,
+                                     tvalid=tvalid,
+                                     tready=tready,
+                                     tlast=tlast,
+                                     tuser=tuser,
+                                     fifo=source_queue)
+
+    sink = axis_ep.AXIStreamSink(clk,
+                                 rst,
+                                 tdata=tdata,
+                                 tkeep=tkeep,
+                                 tvalid=tvalid,
+                                 tready=tready,
+                                 tlast=tlast,
+                                 tuser=tuser,
+                                 **kwargs)
+
+    @always(delay(4))
+    def clkgen():
+        clk.next = not clk
+
+    @instance
+    def check():
+        yield delay(100)
+        yield clk.posedge
+        rst.next = 1
+        yield clk.posedge
+        rst.next = 0
+        yield clk.posedge
+
+        for f in frames:
+            source_queue.put(f)
+
+        while not source_queue.empty() or tvalid:
+            yield clk.posedge
+
+        yield delay(100)
+
+        raise StopSimulation
+
+    return source, sink, clkgen, check
+
+def test_summary():
+    print("test 11: summary mode")
+
+    payloads = [bytearray((13*k+l) & 0xff for k in range(l)) for l in (1, 7, 8, 9, 100, 3, 64)]
+
+    for history, kept in ((0, 0), (3, 3), (None, len(payloads))):
+        sink_queue = SimFifo()
+        summary = axis_ep.AXIStreamSummary(history)
+
+        Simulation(sink_bench(payloads, fifo=sink_queue, summary=summary)).run()
+
+        assert sink_queue.empty()
+        assert summary.frame_count == len(payloads)
+        assert summary.byte_count == sum(len(p) for p in payloads)
+        assert summary.crc == zlib.crc32(bytes(b''.join(bytes(p) for p in payloads))) & 0xffffffff
+        assert list(summary.frame_lengths) == [len(p) for p in payloads][len(payloads)-kept:]
+        assert list(summary.frame_crcs) == [zlib.crc32(bytes(p)) & 0xffffffff for p in payloads][len(payloads)-kept:]
+
+    print("test 12: summary mode, 16 bit lanes")
+
+    summary = axis_ep.AXIStreamSummary(None)
+
+    Simulation(sink_bench(payloads, keep_width=4, summary=summary)).run()
+
+    # each lane is summarised as two little endian bytes
+    lanes = [bytes(bytearray(struct.pack('<%dH' % len(p), *p))) for p in payloads]
+
+    assert summary.frame_count == len(payloads)
+    assert summary.byte_count == sum(len(p) for p in payloads)
+    assert summary.crc == zlib.crc32(b''.join(lanes)) & 0xffffffff
+    assert list(summary.frame_crcs) == [zlib.crc32(l) & 0xffffffff for l in lanes]
+
+def test_callback():
+    print("test 13: callback mode")
+
+    payloads = [bytearray((13*k+l) & 0xff for k in range(l)) for l in (1, 7, 8, 9, 100, 3, 64)]
+
+    sink_queue = SimFifo()
+    Simulation(sink_bench(payloads, fifo=sink_queue)).run()
+    ref_frames = [sink_queue.get() for p in payloads]
+
+    # frames are only handed to the callback, nothing is queued
+    rx_frames = []
+    Simulation(sink_bench(payloads, callback=rx_frames.append)).run()
+
+    assert [f.data for f in rx_frames] == payloads
+    assert [f.cycle for f in rx_frames] == [f.cycle for f in ref_frames]
+
+    print("test 14: consumer coroutine")
+
+    def consumer(lengths):
+        while True:
+            frame = yield
+            lengths.append(len(frame.data))
+
+    lengths = []
+    coroutine = consumer(lengths)
+    next(coroutine)
+
+    Simulation(sink_bench(payloads, callback=coroutine)).run()
+
+    assert lengths == [len(p) for p in payloads]
+
+def test_capture():
+    if axis_ep.np is None:
+        return
+
+    print("test 15: capture mode")
+
+    payloads = [bytearray((13*k+l) & 0xff for k in range(l)) for l in (1, 7, 8, 9, 100, 3, 64)]
+
+    sink_queue = SimFifo()
+    # small buffer to exercise the growth
+    capture = axis_ep.AXIStreamCapture(64, size=4)
+
+    Simulation(sink_bench(payloads, fifo=sink_queue, capture=capture)).run()
+
+    assert sink_queue.empty()
+    assert capture.frame_count == len(payloads)
+
+    tdata = []
+    tkeep = []
+    ends = []
+    for p in payloads:
+        frame = axis_ep.AXIStreamFrame(p)
+        frame.M = 8
+        d, k, u = frame.build()
+        tdata += d
+        tkeep += k
+        ends.append(len(tdata))
+
+    cols = capture.drain()
+
+    assert [int(v) for v in cols['tdata'][:, 0]] == tdata
+    assert [int(v) for v in cols['tkeep'][:, 0]] == tkeep
+    assert not cols['tuser'].any()
+    assert list(cols['frame_end']) == ends
+    assert [k+1 for k in range(len(tdata)) if cols['tlast'][k]] == ends
+    assert all(b > a for a, b in zip(cols['cycle'], cols['cycle'][1:]))
+
+    assert capture.count == 0
+    assert capture.frame_count == 0
+
+    print("test 16: drain with a partial frame")
+
+    capture.append(1, 0x11, 0xff, False, 0)
+    capture.append(2, 0x22, 0x01, True, 1)
+    capture.append(3, 0x33, 0xff, False, 0)
+
+    cols = capture.drain()
+
+    assert list(cols['tdata'][:, 0]) == [0x11, 0x22]
+    assert list(cols['tuser'][:, 0]) == [0, 1]
+    assert list(cols['frame_end']) == [2]
+    assert capture.count == 1
+
+    capture.append(4, 0x44, 0x03, True, 0)
+
+    cols = capture.drain()
+
+    assert list(cols['tdata'][:, 0]) == [0x33, 0x44]
+    assert list(cols['cycle']) == [3, 4]
+    assert list(cols['frame_end']) == [2]
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_frame_copy()
+    test_capture_wide()
+    test_iter_beats()
+    test_build()
+    test_parse()
+    test_bench()
+    test_summary()
+    test_callback()
+    test_capture()
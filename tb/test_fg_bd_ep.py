@@ -0,0 +1,388 @@
+#!/usr/bin/env python2
+"""
+
+Copyright (c) 2015 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+from myhdl import *
+from Queue import Queue
+from simfifo import SimFifo
+
+import fg_batch
+import fg_bd_ep
+import fg_fd_ep
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+class Recorder(object):
+    def __init__(self):
+        self.items = []
+
+    def write(self, d, cycle):
+        self.items.append((d, cycle))
+
+def out_of_range(batch_type, **kwargs):
+    try:
+        batch_type.from_fields(**kwargs)
+    except Exception:
+        return True
+    return False
+
+def test_from_fields():
+    if np is None:
+        return
+
+    print("test 1: field range checks")
+
+    batch = fg_bd_ep.BurstDescriptorBatch.from_fields(3, dest=255, burst_len=[1, 2**32-1, 0])
+    assert list(batch) == [fg_bd_ep.BurstDescriptor(255, 1), fg_bd_ep.BurstDescriptor(255, 2**32-1),
+                           fg_bd_ep.BurstDescriptor(255, 0)]
+
+    assert out_of_range(fg_bd_ep.BurstDescriptorBatch, dest=256)
+    assert out_of_range(fg_bd_ep.BurstDescriptorBatch, dest=-1)
+    assert out_of_range(fg_bd_ep.BurstDescriptorBatch, burst_len=[0, 2**32])
+    assert out_of_range(fg_bd_ep.BurstDescriptorBatch, burst_len=-1)
+
+    batch = fg_bd_ep.BurstDescriptorBatch.from_fields(dest_width=12, dest=[0, 4095])
+    assert list(batch.array['dest']) == [0, 4095]
+    assert out_of_range(fg_bd_ep.BurstDescriptorBatch, dest_width=12, dest=4096)
+    assert out_of_range(fg_bd_ep.BurstDescriptorBatch, dest_width=4, dest=16)
+
+    batch = fg_fd_ep.FlowDescriptorBatch.from_fields(dest=1, rate_num=0xffff, rate_denom=[1, 0xffff],
+                                                     len=2**32-1, burst_len=1)
+    assert len(batch) == 2
+    assert batch[1] == fg_fd_ep.FlowDescriptor(1, 0xffff, 0xffff, 2**32-1, 1)
+
+    assert out_of_range(fg_fd_ep.FlowDescriptorBatch, rate_num=2**16)
+    assert out_of_range(fg_fd_ep.FlowDescriptorBatch, rate_denom=[1, 2**16])
+    assert out_of_range(fg_fd_ep.FlowDescriptorBatch, len=2**32)
+    assert out_of_range(fg_fd_ep.FlowDescriptorBatch, burst_len=-1)
+
+    # empty columns and a count for scalar fields
+    assert len(fg_bd_ep.BurstDescriptorBatch.from_fields(dest=[], burst_len=[])) == 0
+    assert len(fg_bd_ep.BurstDescriptorBatch.from_fields(5, burst_len=7)) == 5
+
+def read_all(reader):
+    items = []
+    while reader.pending():
+        d = reader.next()
+        if d is not None:
+            items.append(d)
+    return items
+
+def test_batch_reader():
+    if np is None:
+        return
+
+    print("test 2: batch reader")
+
+    Batch = fg_bd_ep.BurstDescriptorBatch
+    batch = Batch.random(5, dest=(0, 255), burst_len=(1, 4096), seed=1)
+    empty = Batch(0)
+
+    fifo = SimFifo()
+    reader = fg_batch.BatchReader(fifo, Batch)
+
+    assert not reader.pending()
+
+    fifo.put(batch)
+    fifo.put(empty)
+    fifo.put(fg_bd_ep.BurstDescriptor(3, 100))
+    fifo.put({'dest': 4, 'burst_len': 200})
+    fifo.put(empty)
+    fifo.put(empty)
+    fifo.put(batch[1:3])
+    fifo.put(Batch.from_fields(dest=9, burst_len=1))
+
+    expect = ([(int(d.dest), int(d.burst_len)) for d in batch] + [(3, 100), (4, 200)] +
+              [(int(d.dest), int(d.burst_len)) for d in batch[1:3]] + [(9, 1)])
+
+    assert read_all(reader) == expect
+    assert not reader.pending()
+    assert fifo.empty()
+
+    # an empty batch on its own gives nothing
+    fifo.put(empty)
+    assert reader.pending()
+    assert reader.next() is None
+    assert not reader.pending()
+
+    # batches put while one is being read follow it
+    fifo.put(batch[:2])
+    first = reader.next()
+    fifo.put(batch[2:3])
+    assert [first] + read_all(reader) == [batch.fields_at(i) for i in range(3)]
+
+    fifo = SimFifo()
+    reader = fg_batch.BatchReader(fifo, fg_fd_ep.FlowDescriptorBatch)
+    flows = fg_fd_ep.FlowDescriptorBatch.random(4, dest=(0, 15), len=(1, 10000), seed=2)
+    fd = fg_fd_ep.FlowDescriptor(1, 2, 3, 4, 5)
+
+    fifo.put(fd)
+    fifo.put(flows)
+    fifo.put(fd)
+
+    assert read_all(reader) == [(1, 2, 3, 4, 5)] + [flows.fields_at(i) for i in range(4)] + [(1, 2, 3, 4, 5)]
+
+def bench():
+
+    # Parameters
+    period = 8
+
+    # Inputs
+    clk = Signal(bool(0))
+    rst = Signal(bool(0))
+    current_test = Signal(intbv(0)[8:])
+
+    pause = Signal(bool(0))
+    sink_pause = Signal(bool(0))
+
+    batch_bd_valid = Signal(bool(0))
+    batch_bd_ready = Signal(bool(0))
+    batch_bd_dest = Signal(intbv(0)[8:])
+    batch_bd_burst_len = Signal(intbv(0)[32:])
+    queue_bd_valid = Signal(bool(0))
+    queue_bd_ready = Signal(bool(0))
+    queue_bd_dest = Signal(intbv(0)[8:])
+    queue_bd_burst_len = Signal(intbv(0)[32:])
+
+    batch_fd_valid = Signal(bool(0))
+    batch_fd_ready = Signal(bool(0))
+    batch_fd_dest = Signal(intbv(0)[8:])
+    batch_fd_rate_num = Signal(intbv(0)[16:])
+    batch_fd_rate_denom = Signal(intbv(0)[16:])
+    batch_fd_len = Signal(intbv(0)[32:])
+    batch_fd_burst_len = Signal(intbv(0)[32:])
+    queue_fd_valid = Signal(bool(0))
+    queue_fd_ready = Signal(bool(0))
+    queue_fd_dest = Signal(intbv(0)[8:])
+    queue_fd_rate_num = Signal(intbv(0)[16:])
+    queue_fd_rate_denom = Signal(intbv(0)[16:])
+    queue_fd_len = Signal(intbv(0)[32:])
+    queue_fd_burst_len = Signal(intbv(0)[32:])
+
+    # sources and sinks
+    batch_bd_queue = SimFifo()
+    queue_bd_queue = Queue()
+    batch_fd_queue = SimFifo()
+    queue_fd_queue = Queue()
+
+    batch_bd_recorder = Recorder()
+    queue_bd_recorder = Recorder()
+    batch_fd_recorder = Recorder()
+    queue_fd_recorder = Recorder()
+
+    batch_bd_source = fg_bd_ep.BurstDescriptorSource(clk,
+                                                     rst,
+                                                     valid=batch_bd_valid,
+                                                     ready=batch_bd_ready,
+                                                     dest=batch_bd_dest,
+                                                     burst_len=batch_bd_burst_len,
+                                                     fifo=batch_bd_queue,
+                                                     pause=pause,
+                                                     name='batch_bd_source')
+
+    batch_bd_sink = fg_bd_ep.BurstDescriptorSink(clk,
+                                                 rst,
+                                                 valid=batch_bd_valid,
+                                                 ready=batch_bd_ready,
+                                                 dest=batch_bd_dest,
+                                                 burst_len=batch_bd_burst_len,
+                                                 pause=sink_pause,
+                                                 recorder=batch_bd_recorder,
+                                                 name='batch_bd_sink')
+
+    queue_bd_source = fg_bd_ep.BurstDescriptorSource(clk,
+                                                     rst,
+                                                     valid=queue_bd_valid,
+                                                     ready=queue_bd_ready,
+                                                     dest=queue_bd_dest,
+                                                     burst_len=queue_bd_burst_len,
+                                                     fifo=queue_bd_queue,
+                                                     pause=pause,
+                                                     name='queue_bd_source')
+
+    queue_bd_sink = fg_bd_ep.BurstDescriptorSink(clk,
+                                                 rst,
+                                                 valid=queue_bd_valid,
+                                                 ready=queue_bd_ready,
+                                                 dest=queue_bd_dest,
+                                                 burst_len=queue_bd_burst_len,
+                                                 pause=sink_pause,
+                                                 recorder=queue_bd_recorder,
+                                                 name='queue_bd_sink')
+
+    batch_fd_source = fg_fd_ep.FlowDescriptorSource(clk,
+                                                    rst,
+                                                    valid=batch_fd_valid,
+                                                    ready=batch_fd_ready,
+                                                    dest=batch_fd_dest,
+                                                    rate_num=batch_fd_rate_num,
+                                                    rate_denom=batch_fd_rate_denom,
+                                                    len=batch_fd_len,
+                                                    burst_len=batch_fd_burst_len,
+                                                    fifo=batch_fd_queue,
+                                                    pause=pause,
+                                                    name='batch_fd_source')
+
+    batch_fd_sink = fg_fd_ep.FlowDescriptorSink(clk,
+                                                rst,
+                                                valid=batch_fd_valid,
+                                                ready=batch_fd_ready,
+                                                dest=batch_fd_dest,
+                                                rate_num=batch_fd_rate_num,
+                                                rate_denom=batch_fd_rate_denom,
+                                                len=batch_fd_len,
+                                                burst_len=batch_fd_burst_len,
+                                                pause=sink_pause,
+                                                recorder=batch_fd_recorder,
+                                                name='batch_fd_sink')
+
+    queue_fd_source = fg_fd_ep.FlowDescriptorSource(clk,
+                                                    rst,
+                                                    valid=queue_fd_valid,
+                                                    ready=queue_fd_ready,
+                                                    dest=queue_fd_dest,
+                                                    rate_num=queue_fd_rate_num,
+                                                    rate_denom=queue_fd_rate_denom,
+                                                    len=queue_fd_len,
+                                                    burst_len=queue_fd_burst_len,
+                                                    fifo=queue_fd_queue,
+                                                    pause=pause,
+                                                    name='queue_fd_source')
+
+    queue_fd_sink = fg_fd_ep.FlowDescriptorSink(clk,
+                                                rst,
+                                                valid=queue_fd_valid,
+                                                ready=queue_fd_ready,
+                                                dest=queue_fd_dest,
+                                                rate_num=queue_fd_rate_num,
+                                                rate_denom=queue_fd_rate_denom,
+                                                len=queue_fd_len,
+                                                burst_len=queue_fd_burst_len,
+                                                pause=sink_pause,
+                                                recorder=queue_fd_recorder,
+                                                name='queue_fd_sink')
+
+    rng = np.random.RandomState(3)
+
+    @always(delay(period//2))
+    def clkgen():
+        clk.next = not clk
+
+    def put_batches(batch_queue, queue_queue, batches):
+        for b in batches:
+            batch_queue.put(b)
+            for d in b:
+                queue_queue.put(d)
+
+    def run(bd_batches, fd_batches, gaps):
+        for i in range(len(bd_batches)):
+            put_batches(batch_bd_queue, queue_bd_queue, bd_batches[i])
+            put_batches(batch_fd_queue, queue_fd_queue, fd_batches[i])
+            for k in range(gaps[i]):
+                yield clk.posedge
+
+        while not (batch_bd_queue.empty() and batch_fd_queue.empty() and
+                   queue_bd_queue.empty() and queue_fd_queue.empty()):
+            yield clk.posedge
+        for k in range(20):
+            yield clk.posedge
+
+        bds = [d for b in bd_batches for bb in b for d in bb]
+        fds = [d for b in fd_batches for bb in b for d in bb]
+
+        assert [d for d, c in batch_bd_recorder.items] == bds
+        assert batch_bd_recorder.items == queue_bd_recorder.items
+        assert [d for d, c in batch_fd_recorder.items] == fds
+        assert batch_fd_recorder.items == queue_fd_recorder.items
+
+    def groups(seed):
+        # lists of batches with empty batches mixed in
+        bd = fg_bd_ep.BurstDescriptorBatch.random(12, dest=(0, 255), burst_len=(1, 2**32-1), seed=seed)
+        fd = fg_fd_ep.FlowDescriptorBatch.random(12, dest=(0, 255), len=(1, 2**32-1), seed=seed)
+        return ([[bd[0:3]], [bd[3:4], bd[4:4], bd[4:8]], [bd[8:8]], [bd[8:12]]],
+                [[fd[0:1], fd[1:4]], [fd[4:8]], [fd[8:8], fd[8:9]], [fd[9:12], fd[12:12]]])
+
+    @instance
+    def check():
+        yield delay(100)
+        yield clk.posedge
+        rst.next = 1
+        yield clk.posedge
+        rst.next = 0
+        yield clk.posedge
+        yield delay(100)
+        yield clk.posedge
+
+        yield clk.posedge
+        print("test 3: batch and queue fed sources")
+        current_test.next = 3
+
+        bd_batches, fd_batches = groups(4)
+        yield run(bd_batches, fd_batches, [0, 1, 5, 0])
+
+        yield delay(100)
+
+        yield clk.posedge
+        print("test 4: batch and queue fed sources with pauses")
+        current_test.next = 4
+
+        del batch_bd_recorder.items[:]
+        del queue_bd_recorder.items[:]
+        del batch_fd_recorder.items[:]
+        del queue_fd_recorder.items[:]
+
+        bd_batches, fd_batches = groups(5)
+        yield run(bd_batches, fd_batches, [2, 0, 3, 1])
+
+        yield delay(100)
+
+        raise StopSimulation
+
+    @instance
+    def pause_gen():
+        while True:
+            yield clk.posedge
+            if current_test == 4:
+                pause.next = rng.randint(4) == 0
+                sink_pause.next = rng.randint(3) == 0
+            else:
+                pause.next = 0
+                sink_pause.next = 0
+
+    return instances()
+
+def test_bench():
+    if np is None:
+        return
+
+    sim = Simulation(bench())
+    sim.run()
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_from_fields()
+    test_batch_reader()
+    test_bench()
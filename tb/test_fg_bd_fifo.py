@@ -25,7 +25,7 @@ THE SOFTWARE.
 
 from myhdl import *
 import os
-from Queue import Queue
+from simfifo import SimFifo
 
 import fg_bd_ep
 
@@ -103,9 +103,9 @@ def bench():
     byte_count = Signal(intbv(0)[ADDR_WIDTH+32:])
 
     # sources and sinks
-    source_queue = Queue()
+    source_queue = SimFifo()
     source_pause = Signal(bool(0))
-    sink_queue = Queue()
+    sink_queue = SimFifo()
     sink_pause = Signal(bool(0))
 
     source = fg_bd_ep.BurstDescriptorSource(clk,
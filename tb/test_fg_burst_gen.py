@@ -25,10 +25,11 @@ THE SOFTWARE.
 
 from myhdl import *
 import os
-from Queue import Queue
+from simfifo import SimFifo
 
 import fg_bd_ep
 import fg_fd_ep
+import fg_burst_gen_model
 
 module = 'fg_burst_gen'
 
@@ -41,6 +42,11 @@ src = ' '.join(srcs)
 
 build_cmd = "iverilog -o test_%s.vvp %s" % (module, src)
 
+class BurstLog(list):
+    # in memory recorder of (cycle, burst descriptor) pairs
+    def write(self, bd, cycle):
+        self.append((cycle, fg_bd_ep.BurstDescriptor(bd)))
+
 def dut_fg_burst_gen(clk,
                      rst,
                      current_test,
@@ -113,10 +119,11 @@ def bench():
     active_flows = Signal(intbv(0)[5:])
 
     # sources and sinks
-    source_queue = Queue()
+    source_queue = SimFifo()
     source_pause = Signal(bool(0))
-    sink_queue = Queue()
+    sink_queue = SimFifo()
     sink_pause = Signal(bool(0))
+    sink_log = BurstLog()
 
     source = fg_fd_ep.FlowDescriptorSource(clk,
                                            rst,
@@ -139,7 +146,8 @@ def bench():
                                         burst_len=output_bd_burst_len,
                                         fifo=sink_queue,
                                         pause=sink_pause,
-                                        name='sink')
+                                        name='sink',
+                                        recorder=sink_log)
 
     # DUT
     dut = dut_fg_burst_gen(clk,
@@ -179,6 +187,54 @@ def bench():
     #         sink_pause.next = False
     #         yield clk.posedge
 
+    # reference model run in lock step with the DUT, its state carries
+    # over between tests like the DUT state
+    model = fg_burst_gen_model.FgBurstGenModel(FLOW_ADDR_WIDTH, DEST_WIDTH, RATE_SCALE)
+    model_log = BurstLog()
+
+    @instance
+    def model_logic():
+        cycle = 0
+        checking = False
+
+        while True:
+            yield clk.posedge, rst.posedge
+
+            if rst:
+                model.reset()
+                checking = True
+            else:
+                # cycle count as kept by the sink
+                cycle += 1
+                if checking:
+                    fd = fg_fd_ep.FlowDescriptor(int(input_fd_dest), int(input_fd_rate_num),
+                                                 int(input_fd_rate_denom), int(input_fd_len),
+                                                 int(input_fd_burst_len))
+                    taken, bd = model.step(bool(input_fd_valid), fd, bool(output_bd_ready))
+                    if bd is not None:
+                        model_log.write(fg_bd_ep.BurstDescriptor(*bd), cycle)
+
+            if checking:
+                yield clk.negedge
+                assert input_fd_ready == model.input_fd_ready
+                assert output_bd_valid == model.output_bd_valid
+                if output_bd_valid:
+                    assert output_bd_dest == model.output_bd_dest
+                    assert output_bd_burst_len == model.output_bd_burst_len
+                assert busy == model.busy
+                assert active_flows == model.active_flows
+
+    def check_model():
+        # compare received burst descriptors and their cycles against the model
+        assert sink_log
+        assert sink_log == model_log
+        for cycle, bd in model_log:
+            rx_bd = sink_queue.get(False)
+            assert rx_bd == bd
+        assert sink_queue.empty()
+        del sink_log[:]
+        del model_log[:]
+
     @instance
     def check():
         yield delay(100)
@@ -210,6 +266,8 @@ def bench():
 
         yield delay(100)
 
+        check_model()
+
         yield clk.posedge
         print("test 2: long flow")
         current_test.next = 2
@@ -230,6 +288,8 @@ def bench():
 
         yield delay(100)
 
+        check_model()
+
         yield clk.posedge
         print("test 3: two flows")
         current_test.next = 3
@@ -258,9 +318,11 @@ def bench():
 
         yield delay(100)
 
+        check_model()
+
         raise StopSimulation
 
-    return dut, source, sink, clkgen, check
+    return dut, source, sink, clkgen, model_logic, check
 
 def test_bench():
     sim = Simulation(bench())
@@ -0,0 +1,119 @@
+#!/usr/bin/env python2
+"""
+
+Copyright (c) 2015 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+import fg_fd_ep
+import fg_burst_gen_model
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def test_event_model():
+    print("test 1: event model against cycle model")
+
+    # burst_len*rate_denom is at least the rate step, so no flow underflows
+    fds = [fg_fd_ep.FlowDescriptor(1, 1, 300, 1000, 100),
+           fg_fd_ep.FlowDescriptor(2, 2, 40, 3000, 100),
+           fg_fd_ep.FlowDescriptor(3, 0xffff, 1, 64, 64),
+           fg_fd_ep.FlowDescriptor(4, 2, 7, 0, 16)]
+
+    for flow_addr_width in (1, 2, 5):
+        model = fg_burst_gen_model.FgBurstGenModel(flow_addr_width)
+        event_model = fg_burst_gen_model.FgBurstGenEventModel(flow_addr_width)
+        assert event_model.run(fds) == model.run(fds)
+
+    if np is None:
+        return
+
+    print("test 2: random flows, more flows than slots")
+
+    for seed in range(4):
+        fds = list(fg_fd_ep.FlowDescriptorBatch.random(40, dest=(0, 255), rate_num=(1, 4),
+            rate_denom=(20, 50), len=(1, 20000), burst_len=(64, 1500), seed=seed))
+
+        model = fg_burst_gen_model.FgBurstGenModel(3)
+        event_model = fg_burst_gen_model.FgBurstGenEventModel(3)
+        assert event_model.run(fds) == model.run(fds)
+
+    print("test 3: stalled flow")
+
+    fds = [fg_fd_ep.FlowDescriptor(1, 0, 1, 100, 10),
+           fg_fd_ep.FlowDescriptor(2, 1, 4, 1000, 100)]
+
+    model = fg_burst_gen_model.FgBurstGenModel(2)
+    event_model = fg_burst_gen_model.FgBurstGenEventModel(2)
+    assert event_model.run(fds, 2000) == model.run(fds, 2000)
+    assert event_model.stalled == [0]
+
+def test_batch_sim():
+    if np is None:
+        return
+
+    print("test 4: batch simulation against event model")
+
+    sim = fg_burst_gen_model.FgBurstGenBatchSim.random(8, 8, rate_num=(0, 4), rate_denom=(20, 50),
+        len=(5000, 20000), burst_len=(64, 1500), flow_addr_width=(3, 5), rate_scale=8, seed=1)
+    res = sim.run()
+
+    assert res['stalled'].any()
+
+    for i in range(sim.len.shape[0]):
+        fds = [fg_fd_ep.FlowDescriptor(0, sim.rate_num[i, j], sim.rate_denom[i, j], sim.len[i, j], sim.burst_len[i, j])
+               for j in range(sim.len.shape[1])]
+        event_model = fg_burst_gen_model.FgBurstGenEventModel(int(sim.flow_addr_width[i]), rate_scale=int(sim.rate_scale[i]))
+        timing = event_model.flow_timing(fds)
+
+        for j, t in enumerate(timing):
+            assert res['load'][i, j] == t.load
+            assert res['stalled'][i, j] == (j in event_model.stalled)
+            if res['stalled'][i, j]:
+                assert res['completion'][i, j] == -1
+                assert res['bursts'][i, j] == 0
+            else:
+                assert res['first'][i, j] == t.first
+                assert res['completion'][i, j] == t.last
+                assert res['bursts'][i, j] == t.bursts
+
+    print("test 5: batch simulation against cycle model")
+
+    sim = fg_burst_gen_model.FgBurstGenBatchSim([[1, 2, 3, 4]], 40, [3000, 5000, 7000, 9000], [100, 200, 300, 400], 2)
+    res = sim.run()
+
+    fds = [fg_fd_ep.FlowDescriptor(j, j+1, 40, 1000*(2*j+3), 100*(j+1)) for j in range(4)]
+    model = fg_burst_gen_model.FgBurstGenModel(2)
+    out = model.run(fds)
+
+    for j in range(4):
+        cycles = [t for t, bd in out if bd.dest == j]
+        assert res['first'][0, j] == cycles[0]
+        assert res['completion'][0, j] == cycles[-1]
+        assert res['bursts'][0, j] == len(cycles)
+
+    assert res['row_completion'][0] == out[-1][0]
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_event_model()
+    test_batch_sim()
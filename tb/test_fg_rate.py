@@ -0,0 +1,152 @@
+#!/usr/bin/env python2
+"""
+
+Copyright (c) 2015 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+import fg_burst_gen_model
+import fg_fd_ep
+import fg_rate
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def test_best_rational():
+    if np is None:
+        return
+
+    print("test 1: best rational approximation")
+
+    rng = np.random.RandomState(1)
+
+    for max_num, max_denom in ((1, 1000), (3, 500), (10, 997), (100, 50), (0xffff, 0xffff)):
+        x = np.concatenate([rng.uniform(0, 2, 200), 10**rng.uniform(-6, 5, 200), [0, 1, 0.5, 1e9]])
+        num, denom = fg_rate.best_rational(x, max_num, max_denom)
+
+        assert (num >= 0).all() and (num <= max_num).all()
+        assert (denom >= 1).all() and (denom <= max_denom).all()
+
+        # brute force over every denominator
+        if max_denom <= 1000:
+            d = np.arange(1, max_denom+1)
+            for xi, n, dn in zip(x, num, denom):
+                best = np.abs(np.clip(np.rint(xi*d), 0, max_num)/d - xi).min()
+                assert abs(float(n)/dn - xi) <= best + 1e-12
+
+    num, denom = fg_rate.best_rational([1/3.0, 0.75, 2], 0xffff, 0xffff)
+    assert list(num) == [1, 3, 2]
+    assert list(denom) == [3, 4, 1]
+
+def test_compile():
+    if np is None:
+        return
+
+    print("test 2: compile flows")
+
+    clock = 156.25e6
+    rate = np.array([10e9, 2.5e9, 1e9/3, 1e3, 1e15])
+    batch, flags = fg_rate.compile_flows(np.arange(5), rate, length=10**6, clock=clock, rate_scale=8)
+
+    assert len(batch) == 5
+    assert list(flags) == [0, 0, 0, fg_rate.FLAG_RATE_CLAMPED,
+                           fg_rate.FLAG_RATE_CLAMPED | fg_rate.FLAG_UNDERFLOW]
+    err = fg_rate.flow_rate(batch, clock, 8)/rate - 1
+    assert (np.abs(err[:3]) < 1e-4).all()
+    # clamped flows still send
+    assert (batch.array['rate_num'] > 0).all()
+
+    print("test 3: split long flows")
+
+    batch, flags = fg_rate.compile_flows([3], ['40G'], length=[10*2**32], burst_len=1024, clock=clock)
+
+    assert len(batch) > 1
+    assert (batch.array['dest'] == 3).all()
+    assert batch.array['len'].astype(np.int64).sum() == 10*2**32
+    assert abs(fg_rate.flow_rate(batch, clock).sum()/40e9 - 1) < 1e-4
+
+    print("test 4: compile profile")
+
+    profile = {'clock': clock, 'rate_scale': 8, 'burst_len': 256, 'flows': [
+        {'dest': 1, 'rate': '10G', 'length': 100000},
+        {'dest': 2, 'rate': '2.5 Gbps', 'duration': 1e-4, 'count': 3}]}
+    batch, flags = fg_rate.compile_profile(profile)
+
+    assert list(batch.array['dest']) == [1, 2, 2, 2]
+    assert list(batch.array['len']) == [100000, 31250, 31250, 31250]
+    assert (batch.array['burst_len'] == 256).all()
+    assert not flags.any()
+
+    print("test 5: infeasible compiled flows")
+
+    # 40G is 32 bytes per cycle, one 1024 byte burst per 32 cycle scan
+    batch, flags = fg_rate.compile_flows([1, 2, 3], ['40G', '40G', 0], length=[10**5, 10**5, 1000],
+                                         burst_len=[1024, 512, 256], clock=clock)
+
+    assert list(flags) == [0, fg_rate.FLAG_UNDERFLOW, fg_rate.FLAG_STALL]
+    assert batch.array['rate_num'][2] == 0
+
+    batch, flags = fg_rate.compile_flows([1, 2], ['40G', '20G'], length=10**5, burst_len=1024,
+                                         clock=clock, flow_addr_width=6)
+
+    assert list(flags) == [fg_rate.FLAG_UNDERFLOW, 0]
+
+    profile['flow_addr_width'] = 8
+    profile['flows'].append({'dest': 3, 'rate': 0, 'length': 1000})
+    batch, flags = fg_rate.compile_profile(profile)
+
+    assert list(flags) == [fg_rate.FLAG_UNDERFLOW]*4 + [fg_rate.FLAG_STALL]
+
+def test_analyze():
+    if np is None:
+        return
+
+    print("test 6: analyze flows against model")
+
+    batch = fg_fd_ep.FlowDescriptorBatch.random(16, rate_num=(1, 6), rate_denom=(200, 2000),
+                                                len=(2000, 20000), burst_len=(64, 1500), seed=7)
+    res = fg_rate.analyze_flows(batch)
+
+    assert res['feasible']
+    assert not res['flags'].any()
+
+    # bursts reach the sink 2 cycles after they leave the slot
+    model = fg_burst_gen_model.FgBurstGenEventModel()
+    for i, t in enumerate(model.flow_timing(batch)):
+        assert t.last - t.load - 2 == res['duration'][i]
+        assert t.bursts == res['bursts'][i]
+
+    print("test 7: infeasible flows")
+
+    batch = fg_fd_ep.FlowDescriptorBatch.from_fields(rate_num=[0, 1, 1], rate_denom=[1, 1, 10],
+                                                      len=[100, 1000, 100], burst_len=[10, 10, 0])
+    res = fg_rate.analyze_flows(batch)
+
+    assert not res['feasible']
+    assert list(res['flags']) == [fg_rate.FLAG_STALL, fg_rate.FLAG_UNDERFLOW,
+                                  fg_rate.FLAG_UNDERFLOW | fg_rate.FLAG_NO_PROGRESS]
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_best_rational()
+    test_compile()
+    test_analyze()
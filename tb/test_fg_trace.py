@@ -0,0 +1,245 @@
+#!/usr/bin/env python2
+"""
+
+Copyright (c) 2015 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+from myhdl import *
+from simfifo import SimFifo
+import os
+import tempfile
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import fg_fd_ep
+import fg_bd_ep
+import fg_trace
+
+test_fds = [fg_fd_ep.FlowDescriptor(k, k+1, 100+k, 1000*k+64, 64+k) for k in range(20)]
+
+def test_round_trip():
+    print("test 1: flow trace round trip")
+
+    fd, name = tempfile.mkstemp(suffix='.fgtr')
+    os.close(fd)
+
+    try:
+        # buffer of 3 records to exercise the flushes
+        with fg_trace.TraceWriter(name, fg_trace.TRACE_FLOW, buffer_size=3*fg_trace.flow_rec_cycle_struct.size) as writer:
+            for k, d in enumerate(test_fds):
+                writer.write(d, 10*k)
+            assert writer.count == len(test_fds)
+
+        with fg_trace.TraceReader(name) as reader:
+            assert len(reader) == len(test_fds)
+            assert reader.kind == fg_trace.TRACE_FLOW
+            assert reader.cycles
+
+            for k, d in enumerate(test_fds):
+                assert reader.record(k) == (10*k, d)
+                assert reader[k] == d
+
+            assert reader[-1] == test_fds[-1]
+            try:
+                reader[len(test_fds)]
+                assert False
+            except IndexError:
+                pass
+
+            assert list(reader) == test_fds
+            assert list(reader.descriptors(5, 8)) == test_fds[5:8]
+
+            if np is not None:
+                cycles, batch = reader.batch(5, 8)
+                assert list(cycles) == [50, 60, 70]
+                assert list(batch) == test_fds[5:8]
+                assert batch.array.dtype == fg_fd_ep.FlowDescriptorBatch.dtype(8)
+
+                cycles, batch = reader.batch(18, 30)
+                assert list(batch) == test_fds[18:]
+                assert len(reader.batch(20)[1]) == 0
+
+                # batches of 2 over records 15 to 19
+                replay = reader.replay(15, batch_size=2)
+                assert replay.qsize() == 3
+                batches = [replay.get() for k in range(3)]
+                assert [len(b) for b in batches] == [2, 2, 1]
+                assert [d for b in batches for d in b] == test_fds[15:]
+                assert replay.empty()
+
+                # dest must fit dest_width
+                try:
+                    reader.batch(dest_width=4)
+                    assert False
+                except Exception:
+                    pass
+
+        print("test 2: burst trace without cycles")
+
+        test_bds = [fg_bd_ep.BurstDescriptor(k, 64*k) for k in range(10)]
+
+        with fg_trace.TraceWriter(name, fg_trace.TRACE_BURST, cycles=False) as writer:
+            for d in test_bds:
+                writer.send(d)
+
+        assert os.path.getsize(name) == fg_trace.trace_hdr_struct.size + len(test_bds)*fg_trace.burst_rec_struct.size
+
+        with fg_trace.TraceReader(name) as reader:
+            assert reader.kind == fg_trace.TRACE_BURST
+            assert not reader.cycles
+            assert reader.record(3) == (None, test_bds[3])
+            assert list(reader) == test_bds
+
+            if np is not None:
+                cycles, batch = reader.batch()
+                assert cycles is None
+                assert list(batch) == test_bds
+                assert list(reader.replay(batch_size=4).get()) == test_bds[:4]
+    finally:
+        os.remove(name)
+
+def bench(name, replay=False, batch_size=4096):
+
+    # Inputs
+    clk = Signal(bool(0))
+    # start in reset, the replay fifo is not empty before the reset pulse
+    rst = Signal(bool(1))
+    current_test = Signal(intbv(0)[8:])
+
+    fd_valid = Signal(bool(0))
+    fd_ready = Signal(bool(0))
+    fd_dest = Signal(intbv(0)[8:])
+    fd_rate_num = Signal(intbv(0)[16:])
+    fd_rate_denom = Signal(intbv(0)[16:])
+    fd_len = Signal(intbv(0)[32:])
+    fd_burst_len = Signal(intbv(0)[32:])
+
+    # sources and sinks
+    source_queue = SimFifo()
+    sink_queue = SimFifo()
+
+    if replay:
+        trace = fg_trace.TraceReader(name)
+        source_fifo = trace.replay(batch_size=batch_size)
+        writer = None
+    else:
+        trace = fg_trace.TraceWriter(name, fg_trace.TRACE_FLOW)
+        source_fifo = source_queue
+        writer = trace
+
+    source = fg_fd_ep.FlowDescriptorSource(clk,
+                                           rst,
+                                           valid=fd_valid,
+                                           ready=fd_ready,
+                                           dest=fd_dest,
+                                           rate_num=fd_rate_num,
+                                           rate_denom=fd_rate_denom,
+                                           len=fd_len,
+                                           burst_len=fd_burst_len,
+                                           fifo=source_fifo,
+                                           name='source')
+
+    sink = fg_fd_ep.FlowDescriptorSink(clk,
+                                       rst,
+                                       valid=fd_valid,
+                                       ready=fd_ready,
+                                       dest=fd_dest,
+                                       rate_num=fd_rate_num,
+                                       rate_denom=fd_rate_denom,
+                                       len=fd_len,
+                                       burst_len=fd_burst_len,
+                                       fifo=sink_queue,
+                                       name='sink',
+                                       recorder=writer)
+
+    @always(delay(4))
+    def clkgen():
+        clk.next = not clk
+
+    @instance
+    def check():
+        yield delay(100)
+        yield clk.posedge
+        rst.next = 1
+        yield clk.posedge
+        rst.next = 0
+        yield clk.posedge
+        yield delay(100)
+        yield clk.posedge
+
+        yield clk.posedge
+        if replay:
+            test = 4 if batch_size == 4096 else 5
+            print("test %d: replay trace, batches of %d" % (test, batch_size))
+            current_test.next = test
+        else:
+            print("test 3: record trace")
+            current_test.next = 3
+
+            for d in test_fds:
+                source_queue.put(d)
+
+        yield delay(1000)
+
+        for d in test_fds:
+            assert sink_queue.get(False) == d
+
+        assert sink_queue.empty()
+
+        trace.close()
+
+        if replay:
+            assert source_fifo.empty()
+        else:
+            with fg_trace.TraceReader(name) as reader:
+                assert list(reader) == test_fds
+                cycles = [reader.record(k)[0] for k in range(len(reader))]
+                assert all(a < b for a, b in zip(cycles, cycles[1:]))
+
+        yield delay(100)
+
+        raise StopSimulation
+
+    return source, sink, clkgen, check
+
+def test_bench():
+    fd, name = tempfile.mkstemp(suffix='.fgtr')
+    os.close(fd)
+
+    try:
+        sim = Simulation(bench(name))
+        sim.run()
+
+        sim = Simulation(bench(name, True))
+        sim.run()
+
+        sim = Simulation(bench(name, True, 3))
+        sim.run()
+    finally:
+        os.remove(name)
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_round_trip()
+    test_bench()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python2
+"""
+
+Copyright (c) 2015 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+import random
+
+import ip_ep
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def test_template():
+    print("test 1: template payload")
+
+    payload = bytearray(range(1, 11))
+    test_frame = ip_ep.IPFrame(payload,
+                               eth_dest_mac=0xDAD1D2D3D4D5,
+                               eth_src_mac=0x5A5152535455,
+                               eth_type=0x0800,
+                               ip_identification=1,
+                               ip_source_ip=0xc0a80164,
+                               ip_dest_ip=0xc0a80165)
+    template = ip_ep.IPFrameTemplate(test_frame)
+
+    for lens in ([10, 10], [4, 10, 14]):
+        for f, l in zip(template.build_batch(len(lens), payload_len=lens), lens):
+            assert bytearray(f.payload.data) == (payload + bytearray(4))[:l]
+            assert f.ip_length == l+20
+            assert f.ip_header_checksum == f.calc_checksum()
+
+    # supplied payloads are shared read-only and must cover payload_len
+    data = bytearray(range(20))
+    frames = template.build_batch(2, payload_len=[20, 5], payload=data)
+    assert bytearray(frames[0].payload.data) == data
+    assert bytearray(frames[1].payload.data) == data[:5]
+
+    try:
+        frames[0].payload.data[0] = b'\xff'
+    except TypeError:
+        pass
+    else:
+        assert False
+
+    for build in (template.build_batch, template.build_axis_batch, template.build_eth_batch):
+        try:
+            build(2, payload_len=[20, 21], payload=data)
+        except ValueError:
+            pass
+        else:
+            assert False
+
+    print("test 2: batch matches frame build")
+
+    ids = [5, 6, 7]
+    lens = [10, 3, 12]
+    axis_frames = template.build_axis_batch(3, ip_identification=ids, payload_len=lens)
+    eth_frames = template.build_eth_batch(3, ip_identification=ids, payload_len=lens)
+
+    for i in range(3):
+        frame = ip_ep.IPFrame(test_frame)
+        frame.payload = (payload + bytearray(4))[:lens[i]]
+        frame.ip_identification = ids[i]
+        frame.update_length()
+        frame.update_checksum()
+        assert bytearray(axis_frames[i].data) == bytearray(frame.build_axis().data)
+        assert bytearray(eth_frames[i].payload.data) == bytearray(frame.build_eth().payload.data)
+
+    if np is not None:
+        print("test 3: numpy fields")
+
+        frames = template.build_batch(2, ip_identification=np.uint16(9), ip_dest_ip=np.array([1, 2], dtype=np.uint32))
+        assert [f.ip_identification for f in frames] == [9, 9]
+        assert [f.ip_dest_ip for f in frames] == [1, 2]
+        assert all(f.ip_header_checksum == f.calc_checksum() for f in frames)
+
+def test_parse_no_copy():
+    print("test 4: parse without copy")
+
+    payload = bytearray(range(32))
+    test_frame = ip_ep.IPFrame(payload,
+                               eth_dest_mac=0xDAD1D2D3D4D5,
+                               eth_src_mac=0x5A5152535455,
+                               eth_type=0x0800,
+                               ip_source_ip=0xc0a80164,
+                               ip_dest_ip=0xc0a80165)
+    test_frame.update_length()
+    test_frame.update_checksum()
+    axis_frame = test_frame.build_axis()
+    data = bytearray(axis_frame.data)
+
+    frame1 = ip_ep.IPFrame()
+    frame1.parse_axis(axis_frame, copy=False)
+    frame2 = ip_ep.IPFrame()
+    frame2.parse_axis(axis_frame, copy=False)
+
+    assert frame1 == test_frame
+    assert frame2 == test_frame
+
+    # payload views can not be written through
+    try:
+        frame1.payload.data[0] = b'\xff'
+    except TypeError:
+        pass
+    else:
+        assert False
+
+    # replacing the payload copies it
+    frame1.payload = bytearray(frame1.payload.data)
+    frame1.payload.data[0] = 0xff
+
+    assert bytearray(frame2.payload.data) == payload
+    assert bytearray(axis_frame.data) == data
+
+def random_frame(rand):
+    frame = ip_ep.IPFrame(bytearray(rand.randrange(64)),
+                          ip_dscp=rand.randrange(64),
+                          ip_ecn=rand.randrange(4),
+                          ip_identification=rand.randrange(2**16),
+                          ip_flags=rand.randrange(8),
+                          ip_fragment_offset=rand.randrange(2**13),
+                          ip_ttl=rand.randrange(256),
+                          ip_protocol=rand.randrange(256),
+                          ip_source_ip=rand.randrange(2**32),
+                          ip_dest_ip=rand.randrange(2**32))
+    frame.build()
+    return frame
+
+def test_checksum_update():
+    print("test 5: incremental checksum update")
+
+    rand = random.Random(1)
+
+    for i in range(500):
+        frame = random_frame(rand)
+        assert frame.ip_header_checksum == frame.calc_checksum()
+
+        for k in range(4):
+            setter, value = rand.choice([('set_ip_length', rand.randrange(2**16)),
+                                         ('set_ip_identification', rand.randrange(2**16)),
+                                         ('set_ip_ttl', rand.randrange(256)),
+                                         ('set_ip_dest_ip', rand.randrange(2**32))])
+            getattr(frame, setter)(value)
+            assert frame.ip_header_checksum == frame.calc_checksum()
+
+    print("test 6: checksum update edge cases")
+
+    # identification that brings the header sum to 0xffff, checksum 0x0000
+    frame = ip_ep.IPFrame(bytearray(10), ip_identification=0, ip_source_ip=0x0a000001, ip_dest_ip=0x0a000002)
+    frame.build()
+    ident = frame.ip_header_checksum
+
+    frame.set_ip_identification(ident)
+    assert frame.calc_checksum() == 0x0000
+    assert frame.ip_header_checksum == 0x0000
+
+    frame.set_ip_ttl(frame.ip_ttl+1)
+    assert frame.ip_header_checksum == frame.calc_checksum()
+    frame.set_ip_ttl(frame.ip_ttl-1)
+    assert frame.ip_header_checksum == 0x0000
+
+    # 0x0000 and 0xffff are both zero in ones' complement
+    for old, new in ((0x0000, 0xffff), (0xffff, 0x0000)):
+        frame = ip_ep.IPFrame(bytearray(10), ip_identification=old)
+        frame.build()
+        cksum = frame.ip_header_checksum
+        frame.set_ip_identification(new)
+        assert frame.ip_header_checksum == frame.calc_checksum() == cksum
+
+    assert ip_ep.checksum_update(0x1234, 0x0000, 0x0000) == 0x1234
+    assert ip_ep.checksum_update(0x0000, 0x0001, 0x0000) == 0x0001
+    assert ip_ep.checksum_update(0x0001, 0x0000, 0x0001) == 0x0000
+
+def test_checksum_array():
+    if np is None:
+        return
+
+    print("test 7: array checksum")
+
+    rand = random.Random(2)
+    frames = [random_frame(rand) for i in range(200)]
+
+    # all zero header sums to 0, checksum 0xffff
+    frame = ip_ep.IPFrame(ip_version=0, ip_ihl=0, ip_length=0, ip_flags=0, ip_ttl=0, ip_protocol=0,
+                          ip_source_ip=0, ip_dest_ip=0)
+    frame.build()
+    frames.append(frame)
+
+    # header sum of 0xffff, checksum 0x0000
+    frame = ip_ep.IPFrame(bytearray(10), ip_identification=0, ip_source_ip=0x0a000001, ip_dest_ip=0x0a000002)
+    frame.build()
+    frame.ip_identification = frame.ip_header_checksum
+    frame.update_checksum()
+    frames.append(frame)
+
+    assert frames[-2].ip_header_checksum == 0xffff
+    assert frames[-1].ip_header_checksum == 0x0000
+
+    headers = bytearray(20*len(frames))
+    for k, f in enumerate(frames):
+        f.pack_header(headers, 20*k)
+
+    cksum = ip_ep.calc_checksum_array(headers)
+    assert [int(c) for c in cksum] == [f.calc_checksum() for f in frames]
+    assert ip_ep.check_checksum_array(headers).all()
+
+    a = np.frombuffer(bytes(headers), dtype=np.uint8)
+    assert (ip_ep.calc_checksum_array(a) == cksum).all()
+
+    # corrupted headers fail the check
+    headers[20*3+8] ^= 0x01
+    headers[20*7+11] ^= 0x80
+    check = ip_ep.check_checksum_array(headers)
+    assert list(np.flatnonzero(~check)) == [3, 7]
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_template()
+    test_parse_no_copy()
+    test_checksum_update()
+    test_checksum_array()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python2
+"""
+
+Copyright (c) 2015 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+from myhdl import *
+from simfifo import SimFifo
+import zlib
+
+import eth_ep
+import mac_ep
+
+def test_fcs():
+    print("test 1: FCS")
+
+    assert mac_ep.calc_fcs(b'123456789') == 0xcbf43926
+
+    test_frame = mac_ep.MACFrame(eth_ep.EthFrame(bytearray(range(32)), 0xDAD1D2D3D4D5, 0x5A5152535455, 0x8000))
+    data = test_frame.build()
+
+    assert len(data) == 8+60+4
+    assert data[:8] == mac_ep.ETH_PREAMBLE
+    assert test_frame.check_fcs()
+
+    # CRC over frame and FCS leaves the fixed residue
+    assert zlib.crc32(bytes(data[8:])) & 0xffffffff == 0x2144df1c
+
+    print("test 2: parse")
+
+    rx_frame = mac_ep.MACFrame()
+    rx_frame.parse(data)
+    assert rx_frame == test_frame
+    assert rx_frame.check_fcs()
+    assert not rx_frame.error
+    assert rx_frame.build_eth().eth_type == 0x8000
+
+    data[20] ^= 0x01
+    rx_frame.parse(data)
+    assert not rx_frame.check_fcs()
+    assert rx_frame.error
+
+    rx_frame.parse(b'\x55\x55\x12\x34')
+    assert rx_frame.error
+
+    data[20] ^= 0x01
+    rx_frame.parse(data)
+    assert not rx_frame.error
+
+def bench(xgmii=False, lanes=8):
+
+    # Inputs
+    clk = Signal(bool(0))
+    rst = Signal(bool(0))
+    current_test = Signal(intbv(0)[8:])
+
+    if xgmii:
+        txd = Signal(intbv(int('07'*lanes, 16))[lanes*8:])
+        txc = Signal(intbv(2**lanes-1)[lanes:])
+    else:
+        txd = Signal(intbv(0)[8:])
+        tx_en = Signal(bool(0))
+        tx_er = Signal(bool(0))
+
+    # sources and sinks
+    source_queue = SimFifo()
+    sink_queue = SimFifo()
+
+    if xgmii:
+        source = mac_ep.XGMIISource(clk, rst, txd=txd, txc=txc, fifo=source_queue, name='source')
+        sink = mac_ep.XGMIISink(clk, rst, rxd=txd, rxc=txc, fifo=sink_queue, name='sink')
+    else:
+        source = mac_ep.GMIISource(clk, rst, txd=txd, tx_en=tx_en, tx_er=tx_er, fifo=source_queue, name='source')
+        sink = mac_ep.GMIISink(clk, rst, rxd=txd, rx_dv=tx_en, rx_er=tx_er, fifo=sink_queue, name='sink')
+
+    @always(delay(4))
+    def clkgen():
+        clk.next = not clk
+
+    @instance
+    def check():
+        yield delay(100)
+        yield clk.posedge
+        rst.next = 1
+        yield clk.posedge
+        rst.next = 0
+        yield clk.posedge
+        yield delay(100)
+        yield clk.posedge
+
+        yield clk.posedge
+        print("test 3: loopback, %s" % ('XGMII x%d' % lanes if xgmii else 'GMII'))
+        current_test.next = 3
+
+        test_frames = [eth_ep.EthFrame(bytearray(range(n)), 0xDAD1D2D3D4D5, 0x5A5152535455, 0x8000) for n in (1, 46, 47, 100, 33)]
+        bad_frame = mac_ep.MACFrame(bytearray(range(70)), fcs=0x12345678)
+
+        for f in test_frames:
+            source_queue.put(f)
+        source_queue.put(bad_frame)
+
+        yield delay(20000)
+
+        for f in test_frames:
+            data = f.build_axis().data
+            rx_frame = sink_queue.get(False)
+            assert rx_frame.data[:len(data)] == data
+            assert len(rx_frame.data) == max(60, len(data))
+            assert rx_frame.check_fcs()
+            assert not rx_frame.error
+
+        rx_frame = sink_queue.get(False)
+        assert rx_frame.data == bad_frame.data
+        assert rx_frame.fcs == bad_frame.fcs
+        assert not rx_frame.check_fcs()
+        assert rx_frame.error
+
+        assert sink_queue.empty()
+
+        yield delay(100)
+
+        raise StopSimulation
+
+    return source, sink, clkgen, check
+
+def test_bench():
+    sim = Simulation(bench())
+    sim.run()
+
+    sim = Simulation(bench(True, 8))
+    sim.run()
+
+    sim = Simulation(bench(True, 4))
+    sim.run()
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_fcs()
+    test_bench()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python2
+"""
+
+Copyright (c) 2015 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+from myhdl import *
+from simfifo import SimFifo
+import os
+import struct
+import tempfile
+
+import axis_ep
+import eth_ep
+import pcapfile
+
+def read_records(name):
+    # returns link type, snap length and (timestamp, data, original length)
+    # per record, parsed independently of the writer
+    with open(name, 'rb') as f:
+        data = bytearray(f.read())
+
+    records = []
+
+    if struct.unpack_from('<L', data, 0)[0] == pcapfile.PCAPNG_SHB:
+        assert struct.unpack_from('<L', data, 8)[0] == pcapfile.PCAPNG_BOM
+        p = 0
+        linktype = snaplen = None
+        while p < len(data):
+            t, l = struct.unpack_from('<LL', data, p)
+            assert struct.unpack_from('<L', data, p+l-4)[0] == l
+            if t == pcapfile.PCAPNG_IDB:
+                linktype, r, snaplen = struct.unpack_from('<HHL', data, p+8)
+                # if_tsresol of 10^-9 s
+                assert struct.unpack_from('<HHB', data, p+16) == (9, 1, 9)
+            elif t == pcapfile.PCAPNG_EPB:
+                iface, hi, lo, n, orig_len = struct.unpack_from('<LLLLL', data, p+8)
+                records.append(((hi << 32) | lo, data[p+28:p+28+n], orig_len))
+            p += l
+        return linktype, snaplen, records
+
+    magic, major, minor, zone, sigfigs, snaplen, linktype = pcapfile.pcap_hdr_struct.unpack_from(data, 0)
+    assert magic == pcapfile.PCAP_MAGIC_NS
+    assert (major, minor) == (2, 4)
+    p = pcapfile.pcap_hdr_struct.size
+    while p < len(data):
+        s, ns, n, orig_len = pcapfile.pcap_rec_struct.unpack_from(data, p)
+        p += pcapfile.pcap_rec_struct.size
+        records.append((s*1000000000 + ns, data[p:p+n], orig_len))
+        p += n
+    return linktype, snaplen, records
+
+def write_read(pcapng):
+    test_frames = [eth_ep.EthFrame(bytearray(k % 256 for k in range(l)),
+                                   0xDAD1D2D3D4D5, 0x5A5152535455, 0x8000) for l in (1, 46, 47, 100, 1500)]
+
+    fd, name = tempfile.mkstemp(suffix='.pcapng' if pcapng else '.pcap')
+    os.close(fd)
+
+    try:
+        # small buffer to exercise the flushes and snaplen to truncate
+        with pcapfile.PcapWriter(name, period=8, snaplen=1000, pcapng=pcapng, buffer_size=256) as writer:
+            for k, f in enumerate(test_frames):
+                f.payload.cycle = 3*k + 2**33*(k == 4)
+                writer.write_frame(f)
+            assert writer.count == len(test_frames)
+
+        linktype, snaplen, records = read_records(name)
+
+        assert linktype == pcapfile.LINKTYPE_ETHERNET
+        assert snaplen == 1000
+        assert len(records) == len(test_frames)
+
+        for f, (ts, data, orig_len) in zip(test_frames, records):
+            ref = f.build_axis().data
+            assert ts == 8*f.payload.cycle
+            assert orig_len == len(ref)
+            assert data == ref[:1000]
+    finally:
+        os.remove(name)
+
+def test_write():
+    print("test 1: pcap writer")
+    write_read(False)
+
+    print("test 2: pcapng writer")
+    write_read(True)
+
+def round_trip(pcapng):
+    test_frames = [eth_ep.EthFrame(bytearray(k % 256 for k in range(l)),
+                                   0xDAD1D2D3D4D5, 0x5A5152535455, 0x8000) for l in (1, 46, 47, 100, 1500)]
+
+    fd, name = tempfile.mkstemp(suffix='.pcapng' if pcapng else '.pcap')
+    os.close(fd)
+
+    try:
+        with pcapfile.PcapWriter(name, period=8, snaplen=1000, pcapng=pcapng) as writer:
+            for k, f in enumerate(test_frames):
+                f.payload.cycle = 3*k + 2**33*(k == 4)
+                writer.write_frame(f)
+
+        with pcapfile.PcapReader(name) as reader:
+            assert len(reader) == len(test_frames)
+            assert reader.linktype == pcapfile.LINKTYPE_ETHERNET
+            assert reader.snaplen == 1000
+
+            for k, f in enumerate(test_frames):
+                data = f.build_axis().data
+                ts, rec_data, orig_len = reader.record(k)
+                assert ts == 8*f.payload.cycle
+                assert orig_len == len(data)
+                assert bytearray(rec_data) == data[:1000]
+                assert bytearray(reader.data(k)) == data[:1000]
+
+            for f, rx_frame in zip(test_frames[:4], reader.frames(0, 4, eth_ep.EthFrame)):
+                assert rx_frame == f
+
+            assert len(list(reader.frames(2))) == 3
+    finally:
+        os.remove(name)
+
+def test_read():
+    if pcapfile.np is None:
+        return
+
+    print("test 3: pcap round trip")
+    round_trip(False)
+
+    print("test 4: pcapng round trip")
+    round_trip(True)
+
+def bench(name):
+
+    # Inputs
+    clk = Signal(bool(0))
+    rst = Signal(bool(0))
+    current_test = Signal(intbv(0)[8:])
+
+    tdata = Signal(intbv(0)[64:])
+    tkeep = Signal(intbv(0)[8:])
+    tvalid = Signal(bool(0))
+    tready = Signal(bool(0))
+    tlast = Signal(bool(0))
+    tuser = Signal(bool(0))
+
+    # sources and sinks
+    source_queue = SimFifo()
+    sink_queue = SimFifo()
+
+    writer = pcapfile.PcapWriter(name, period=8)
+
+    source = axis_ep.AXIStreamSource(clk,
+                                     rst,
+                                     tdata=tdata,
+                                     tkeep=tkeep,
+                                     tvalid=tvalid,
+                                     tready=tready,
+                                     tlast=tlast,
+                                     tuser=tuser,
+                                     fifo=source_queue,
+                                     name='source')
+
+    sink = axis_ep.AXIStreamSink(clk,
+                                 rst,
+                                 tdata=tdata,
+                                 tkeep=tkeep,
+                                 tvalid=tvalid,
+                                 tready=tready,
+                                 tlast=tlast,
+                                 tuser=tuser,
+                                 fifo=sink_queue,
+                                 name='sink',
+                                 callback=writer)
+
+    @always(delay(4))
+    def clkgen():
+        clk.next = not clk
+
+    @instance
+    def check():
+        yield delay(100)
+        yield clk.posedge
+        rst.next = 1
+        yield clk.posedge
+        rst.next = 0
+        yield clk.posedge
+        yield delay(100)
+        yield clk.posedge
+
+        yield clk.posedge
+        print("test 5: sink capture")
+        current_test.next = 5
+
+        test_frames = [axis_ep.AXIStreamFrame(bytearray(range(n))) for n in (1, 8, 9, 64, 200)]
+
+        for f in test_frames:
+            source_queue.put(f)
+
+        yield delay(2000)
+
+        writer.close()
+
+        rx_frames = []
+        while not sink_queue.empty():
+            rx_frames.append(sink_queue.get(False))
+        assert len(rx_frames) == len(test_frames)
+
+        linktype, snaplen, records = read_records(name)
+
+        assert len(records) == len(test_frames)
+        for f, rx_frame, (ts, data, orig_len) in zip(test_frames, rx_frames, records):
+            assert ts == 8*rx_frame.cycle
+            assert data == f.data
+            assert orig_len == len(f.data)
+
+        yield clk.posedge
+        print("test 6: replay capture")
+        current_test.next = 6
+
+        reader = pcapfile.PcapReader(name)
+
+        for f in reader.frames():
+            source_queue.put(f)
+
+        yield delay(2000)
+
+        for f in test_frames:
+            rx_frame = sink_queue.get(False)
+            assert rx_frame.data == f.data
+
+        assert sink_queue.empty()
+
+        reader.close()
+
+        yield delay(100)
+
+        raise StopSimulation
+
+    return source, sink, clkgen, check
+
+def test_bench():
+    if pcapfile.np is None:
+        return
+
+    fd, name = tempfile.mkstemp(suffix='.pcap')
+    os.close(fd)
+
+    try:
+        sim = Simulation(bench(name))
+        sim.run()
+    finally:
+        os.remove(name)
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_write()
+    test_read()
+    test_bench()
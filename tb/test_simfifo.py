@@ -0,0 +1,234 @@
+#!/usr/bin/env python2
+"""
+
+Copyright (c) 2015 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+from myhdl import *
+from Queue import Queue, Empty, Full
+from simfifo import SimFifo
+
+import axis_ep
+import fg_fd_ep
+
+def test_fifo():
+    print("test 1: queue semantics")
+
+    fifo = SimFifo(maxsize=3)
+
+    assert fifo.empty()
+    assert not fifo.full()
+
+    try:
+        fifo.get(False)
+        assert False
+    except Empty:
+        pass
+
+    for k in range(3):
+        fifo.put(k)
+
+    assert fifo.full()
+    assert fifo.qsize() == len(fifo) == 3
+
+    try:
+        fifo.put_nowait(3)
+        assert False
+    except Full:
+        pass
+
+    assert fifo.get() == 0
+    fifo.put(3)
+    assert [fifo.get_nowait() for k in range(3)] == [1, 2, 3]
+    assert fifo.empty()
+    assert fifo.high_water == 3
+
+# (idle cycles, offset after the clock edge, number of puts)
+put_on_edge = [(3, 0, 1), (5, 0, 1), (1, 0, 1), (7, 0, 1), (0, 0, 1), (2, 0, 1)]
+put_between_edges = [(3, 2, 1), (5, 7, 1), (1, 1, 1), (0, 7, 1), (4, 4, 1)]
+put_bursts = [(2, 0, 3), (0, 0, 2), (4, 3, 4), (0, 7, 2), (1, 0, 5)]
+
+def bench(check_first=False):
+
+    # Parameters
+    period = 8
+
+    # Inputs
+    clk = Signal(bool(0))
+    rst = Signal(bool(0))
+    current_test = Signal(intbv(0)[8:])
+
+    ready = Signal(bool(1))
+    tready = Signal(bool(1))
+
+    # Outputs
+    wait_valid = Signal(bool(0))
+    poll_valid = Signal(bool(0))
+
+    wait_tdata = Signal(intbv(0)[64:])
+    wait_tkeep = Signal(intbv(0)[8:])
+    wait_tvalid = Signal(bool(0))
+    wait_tlast = Signal(bool(0))
+    poll_tdata = Signal(intbv(0)[64:])
+    poll_tkeep = Signal(intbv(0)[8:])
+    poll_tvalid = Signal(bool(0))
+    poll_tlast = Signal(bool(0))
+
+    # sources
+    wait_queue = SimFifo()
+    poll_queue = Queue()
+    wait_axis_queue = SimFifo()
+    poll_axis_queue = Queue()
+
+    wait_source = fg_fd_ep.FlowDescriptorSource(clk,
+                                                rst,
+                                                valid=wait_valid,
+                                                ready=ready,
+                                                fifo=wait_queue,
+                                                name='wait_source')
+
+    poll_source = fg_fd_ep.FlowDescriptorSource(clk,
+                                                rst,
+                                                valid=poll_valid,
+                                                ready=ready,
+                                                fifo=poll_queue,
+                                                name='poll_source')
+
+    wait_axis_source = axis_ep.AXIStreamSource(clk,
+                                               rst,
+                                               tdata=wait_tdata,
+                                               tkeep=wait_tkeep,
+                                               tvalid=wait_tvalid,
+                                               tready=tready,
+                                               tlast=wait_tlast,
+                                               fifo=wait_axis_queue,
+                                               name='wait_axis_source')
+
+    poll_axis_source = axis_ep.AXIStreamSource(clk,
+                                               rst,
+                                               tdata=poll_tdata,
+                                               tkeep=poll_tkeep,
+                                               tvalid=poll_tvalid,
+                                               tready=tready,
+                                               tlast=poll_tlast,
+                                               fifo=poll_axis_queue,
+                                               name='poll_axis_source')
+
+    wait_times = []
+    poll_times = []
+    wait_beats = []
+    poll_beats = []
+
+    @always(delay(period//2))
+    def clkgen():
+        clk.next = not clk
+
+    @always(clk.posedge)
+    def monitor():
+        if wait_valid:
+            wait_times.append(now())
+        if poll_valid:
+            poll_times.append(now())
+        if wait_tvalid:
+            wait_beats.append((now(), int(wait_tdata), bool(wait_tlast)))
+        if poll_tvalid:
+            poll_beats.append((now(), int(poll_tdata), bool(poll_tlast)))
+
+    def run(puts):
+        k = 0
+        for idle, offset, count in puts:
+            for i in range(idle):
+                yield clk.posedge
+            if offset:
+                yield delay(offset)
+            for i in range(count):
+                fd = fg_fd_ep.FlowDescriptor(k & 0xff, 1, 2, 100, 10)
+                wait_queue.put(fd)
+                poll_queue.put(fd)
+                frame = bytearray((k+j) & 0xff for j in range(1+k % 12))
+                wait_axis_queue.put(frame)
+                poll_axis_queue.put(frame)
+                k += 1
+            yield clk.posedge
+
+        for i in range(40):
+            yield clk.posedge
+
+        assert wait_times
+        assert wait_times == poll_times
+        assert wait_beats
+        assert wait_beats == poll_beats
+
+        del wait_times[:]
+        del poll_times[:]
+        del wait_beats[:]
+        del poll_beats[:]
+
+    @instance
+    def check():
+        yield delay(period*5//2)
+        yield clk.posedge
+        rst.next = 1
+        yield clk.posedge
+        rst.next = 0
+        yield clk.posedge
+        yield delay(period*5)
+        yield clk.posedge
+
+        yield clk.posedge
+        print("test 2: put on clock edge")
+        current_test.next = 2
+
+        yield run(put_on_edge)
+
+        yield clk.posedge
+        print("test 3: put between clock edges")
+        current_test.next = 3
+
+        yield run(put_between_edges)
+
+        yield clk.posedge
+        print("test 4: bursts of puts")
+        current_test.next = 4
+
+        yield run(put_bursts)
+
+        yield delay(100)
+
+        raise StopSimulation
+
+    # the order the generators run in on a clock edge decides whether a put
+    # made on that edge is seen on it
+    if check_first:
+        return check, wait_source, poll_source, wait_axis_source, poll_axis_source, clkgen, monitor
+    return wait_source, poll_source, wait_axis_source, poll_axis_source, clkgen, monitor, check
+
+def test_bench():
+    sim = Simulation(bench())
+    sim.run()
+
+    sim = Simulation(bench(True))
+    sim.run()
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_fifo()
+    test_bench()
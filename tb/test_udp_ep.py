@@ -0,0 +1,186 @@
+#!/usr/bin/env python2
+"""
+
+Copyright (c) 2015 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+from myhdl import *
+from simfifo import SimFifo
+
+import udp_ep
+
+def test_checksum():
+    print("test 1: UDP checksum")
+
+    # 192.168.0.31:20 to 192.168.0.30:10 carrying "Hi"
+    test_frame = udp_ep.UDPFrame(bytearray(b'Hi'),
+                                 ip_source_ip=0xc0a8001f,
+                                 ip_dest_ip=0xc0a8001e,
+                                 udp_source_port=20,
+                                 udp_dest_port=10)
+    test_frame.build()
+
+    assert test_frame.udp_length == 10
+    assert test_frame.udp_checksum == 0x35c5
+    assert test_frame.check_udp_checksum()
+
+    # odd length payload is padded with a zero byte
+    test_frame = udp_ep.UDPFrame(bytearray(b'abc'), udp_source_port=1, udp_dest_port=2,
+                                 ip_source_ip=0x0a000001, ip_dest_ip=0x0a000002)
+    test_frame.build()
+    assert test_frame.udp_checksum == 0x2770
+
+    print("test 2: build and parse")
+
+    test_frame = udp_ep.UDPFrame(bytearray(range(33)),
+                                 eth_dest_mac=0xDAD1D2D3D4D5,
+                                 eth_src_mac=0x5A5152535455,
+                                 eth_type=0x0800,
+                                 udp_source_port=1234,
+                                 udp_dest_port=5678)
+    test_frame.build()
+
+    for copy in (True, False):
+        rx_frame = udp_ep.UDPFrame()
+        rx_frame.parse_axis(test_frame.build_axis(), copy)
+        assert rx_frame == test_frame
+        assert rx_frame.check_udp_checksum()
+
+    data = test_frame.build_axis().data
+    data[-1] ^= 0xff
+    rx_frame = udp_ep.UDPFrame()
+    rx_frame.parse_axis(data)
+    assert not rx_frame.check_udp_checksum()
+
+def bench():
+
+    # Inputs
+    clk = Signal(bool(0))
+    rst = Signal(bool(0))
+    current_test = Signal(intbv(0)[8:])
+
+    udp_hdr_valid = Signal(bool(0))
+    udp_hdr_ready = Signal(bool(0))
+    udp_payload_tdata = Signal(intbv(0)[8:])
+    udp_payload_tvalid = Signal(bool(0))
+    udp_payload_tready = Signal(bool(0))
+    udp_payload_tlast = Signal(bool(0))
+    udp_payload_tuser = Signal(bool(0))
+
+    hdr = dict(eth_dest_mac=Signal(intbv(0)[48:]),
+               eth_src_mac=Signal(intbv(0)[48:]),
+               eth_type=Signal(intbv(0)[16:]),
+               ip_version=Signal(intbv(4)[4:]),
+               ip_ihl=Signal(intbv(5)[4:]),
+               ip_dscp=Signal(intbv(0)[6:]),
+               ip_ecn=Signal(intbv(0)[2:]),
+               ip_length=Signal(intbv(0)[16:]),
+               ip_identification=Signal(intbv(0)[16:]),
+               ip_flags=Signal(intbv(0)[3:]),
+               ip_fragment_offset=Signal(intbv(0)[13:]),
+               ip_ttl=Signal(intbv(0)[8:]),
+               ip_protocol=Signal(intbv(0)[8:]),
+               ip_header_checksum=Signal(intbv(0)[16:]),
+               ip_source_ip=Signal(intbv(0)[32:]),
+               ip_dest_ip=Signal(intbv(0)[32:]),
+               udp_source_port=Signal(intbv(0)[16:]),
+               udp_dest_port=Signal(intbv(0)[16:]),
+               udp_length=Signal(intbv(0)[16:]),
+               udp_checksum=Signal(intbv(0)[16:]))
+
+    # sources and sinks
+    source_queue = SimFifo()
+    sink_queue = SimFifo()
+
+    source = udp_ep.UDPFrameSource(clk,
+                                   rst,
+                                   udp_hdr_valid=udp_hdr_valid,
+                                   udp_hdr_ready=udp_hdr_ready,
+                                   udp_payload_tdata=udp_payload_tdata,
+                                   udp_payload_tvalid=udp_payload_tvalid,
+                                   udp_payload_tready=udp_payload_tready,
+                                   udp_payload_tlast=udp_payload_tlast,
+                                   udp_payload_tuser=udp_payload_tuser,
+                                   fifo=source_queue,
+                                   name='source',
+                                   **hdr)
+
+    sink = udp_ep.UDPFrameSink(clk,
+                               rst,
+                               udp_hdr_valid=udp_hdr_valid,
+                               udp_hdr_ready=udp_hdr_ready,
+                               udp_payload_tdata=udp_payload_tdata,
+                               udp_payload_tvalid=udp_payload_tvalid,
+                               udp_payload_tready=udp_payload_tready,
+                               udp_payload_tlast=udp_payload_tlast,
+                               udp_payload_tuser=udp_payload_tuser,
+                               fifo=sink_queue,
+                               name='sink',
+                               **hdr)
+
+    @always(delay(4))
+    def clkgen():
+        clk.next = not clk
+
+    @instance
+    def check():
+        yield delay(100)
+        yield clk.posedge
+        rst.next = 1
+        yield clk.posedge
+        rst.next = 0
+        yield clk.posedge
+        yield delay(100)
+        yield clk.posedge
+
+        yield clk.posedge
+        print("test 3: loopback")
+        current_test.next = 3
+
+        test_frames = [udp_ep.UDPFrame(bytearray(range(n)), udp_dest_port=n) for n in (1, 10, 33)]
+
+        for f in test_frames:
+            source_queue.put(f)
+
+        yield delay(1000)
+
+        for f in test_frames:
+            f.build()
+            rx_frame = sink_queue.get(False)
+            assert rx_frame == f
+            assert rx_frame.check_udp_checksum()
+
+        assert sink_queue.empty()
+
+        yield delay(100)
+
+        raise StopSimulation
+
+    return source, sink, clkgen, check
+
+def test_bench():
+    sim = Simulation(bench())
+    sim.run()
+
+if __name__ == '__main__':
+    print("Running test...")
+    test_checksum()
+    test_bench()
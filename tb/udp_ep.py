@@ -0,0 +1,475 @@
+"""
+
+Copyright (c) 2015 Alex Forencich
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights
+to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+copies of the Software, and to permit persons to whom the Software is
+furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN
+THE SOFTWARE.
+
+"""
+from myhdl import *
+import axis_ep
+import eth_ep
+import ip_ep
+from simfifo import SimFifo, FifoWaiter
+import struct
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# source port, destination port, length, checksum
+udp_hdr_struct = struct.Struct('>HHHH')
+
+def ones_sum(data):
+    # 16 bit ones' complement sum over big endian words, odd length is zero padded
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        data = bytearray(data)
+    n = len(data) & ~1
+    if np is not None:
+        s = int(np.asarray(memoryview(data))[:n].view('>u2').sum(dtype=np.uint64))
+    else:
+        s = sum(struct.unpack_from('>%dH' % (n//2), data))
+    if len(data) & 1:
+        s += bytearray(data[n:])[0] << 8
+    while s >> 16:
+        s = (s & 0xffff) + (s >> 16)
+    return s
+
+class UDPFrame(ip_ep.IPFrame):
+    __slots__ = ('udp_source_port', 'udp_dest_port', 'udp_length', 'udp_checksum')
+
+    def __init__(self, payload=b'',
+                 eth_dest_mac=0,
+                 eth_src_mac=0,
+                 eth_type=0,
+                 ip_version=4,
+                 ip_ihl=5,
+                 ip_dscp=0,
+                 ip_ecn=0,
+                 ip_length=None,
+                 ip_identification=0,
+                 ip_flags=2,
+                 ip_fragment_offset=0,
+                 ip_ttl=64,
+                 ip_protocol=0x11,
+                 ip_header_checksum=None,
+                 ip_source_ip=0xc0a80164,
+                 ip_dest_ip=0xc0a80165,
+                 udp_source_port=1,
+                 udp_dest_port=2,
+                 udp_length=None,
+                 udp_checksum=None):
+
+        ip_ep.IPFrame.__init__(self, b'',
+                               eth_dest_mac, eth_src_mac, eth_type,
+                               ip_version, ip_ihl, ip_dscp, ip_ecn, ip_length,
+                               ip_identification, ip_flags, ip_fragment_offset,
+                               ip_ttl, ip_protocol, ip_header_checksum,
+                               ip_source_ip, ip_dest_ip)
+        self.udp_source_port = udp_source_port
+        self.udp_dest_port = udp_dest_port
+        self.udp_length = udp_length
+        self.udp_checksum = udp_checksum
+
+        if type(payload) is dict:
+            self.payload = axis_ep.AXIStreamFrame(payload['udp_payload'])
+            for k in ip_ep.ip_hdr_fields:
+                setattr(self, k, payload[k])
+            self.udp_source_port = payload['udp_source_port']
+            self.udp_dest_port = payload['udp_dest_port']
+            self.udp_length = payload['udp_length']
+            self.udp_checksum = payload['udp_checksum']
+        if type(payload) is bytes:
+            payload = bytearray(payload)
+        if type(payload) is bytearray or type(payload) is axis_ep.AXIStreamFrame:
+            self.payload = axis_ep.AXIStreamFrame(payload)
+        if type(payload) is ip_ep.IPFrame:
+            self.parse_ip(payload)
+        if type(payload) is UDPFrame:
+            self.payload = axis_ep.AXIStreamFrame(payload.payload)
+            for k in ip_ep.ip_hdr_fields:
+                setattr(self, k, getattr(payload, k))
+            self.udp_source_port = payload.udp_source_port
+            self.udp_dest_port = payload.udp_dest_port
+            self.udp_length = payload.udp_length
+            self.udp_checksum = payload.udp_checksum
+
+    def update_udp_length(self):
+        self.udp_length = len(self.payload.data) + 8
+
+    def update_length(self):
+        self.update_udp_length()
+        self.ip_length = self.udp_length + 20
+
+    def calc_udp_checksum(self):
+        # pseudo header
+        cksum = self.ip_source_ip & 0xffff
+        cksum += (self.ip_source_ip >> 16) & 0xffff
+        cksum += self.ip_dest_ip & 0xffff
+        cksum += (self.ip_dest_ip >> 16) & 0xffff
+        cksum += self.ip_protocol
+        cksum += self.udp_length
+        # UDP header and payload
+        cksum += self.udp_source_port
+        cksum += self.udp_dest_port
+        cksum += self.udp_length
+        cksum += ones_sum(self.payload.data)
+        cksum = (cksum & 0xffff) + (cksum >> 16)
+        cksum = (cksum & 0xffff) + (cksum >> 16)
+        cksum = ~cksum & 0xffff
+        # zero means no checksum, so it is sent as all ones
+        return cksum or 0xffff
+
+    def update_udp_checksum(self):
+        self.udp_checksum = self.calc_udp_checksum()
+
+    def check_udp_checksum(self):
+        return self.udp_checksum == 0 or self.udp_checksum == self.calc_udp_checksum()
+
+    def build(self):
+        if self.udp_length is None:
+            self.update_udp_length()
+        if self.ip_length is None:
+            self.ip_length = self.udp_length + 20
+        if self.ip_header_checksum is None:
+            self.update_checksum()
+        if self.udp_checksum is None:
+            self.update_udp_checksum()
+
+    def build_ip(self):
+        self.build()
+        data = bytearray(8+len(self.payload.data))
+        self.pack_udp_header(data, 0)
+        data[8:] = self.payload.data
+
+        frame = ip_ep.IPFrame()
+        for k in ip_ep.ip_hdr_fields:
+            setattr(frame, k, getattr(self, k))
+        frame.payload = data
+        return frame
+
+    def build_eth(self):
+        return self.build_ip().build_eth()
+
+    def build_axis(self):
+        self.build()
+        data = bytearray(42+len(self.payload.data))
+        eth_ep.pack_eth_header(data, 0, self.eth_dest_mac, self.eth_src_mac, self.eth_type)
+        self.pack_header(data, 14)
+        self.pack_udp_header(data, 34)
+        data[42:] = self.payload.data
+
+        frame = axis_ep.AXIStreamFrame()
+        frame.data = data
+        return frame
+
+    def pack_udp_header(self, buf, offset=0):
+        udp_hdr_struct.pack_into(buf, offset,
+            self.udp_source_port,
+            self.udp_dest_port,
+            self.udp_length,
+            self.udp_checksum)
+
+    def unpack_udp_header(self, buf, offset=0):
+        (self.udp_source_port, self.udp_dest_port,
+            self.udp_length, self.udp_checksum) = udp_hdr_struct.unpack_from(buf, offset)
+
+    def parse_ip(self, data, copy=True):
+        for k in ip_ep.ip_hdr_fields:
+            setattr(self, k, getattr(data, k))
+
+        self.unpack_udp_header(data.payload.data)
+
+        if copy:
+            self.payload = axis_ep.AXIStreamFrame(data.payload.data[8:])
+        else:
+            # payload is a read-only view of the received buffer
+            self._payload = data.payload.view(8)
+
+    def parse_eth(self, data, copy=True):
+        frame = ip_ep.IPFrame()
+        frame.parse_eth(data, copy)
+        self.parse_ip(frame, copy)
+
+    def parse_axis(self, data, copy=True):
+        frame = ip_ep.IPFrame()
+        frame.parse_axis(data, copy)
+        self.parse_ip(frame, copy)
+
+    def __eq__(self, other):
+        if type(other) is UDPFrame:
+            return (all(getattr(self, k) == getattr(other, k) for k in ip_ep.ip_hdr_fields) and
+                self.udp_source_port == other.udp_source_port and
+                self.udp_dest_port == other.udp_dest_port and
+                self.udp_length == other.udp_length and
+                self.udp_checksum == other.udp_checksum and
+                self.payload == other.payload)
+
+    def __repr__(self):
+        return (('UDPFrame(payload=%s, ' % repr(self.payload)) +
+                ('eth_dest_mac=0x%012x, ' % self.eth_dest_mac) +
+                ('eth_src_mac=0x%012x, ' % self.eth_src_mac) +
+                ('eth_type=0x%04x, ' % self.eth_type) +
+                ('ip_version=%d, ' % self.ip_version) +
+                ('ip_ihl=%d, ' % self.ip_ihl) +
+                ('ip_dscp=%d, ' % self.ip_dscp) +
+                ('ip_ecn=%d, ' % self.ip_ecn) +
+                ('ip_length=%d, ' % self.ip_length) +
+                ('ip_identification=%d, ' % self.ip_identification) +
+                ('ip_flags=%d, ' % self.ip_flags) +
+                ('ip_fragment_offset=%d, ' % self.ip_fragment_offset) +
+                ('ip_ttl=%d, ' % self.ip_ttl) +
+                ('ip_protocol=0x%02x, ' % self.ip_protocol) +
+                ('ip_header_checksum=%x, ' % self.ip_header_checksum) +
+                ('ip_source_ip=0x%08x, ' % self.ip_source_ip) +
+                ('ip_dest_ip=0x%08x, ' % self.ip_dest_ip) +
+                ('udp_source_port=%d, ' % self.udp_source_port) +
+                ('udp_dest_port=%d, ' % self.udp_dest_port) +
+                ('udp_length=%d, ' % self.udp_length) +
+                ('udp_checksum=%04x)' % self.udp_checksum))
+
+def UDPFrameSource(clk, rst,
+                   udp_hdr_valid=None,
+                   udp_hdr_ready=None,
+                   eth_dest_mac=Signal(intbv(0)[48:]),
+                   eth_src_mac=Signal(intbv(0)[48:]),
+                   eth_type=Signal(intbv(0)[16:]),
+                   ip_version=Signal(intbv(4)[4:]),
+                   ip_ihl=Signal(intbv(5)[4:]),
+                   ip_dscp=Signal(intbv(0)[6:]),
+                   ip_ecn=Signal(intbv(0)[2:]),
+                   ip_length=Signal(intbv(0)[16:]),
+                   ip_identification=Signal(intbv(0)[16:]),
+                   ip_flags=Signal(intbv(0)[3:]),
+                   ip_fragment_offset=Signal(intbv(0)[13:]),
+                   ip_ttl=Signal(intbv(0)[8:]),
+                   ip_protocol=Signal(intbv(0)[8:]),
+                   ip_header_checksum=Signal(intbv(0)[16:]),
+                   ip_source_ip=Signal(intbv(0)[32:]),
+                   ip_dest_ip=Signal(intbv(0)[32:]),
+                   udp_source_port=Signal(intbv(0)[16:]),
+                   udp_dest_port=Signal(intbv(0)[16:]),
+                   udp_length=Signal(intbv(0)[16:]),
+                   udp_checksum=Signal(intbv(0)[16:]),
+                   udp_payload_tdata=None,
+                   udp_payload_tkeep=Signal(bool(True)),
+                   udp_payload_tvalid=Signal(bool(False)),
+                   udp_payload_tready=Signal(bool(True)),
+                   udp_payload_tlast=Signal(bool(False)),
+                   udp_payload_tuser=Signal(bool(False)),
+                   fifo=None,
+                   pause=0,
+                   name=None):
+
+    udp_hdr_ready_int = Signal(bool(False))
+    udp_hdr_valid_int = Signal(bool(False))
+    udp_payload_pause = Signal(bool(False))
+
+    udp_payload_fifo = SimFifo()
+
+    udp_payload_source = axis_ep.AXIStreamSource(clk,
+                                                 rst,
+                                                 tdata=udp_payload_tdata,
+                                                 tkeep=udp_payload_tkeep,
+                                                 tvalid=udp_payload_tvalid,
+                                                 tready=udp_payload_tready,
+                                                 tlast=udp_payload_tlast,
+                                                 tuser=udp_payload_tuser,
+                                                 fifo=udp_payload_fifo,
+                                                 pause=udp_payload_pause)
+
+    @always_comb
+    def pause_logic():
+        udp_hdr_ready_int.next = udp_hdr_ready and not pause
+        udp_hdr_valid.next = udp_hdr_valid_int and not pause
+        udp_payload_pause.next = pause # or udp_hdr_valid_int
+
+    waiter = FifoWaiter(fifo, clk, rst)
+
+    @instance
+    def logic():
+        frame = dict()
+
+        while True:
+            yield waiter.next_edge()
+
+            if rst:
+                udp_hdr_valid_int.next = False
+            else:
+                valid_next = bool(udp_hdr_valid_int)
+                if udp_hdr_ready_int:
+                    udp_hdr_valid_int.next = False
+                    valid_next = False
+                if (udp_payload_tlast and udp_hdr_ready_int and udp_hdr_valid) or not udp_hdr_valid_int:
+                    if not fifo.empty():
+                        frame = fifo.get()
+                        frame = UDPFrame(frame)
+                        frame.build()
+                        eth_dest_mac.next = frame.eth_dest_mac
+                        eth_src_mac.next = frame.eth_src_mac
+                        eth_type.next = frame.eth_type
+                        ip_version.next = frame.ip_version
+                        ip_ihl.next = frame.ip_ihl
+                        ip_dscp.next = frame.ip_dscp
+                        ip_ecn.next = frame.ip_ecn
+                        ip_length.next = frame.ip_length
+                        ip_identification.next = frame.ip_identification
+                        ip_flags.next = frame.ip_flags
+                        ip_fragment_offset.next = frame.ip_fragment_offset
+                        ip_ttl.next = frame.ip_ttl
+                        ip_protocol.next = frame.ip_protocol
+                        ip_header_checksum.next = frame.ip_header_checksum
+                        ip_source_ip.next = frame.ip_source_ip
+                        ip_dest_ip.next = frame.ip_dest_ip
+                        udp_source_port.next = frame.udp_source_port
+                        udp_dest_port.next = frame.udp_dest_port
+                        udp_length.next = frame.udp_length
+                        udp_checksum.next = frame.udp_checksum
+                        udp_payload_fifo.put(frame.payload)
+
+                        if name is not None:
+                            print("[%s] Sending frame %s" % (name, repr(frame)))
+
+                        udp_hdr_valid_int.next = True
+                        valid_next = True
+
+                waiter.set_idle(not valid_next and fifo.empty())
+
+    return logic, pause_logic, udp_payload_source
+
+
+def UDPFrameSink(clk, rst,
+                 udp_hdr_valid=None,
+                 udp_hdr_ready=None,
+                 eth_dest_mac=Signal(intbv(0)[48:]),
+                 eth_src_mac=Signal(intbv(0)[48:]),
+                 eth_type=Signal(intbv(0)[16:]),
+                 ip_version=Signal(intbv(4)[4:]),
+                 ip_ihl=Signal(intbv(5)[4:]),
+                 ip_dscp=Signal(intbv(0)[6:]),
+                 ip_ecn=Signal(intbv(0)[2:]),
+                 ip_length=Signal(intbv(0)[16:]),
+                 ip_identification=Signal(intbv(0)[16:]),
+                 ip_flags=Signal(intbv(0)[3:]),
+                 ip_fragment_offset=Signal(intbv(0)[13:]),
+                 ip_ttl=Signal(intbv(0)[8:]),
+                 ip_protocol=Signal(intbv(0)[8:]),
+                 ip_header_checksum=Signal(intbv(0)[16:]),
+                 ip_source_ip=Signal(intbv(0)[32:]),
+                 ip_dest_ip=Signal(intbv(0)[32:]),
+                 udp_source_port=Signal(intbv(0)[16:]),
+                 udp_dest_port=Signal(intbv(0)[16:]),
+                 udp_length=Signal(intbv(0)[16:]),
+                 udp_checksum=Signal(intbv(0)[16:]),
+                 udp_payload_tdata=None,
+                 udp_payload_tkeep=Signal(bool(True)),
+                 udp_payload_tvalid=Signal(bool(True)),
+                 udp_payload_tready=Signal(bool(True)),
+                 udp_payload_tlast=Signal(bool(True)),
+                 udp_payload_tuser=Signal(bool(False)),
+                 fifo=None,
+                 pause=0,
+                 name=None,
+                 callback=None,
+                 summary=None):
+
+    udp_hdr_ready_int = Signal(bool(False))
+    udp_hdr_valid_int = Signal(bool(False))
+    udp_payload_pause = Signal(bool(False))
+
+    udp_payload_fifo = SimFifo()
+    udp_header_fifo = SimFifo()
+
+    udp_payload_sink = axis_ep.AXIStreamSink(clk,
+                                             rst,
+                                             tdata=udp_payload_tdata,
+                                             tkeep=udp_payload_tkeep,
+                                             tvalid=udp_payload_tvalid,
+                                             tready=udp_payload_tready,
+                                             tlast=udp_payload_tlast,
+                                             tuser=udp_payload_tuser,
+                                             fifo=udp_payload_fifo,
+                                             pause=udp_payload_pause,
+                                             summary=summary)
+
+    if hasattr(callback, 'send'):
+        # consumer coroutine
+        callback = callback.send
+
+    def put_frame(frame):
+        if callback is not None:
+            callback(frame)
+        if fifo is not None:
+            fifo.put(frame)
+
+    @always_comb
+    def pause_logic():
+        udp_hdr_ready.next = udp_hdr_ready_int and not pause
+        udp_hdr_valid_int.next = udp_hdr_valid and not pause
+        udp_payload_pause.next = pause # or udp_hdr_valid_int
+
+    @instance
+    def logic():
+        frame = UDPFrame()
+
+        while True:
+            yield clk.posedge, rst.posedge
+
+            if rst:
+                udp_hdr_ready_int.next = False
+                frame = UDPFrame()
+            else:
+                udp_hdr_ready_int.next = True
+
+                if udp_hdr_ready_int and udp_hdr_valid_int and summary is None:
+                    frame = UDPFrame()
+                    frame.eth_dest_mac = int(eth_dest_mac)
+                    frame.eth_src_mac = int(eth_src_mac)
+                    frame.eth_type = int(eth_type)
+                    frame.ip_version = int(ip_version)
+                    frame.ip_ihl = int(ip_ihl)
+                    frame.ip_dscp = int(ip_dscp)
+                    frame.ip_ecn = int(ip_ecn)
+                    frame.ip_length = int(ip_length)
+                    frame.ip_identification = int(ip_identification)
+                    frame.ip_flags = int(ip_flags)
+                    frame.ip_fragment_offset = int(ip_fragment_offset)
+                    frame.ip_ttl = int(ip_ttl)
+                    frame.ip_protocol = int(ip_protocol)
+                    frame.ip_header_checksum = int(ip_header_checksum)
+                    frame.ip_source_ip = int(ip_source_ip)
+                    frame.ip_dest_ip = int(ip_dest_ip)
+                    frame.udp_source_port = int(udp_source_port)
+                    frame.udp_dest_port = int(udp_dest_port)
+                    frame.udp_length = int(udp_length)
+                    frame.udp_checksum = int(udp_checksum)
+                    udp_header_fifo.put(frame)
+
+                if not udp_payload_fifo.empty() and not udp_header_fifo.empty():
+                    frame = udp_header_fifo.get()
+                    frame._payload = udp_payload_fifo.get()
+                    put_frame(frame)
+
+                    if name is not None:
+                        print("[%s] Got frame %s" % (name, repr(frame)))
+
+                    frame = dict()
+
+    return logic, pause_logic, udp_payload_sink
+